@@ -1,123 +1,213 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+from flask import Blueprint, Flask, current_app, make_response, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context
 import sqlite3
+import math
 import os
-import secrets
-from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.local import LocalProxy
 from datetime import datetime
-import hashlib
-import bcrypt
+import assets
+import auth
+import catalog_export
+import catalog_import
+import catalog_stats
+import catalog_versions
+import compression
+import db
+import facets
+import fts
+import health
+import images
+import imagestore
+import jobqueue
+import logconfig
+import logging
+import metrics
+import migrations
+import pagecache
+import sessions
+import shared
+import suggest
+from pagination import paginate, PAGE_SIZE
+from pagecache import cached_page, cached_page_by, bump_catalog_version, conditional_on_catalog
+from db import get_db
 
-app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_PERMANENT'] = True
+bp = Blueprint('main', __name__)
 
 # Configurazione cartelle
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
 DATABASE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-# Crea le cartelle se non esistono
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(DATABASE_FOLDER, exist_ok=True)
+log = logging.getLogger(__name__)
+# Varianti delle immagini e indice dei suggerimenti dell'applicazione corrente
+images_lookup = LocalProxy(lambda: current_app.extensions['image_variants'])
+suggest_index = LocalProxy(lambda: current_app.extensions['suggest_index'])
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Crea e configura l'applicazione. Importare il modulo non apre file né
+# database: cartelle, log, schema e lavori in background partono solo qui.
+def create_app(config=None):
+    app = Flask(__name__)
+    # Sessioni lato server condivise da tutti i processi ('sqlite' o 'memory')
+    app.config['SESSION_BACKEND'] = 'sqlite'
+    app.config['SESSION_PERMANENT'] = True
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    # CARTE_DATABASE permette di usare un altro file (ad esempio quello dei benchmark)
+    app.config['DATABASE'] = os.environ.get('CARTE_DATABASE', os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
+    # La chiave segreta deve essere la stessa per tutti i processi e restare
+    # uguale tra un riavvio e l'altro: CARTE_SECRET_KEY, oppure SECRET_KEY nel
+    # file indicato da CARTE_SETTINGS, oppure il file SECRET_KEY_FILE
+    app.config['SECRET_KEY'] = os.environ.get('CARTE_SECRET_KEY')
+    app.config['SECRET_KEY_FILE'] = None
+    app.config.from_envvar('CARTE_SETTINGS', silent=True)
+    if config:
+        app.config.update(config)
+
+    # Crea le cartelle se non esistono
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    database_folder = os.path.dirname(os.path.abspath(app.config['DATABASE']))
+    os.makedirs(database_folder, exist_ok=True)
+
+    if not app.config['SECRET_KEY']:
+        # Generata al primo avvio accanto al database
+        key_file = app.config['SECRET_KEY_FILE'] or os.path.join(database_folder, 'secret_key')
+        app.config['SECRET_KEY'] = sessions.load_secret_key(key_file)
+
+    # Log JSON scritti in background, con id della richiesta
+    logconfig.init_app(app)
+    # Pool di connessioni condiviso da tutte le rotte
+    db.init_app(app)
+    # Latenza per rotta, tempo SQL e render dei template su /metrics
+    metrics.init_app(app)
+    # Contatori condivisi tra i processi worker (versione del catalogo)
+    shared.init_app(app)
+    # Cache delle pagine pubbliche, invalidata dalle modifiche al catalogo
+    pagecache.init_app(app)
+    # Modifiche al catalogo fatte da altri processi (import_catalog.py), lette
+    # dal database prima di ogni richiesta
+    catalog_versions.init_app(app)
+    # Compressione gzip/brotli di pagine, JSON ed esportazioni; le pagine in
+    # cache tengono le versioni compresse
+    compression.init_app(app)
+    # Sessioni salvate nel database invece che nel cookie
+    sessions.init_app(app)
+    # Verifica delle password su un pool limitato, con limiti per IP e utente
+    auth.init_app(app)
+    # Varianti ridotte delle immagini disponibili nei template
+    images.init_app(app)
+    # Lavori in background (varianti delle immagini, rimozione dei file)
+    jobqueue.init_app(app)
+    # Cache a lungo termine per le immagini salvate per digest
+    imagestore.init_app(app)
+    # CSS e JavaScript con l'hash nel nome (python build_assets.py) e versioni
+    # compresse servite a chi le accetta
+    assets.init_app(app)
+    # Indice in memoria per i suggerimenti della barra di ricerca, caricato
+    # alla prima richiesta di suggerimenti
+    suggest.init_app(app)
+    # /ready per il bilanciatore; pronto dopo health.warmup()
+    health.init_app(app)
+
+    app.register_blueprint(bp)
+
+    # Crea o aggiorna lo schema; con il database già aggiornato è una sola query
+    init_db(app.config['DATABASE'])
+    # La tabella jobs esiste: si possono eseguire i lavori rimasti in coda
+    jobqueue.start(app)
+    return app
 
 # Funzione per verificare l'estensione del file
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Funzione per inizializzare il database
-def init_db():
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    cursor = conn.cursor()
-    
-    # Tabella utenti
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        verification_code TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Tabella categorie (espansioni)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS categories (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
-        description TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Tabella prodotti (carte)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        code TEXT UNIQUE NOT NULL,
-        price REAL NOT NULL,
-        image_path TEXT,
-        category_id INTEGER,
-        additional_info TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (category_id) REFERENCES categories (id)
-    )
-    ''')
-    
-    # Controlla se esiste già un utente admin, altrimenti crealo
-    cursor.execute("SELECT * FROM users WHERE username = 'admin'")
-    if not cursor.fetchone():
-        # Hash the password using bcrypt and store as bytes
-        hashed_password = bcrypt.hashpw('PolloSaltato99'.encode(), bcrypt.gensalt())
-        # Converti in stringa per evitare problemi di compatibilità con SQLite
-        hashed_password_str = hashed_password.decode('utf-8')
-        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", ('admin', hashed_password_str))
-        print("Utente admin creato con password: PolloSaltato99")
-    
-    conn.commit()
-    conn.close()
+# Funzione per inizializzare il database. L'utente admin non viene più
+# creato qui: si crea con "python init_db.py --create-admin".
+# Restituisce le versioni delle migrazioni applicate.
+def init_db(path):
+    conn = db.connect(path)
+    try:
+        if migrations.schema_is_current(conn):
+            return []
+        cursor = conn.cursor()
+
+        # Tabella utenti
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            verification_code TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+    
+        # Tabella categorie (espansioni)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+    
+        # Tabella prodotti (carte)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            code TEXT UNIQUE NOT NULL,
+            price REAL NOT NULL,
+            image_path TEXT,
+            category_id INTEGER,
+            additional_info TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+        ''')
 
-# Inizializza il database all'avvio dell'applicazione
-init_db()
+        # Indice full-text per la ricerca delle carte
+        fts.init_fts(cursor)
+
+        conn.commit()
+
+        # Applica le migrazioni dello schema non ancora eseguite
+        applied = migrations.run_migrations(conn)
+        if applied:
+            log.info("migrazioni applicate", extra={'versions': applied})
+        return applied
+    finally:
+        conn.close()
 
 # Middleware per verificare se l'utente è loggato
 def login_required(f):
     def decorated_function(*args, **kwargs):
-        print(f"Checking login requirement, session: {session}")
         if 'user_id' not in session:
+            log.info("accesso negato a una pagina riservata", extra={'endpoint': request.endpoint})
             flash('Devi effettuare il login per accedere a questa pagina', 'danger')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
 # Rotte per il frontend pubblico
-@app.route('/')
+@bp.route('/')
+@cached_page
 def index():
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
     # Ottieni tutte le categorie
     cursor.execute("SELECT * FROM categories ORDER BY name")
     categories = cursor.fetchall()
     
-    # Ottieni tutti i prodotti
-    cursor.execute("SELECT p.*, c.name as category_name FROM products p LEFT JOIN categories c ON p.category_id = c.id ORDER BY p.name")
-    products = cursor.fetchall()
+    # Ottieni una pagina di prodotti
+    page = paginate(cursor, "SELECT p.*, c.name as category_name FROM products p LEFT JOIN categories c ON p.category_id = c.id WHERE 1=1", [], 'p.name', 'name')
     
-    conn.close()
-    return render_template('index.html', categories=categories, products=products)
+    return render_template('index.html', categories=categories, products=page.items, page=page)
 
-@app.route('/category/<int:category_id>')
+@bp.route('/category/<int:category_id>')
+@cached_page
 def category(category_id):
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
     # Ottieni la categoria
@@ -125,108 +215,97 @@ def category(category_id):
     category = cursor.fetchone()
     
     if not category:
-        conn.close()
         flash('Categoria non trovata', 'danger')
-        return redirect(url_for('index'))
-    
-    # Ottieni i prodotti della categoria
-    cursor.execute("SELECT * FROM products WHERE category_id = ? ORDER BY name", (category_id,))
-    products = cursor.fetchall()
-    
-    conn.close()
-    return render_template('category.html', category=category, products=products)
-
-class SecureLogin:
-    def __init__(self):
-        self.stored_hashed_pin = "ae4d4c8c3da2a3a23c23f2a357deb8a99b11512b5226aa7bd2ea3a67d0402428"  
+        return redirect(url_for('main.index'))
     
-    def hash_pin(self, pin):
-        return hashlib.sha256(pin.encode()).hexdigest()
+    # Ottieni una pagina di prodotti della categoria
+    page = paginate(cursor, "SELECT p.* FROM products p WHERE p.category_id = ?", [category_id], 'p.name', 'name')
     
-    def login(self, input_pin):
-        if self.hash_pin(input_pin) == self.stored_hashed_pin:
-            print("Login riuscito!")
-            return True
-        else:
-            print("PIN errato. Accesso negato.")
-            return False
+    return render_template('category.html', category=category, products=page.items, page=page)
 
 # Rotte per l'autenticazione
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
-    # Debug: Check if already logged in
     if 'user_id' in session:
-        print(f"User already logged in: {session}")
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
         
     if request.method == 'POST':
-        input_pin = request.form['verification_code']
-        
-        print(f"Login attempt with PIN: {input_pin}")
-        
-        # Use SecureLogin class for PIN verification
-        login_system = SecureLogin()
-        if login_system.login(input_pin):
-            # Clear and set session
+        username = request.form.get('username', '').strip()
+        password = request.form.get('password', '')
+        authenticator = current_app.extensions['auth']
+
+        # Oltre il limite si risponde subito, senza database né bcrypt
+        if not authenticator.allow(request.remote_addr, username):
+            log.warning("login rifiutato: troppi tentativi", extra={'username': username, 'remote_addr': request.remote_addr})
+            flash('Troppi tentativi di accesso. Riprova tra qualche minuto.', 'danger')
+            response = make_response(render_template('login.html', username=username), 429)
+            response.headers['Retry-After'] = str(math.ceil(authenticator.retry_after(request.remote_addr, username)))
+            return response
+
+        cursor = get_db().cursor()
+        cursor.execute("SELECT id, username, password FROM users WHERE username = ?", (username,))
+        user = cursor.fetchone()
+        result = authenticator.verify(user['password'] if user else None, password)
+
+        if result == auth.OK:
+            # Clear and set session, con un nuovo id di sessione
             session.clear()
-            session['user_id'] = 1  # Assuming admin user_id is 1
-            session['username'] = 'admin'
-            
-            # Debug session after setting
-            print(f"Session after login: {session}")
+            session.regenerate()
+            session['user_id'] = user['id']
+            session['username'] = user['username']
+            log.info("login riuscito", extra={'user_id': user['id'], 'remote_addr': request.remote_addr})
             
             flash('Login effettuato con successo', 'success')
-            return redirect(url_for('admin_dashboard'))
+            return redirect(url_for('main.admin_dashboard'))
+        elif result == auth.BUSY:
+            log.warning("login rifiutato: verifiche in coda esaurite", extra={'remote_addr': request.remote_addr})
+            flash('Il server è occupato. Riprova tra qualche secondo.', 'warning')
+            return render_template('login.html', username=username), 503
         else:
-            flash('PIN errato. Accesso negato.', 'danger')
+            log.warning("login fallito: credenziali errate", extra={'username': username, 'remote_addr': request.remote_addr})
+            flash('Nome utente o password errati. Accesso negato.', 'danger')
+            return render_template('login.html', username=username)
     
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.clear()
+    # Il messaggio flash finisce in una sessione nuova: il vecchio id non vale più
+    session.regenerate()
     flash('Logout effettuato con successo', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 # Rotte per l'amministrazione
-@app.route('/admin')
+@bp.route('/admin')
 @login_required
 def admin_dashboard():
-    # Add a debug print to check session
-    print(f"Session data: {session}")
-    
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Ottieni il conteggio dei prodotti
-    cursor.execute("SELECT COUNT(*) as count FROM products")
-    product_count = cursor.fetchone()['count']
+    # Ottieni il conteggio dei prodotti dal riepilogo per espansione
+    product_count = catalog_stats.total_products(conn)
     
     # Ottieni il conteggio delle categorie
     cursor.execute("SELECT COUNT(*) as count FROM categories")
     category_count = cursor.fetchone()['count']
     
-    conn.close()
     # Pass the current year to the template
     return render_template('admin/dashboard.html', product_count=product_count, category_count=category_count, now=datetime.now())
 
 # Gestione prodotti
-@app.route('/admin/products')
+@bp.route('/admin/products')
 @login_required
 def admin_products():
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Ottieni tutti i prodotti con il nome della categoria
-    cursor.execute("SELECT p.*, c.name as category_name FROM products p LEFT JOIN categories c ON p.category_id = c.id ORDER BY p.name")
-    products = cursor.fetchall()
+    # Ottieni una pagina di prodotti con il nome della categoria
+    page = paginate(cursor, "SELECT p.*, c.name as category_name FROM products p LEFT JOIN categories c ON p.category_id = c.id WHERE 1=1", [], 'p.name', 'name')
     
-    conn.close()
-    return render_template('admin/products.html', products=products)
+    return render_template('admin/products.html', products=page.items, page=page)
 
-@app.route('/admin/products/add', methods=['GET', 'POST'])
+@bp.route('/admin/products/add', methods=['GET', 'POST'])
 @login_required
 def admin_add_product():
     if request.method == 'POST':
@@ -236,49 +315,51 @@ def admin_add_product():
         category_id = request.form['category_id'] if request.form['category_id'] else None
         additional_info = request.form['additional_info']
         
-        # Gestione dell'immagine
+        # Gestione dell'immagine: salvata per digest, le copie identiche sono condivise
         image_path = None
         if 'image' in request.files:
             file = request.files['image']
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Aggiungi timestamp al nome del file per evitare duplicati
-                filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                image_path = f"uploads/{filename}"
+                image_path, _ = imagestore.store_upload(current_app.static_folder, file)
         
-        conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
+        conn = get_db()
         cursor = conn.cursor()
         
         try:
             cursor.execute("""
-                INSERT INTO products (name, code, price, image_path, category_id, additional_info)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (name, code, price, image_path, category_id, additional_info))
+                INSERT INTO products (name, code, price, image_path, image_status, category_id, additional_info)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (name, code, price, image_path, 'pending' if image_path else None, category_id, additional_info))
+            # Miniatura, anteprima e versioni WebP vengono generate in background
+            if image_path:
+                imagestore.ensure_stored(current_app.static_folder, image_path, file)
+                imagestore.schedule_derivatives(conn, image_path)
             conn.commit()
+            jobqueue.wake()
+            bump_catalog_version()
+            suggest_index.add(cursor.lastrowid, name, code)
             flash('Prodotto aggiunto con successo', 'success')
-            return redirect(url_for('admin_products'))
+            return redirect(url_for('main.admin_products'))
         except sqlite3.IntegrityError:
+            conn.rollback()
+            # L'immagine appena salvata potrebbe non essere usata da nessuno
+            imagestore.schedule_release(conn, image_path)
+            conn.commit()
+            jobqueue.wake()
             flash('Errore: Il codice prodotto deve essere unico', 'danger')
-        finally:
-            conn.close()
     
     # Ottieni tutte le categorie per il form
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM categories ORDER BY name")
     categories = cursor.fetchall()
-    conn.close()
     
     return render_template('admin/add_product.html', categories=categories)
 
-@app.route('/admin/products/edit/<int:product_id>', methods=['GET', 'POST'])
+@bp.route('/admin/products/edit/<int:product_id>', methods=['GET', 'POST'])
 @login_required
 def admin_edit_product(product_id):
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
     # Ottieni il prodotto
@@ -286,9 +367,8 @@ def admin_edit_product(product_id):
     product = cursor.fetchone()
     
     if not product:
-        conn.close()
         flash('Prodotto non trovato', 'danger')
-        return redirect(url_for('admin_products'))
+        return redirect(url_for('main.admin_products'))
     
     if request.method == 'POST':
         name = request.form['name']
@@ -297,96 +377,131 @@ def admin_edit_product(product_id):
         category_id = request.form['category_id'] if request.form['category_id'] else None
         additional_info = request.form['additional_info']
         
-        # Gestione dell'immagine
+        # Gestione dell'immagine: salvata per digest, le copie identiche sono condivise
         image_path = product['image_path']
+        image_status = product['image_status']
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Aggiungi timestamp al nome del file per evitare duplicati
-                filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                
-                # Elimina la vecchia immagine se esiste
-                if product['image_path']:
-                    old_image_path = os.path.join(app.config['UPLOAD_FOLDER'], product['image_path'].split('/')[-1])
-                    if os.path.exists(old_image_path):
-                        os.remove(old_image_path)
-                
-                image_path = f"uploads/{filename}"
+                image_path, _ = imagestore.store_upload(current_app.static_folder, file)
+                image_status = 'pending'
         
         try:
             cursor.execute("""
                 UPDATE products
-                SET name = ?, code = ?, price = ?, image_path = ?, category_id = ?, additional_info = ?
+                SET name = ?, code = ?, price = ?, image_path = ?, image_status = ?, category_id = ?, additional_info = ?
                 WHERE id = ?
-            """, (name, code, price, image_path, category_id, additional_info, product_id))
+            """, (name, code, price, image_path, image_status, category_id, additional_info, product_id))
+            if image_path != product['image_path']:
+                # Varianti della nuova immagine e rilascio della vecchia in background
+                imagestore.ensure_stored(current_app.static_folder, image_path, file)
+                imagestore.schedule_derivatives(conn, image_path)
+                imagestore.schedule_release(conn, product['image_path'])
             conn.commit()
+            jobqueue.wake()
+            bump_catalog_version()
+            suggest_index.update(product_id, product['name'], product['code'], name, code)
             flash('Prodotto aggiornato con successo', 'success')
-            return redirect(url_for('admin_products'))
+            return redirect(url_for('main.admin_products'))
         except sqlite3.IntegrityError:
+            conn.rollback()
+            if image_path != product['image_path']:
+                imagestore.schedule_release(conn, image_path)
+                conn.commit()
+                jobqueue.wake()
             flash('Errore: Il codice prodotto deve essere unico', 'danger')
     
     # Ottieni tutte le categorie per il form
     cursor.execute("SELECT * FROM categories ORDER BY name")
     categories = cursor.fetchall()
     
-    conn.close()
     return render_template('admin/edit_product.html', product=product, categories=categories)
 
-@app.route('/admin/products/delete/<int:product_id>', methods=['POST'])
+@bp.route('/admin/products/delete/<int:product_id>', methods=['POST'])
 @login_required
 def admin_delete_product(product_id):
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Ottieni il prodotto per eliminare l'immagine associata
-    cursor.execute("SELECT image_path FROM products WHERE id = ?", (product_id,))
+    # Ottieni il prodotto per rilasciare l'immagine associata
+    cursor.execute("SELECT name, code, image_path FROM products WHERE id = ?", (product_id,))
     product = cursor.fetchone()
     
-    if product and product[0]:
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], product[0].split('/')[-1])
-        if os.path.exists(image_path):
-            os.remove(image_path)
-    
-    # Elimina il prodotto
+    # Elimina il prodotto; l'immagine viene eliminata in background
+    # solo se nessun'altra carta la usa
     cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
+    if product:
+        imagestore.schedule_release(conn, product['image_path'])
     conn.commit()
-    conn.close()
+    jobqueue.wake()
+    bump_catalog_version()
+    if product:
+        suggest_index.remove(product_id, product['name'], product['code'])
     
     flash('Prodotto eliminato con successo', 'success')
-    return redirect(url_for('admin_products'))
+    return redirect(url_for('main.admin_products'))
+
+# Importazione in blocco di carte da file CSV o NDJSON
+@bp.route('/admin/products/import', methods=['GET', 'POST'])
+@login_required
+def admin_import_products():
+    result = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        fmt = catalog_import.detect_format(file.filename) if file and file.filename else None
+        if not fmt:
+            flash('Errore: carica un file .csv, .ndjson o .jsonl', 'danger')
+        else:
+            result = catalog_import.import_catalog(get_db(), file.stream, fmt)
+            bump_catalog_version()
+            # Dopo un'importazione in blocco conviene ricostruire l'indice
+            suggest_index.load(get_db(), notify=True)
+            if result.failed:
+                flash(f'Importate {result.imported} carte, {result.failed} righe scartate', 'warning')
+            else:
+                flash(f'Importate {result.imported} carte', 'success')
+    
+    return render_template('admin/import_products.html', result=result)
+
+# Esportazione del catalogo in streaming, con gli stessi filtri della ricerca
+@bp.route('/admin/products/export.<fmt>')
+@login_required
+def admin_export_products(fmt):
+    if fmt not in catalog_export.FORMATS:
+        flash('Formato di esportazione non supportato', 'danger')
+        return redirect(url_for('main.admin_products'))
+    
+    sql_query, params, _ = build_search_query(request.args)
+    cursor = get_db().execute(sql_query + " ORDER BY p.id", params)
+    
+    filename = f"carte_{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    return Response(
+        stream_with_context(catalog_export.export_rows(cursor, fmt)),
+        content_type=catalog_export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
 
 # Gestione categorie
-@app.route('/admin/categories')
+@bp.route('/admin/categories')
 @login_required
 def admin_categories():
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Ottieni tutte le categorie con il conteggio dei prodotti
-    cursor.execute("""
-        SELECT c.*, COUNT(p.id) as product_count
-        FROM categories c
-        LEFT JOIN products p ON c.id = p.category_id
-        GROUP BY c.id
-        ORDER BY c.name
-    """)
+    # Ottieni tutte le categorie con il conteggio e i prezzi dei prodotti
+    cursor.execute(catalog_stats.CATEGORIES_SQL)
     categories = cursor.fetchall()
     
-    conn.close()
     return render_template('admin/categories.html', categories=categories)
 
-@app.route('/admin/categories/add', methods=['GET', 'POST'])
+@bp.route('/admin/categories/add', methods=['GET', 'POST'])
 @login_required
 def admin_add_category():
     if request.method == 'POST':
         name = request.form['name']
         description = request.form['description']
         
-        conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
+        conn = get_db()
         cursor = conn.cursor()
         
         try:
@@ -395,20 +510,18 @@ def admin_add_category():
                 VALUES (?, ?)
             """, (name, description))
             conn.commit()
+            bump_catalog_version()
             flash('Categoria aggiunta con successo', 'success')
-            return redirect(url_for('admin_categories'))
+            return redirect(url_for('main.admin_categories'))
         except sqlite3.IntegrityError:
             flash('Errore: Il nome della categoria deve essere unico', 'danger')
-        finally:
-            conn.close()
     
     return render_template('admin/add_category.html')
 
-@app.route('/admin/categories/edit/<int:category_id>', methods=['GET', 'POST'])
+@bp.route('/admin/categories/edit/<int:category_id>', methods=['GET', 'POST'])
 @login_required
 def admin_edit_category(category_id):
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
     # Ottieni la categoria
@@ -416,9 +529,8 @@ def admin_edit_category(category_id):
     category = cursor.fetchone()
     
     if not category:
-        conn.close()
         flash('Categoria non trovata', 'danger')
-        return redirect(url_for('admin_categories'))
+        return redirect(url_for('main.admin_categories'))
     
     if request.method == 'POST':
         name = request.form['name']
@@ -431,23 +543,22 @@ def admin_edit_category(category_id):
                 WHERE id = ?
             """, (name, description, category_id))
             conn.commit()
+            bump_catalog_version()
             flash('Categoria aggiornata con successo', 'success')
-            return redirect(url_for('admin_categories'))
+            return redirect(url_for('main.admin_categories'))
         except sqlite3.IntegrityError:
             flash('Errore: Il nome della categoria deve essere unico', 'danger')
     
-    conn.close()
     return render_template('admin/edit_category.html', category=category)
 
-@app.route('/admin/categories/delete/<int:category_id>', methods=['POST'])
+@bp.route('/admin/categories/delete/<int:category_id>', methods=['POST'])
 @login_required
 def admin_delete_category(category_id):
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
+    conn = get_db()
     cursor = conn.cursor()
     
     # Verifica se ci sono prodotti associati a questa categoria
-    cursor.execute("SELECT COUNT(*) FROM products WHERE category_id = ?", (category_id,))
-    count = cursor.fetchone()[0]
+    count = catalog_stats.category_product_count(conn, category_id)
     
     if count > 0:
         flash('Impossibile eliminare la categoria: ci sono prodotti associati', 'danger')
@@ -455,43 +566,117 @@ def admin_delete_category(category_id):
         # Elimina la categoria
         cursor.execute("DELETE FROM categories WHERE id = ?", (category_id,))
         conn.commit()
+        bump_catalog_version()
         flash('Categoria eliminata con successo', 'success')
     
-    conn.close()
-    return redirect(url_for('admin_categories'))
+    return redirect(url_for('main.admin_categories'))
 
 # API per ottenere l'immagine del prodotto
-@app.route('/api/product/image/<int:product_id>')
+@bp.route('/api/product/image/<int:product_id>')
 def get_product_image(product_id):
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute("SELECT image_path FROM products WHERE id = ?", (product_id,))
     product = cursor.fetchone()
-    conn.close()
     
     if product and product['image_path']:
         return jsonify({'image_path': product['image_path']})
     else:
         return jsonify({'error': 'Immagine non trovata'}), 404
 
+# Filtri della ricerca validati: (espressione MATCH, categoria, prezzo minimo,
+# prezzo massimo, limite escluso); None per ogni filtro assente o non valido.
+# Il limite escluso (price_below) arriva dai link delle fasce di prezzo delle
+# faccette, che valgono low <= prezzo < high; il prezzo massimo scelto
+# dall'utente resta incluso.
+def search_filters(args):
+    category_id = args.get('category_id', '')
+    min_price = args.get('min_price', '')
+    max_price = args.get('max_price', '')
+    price_below = args.get('price_below', '')
+    return (
+        fts.build_match_query(args.get('query', '')),
+        int(category_id) if category_id.isdigit() else None,
+        float(min_price) if min_price.replace('.', '', 1).isdigit() else None,
+        float(max_price) if max_price.replace('.', '', 1).isdigit() else None,
+        float(price_below) if price_below.replace('.', '', 1).isdigit() else None,
+    )
+
+# Costruisce la SELECT dei prodotti (senza ORDER BY) a partire dai filtri
+# della ricerca: testo, categoria, prezzo minimo e massimo.
+# Restituisce (sql, parametri, espressione MATCH o None).
+def build_search_query(args):
+    match_query, category_id, min_price, max_price, price_below = search_filters(args)
+    
+    params = []
+
+    # Aggiungi filtro per nome, codice o info aggiuntive tramite l'indice FTS5
+    if match_query:
+        sql_query = f"""
+            SELECT p.*, c.name as category_name, {fts.BM25_RANK} as score
+            FROM products_fts
+            JOIN products p ON p.id = products_fts.rowid
+            LEFT JOIN categories c ON p.category_id = c.id
+            WHERE products_fts MATCH ?
+        """
+        params.append(match_query)
+    else:
+        sql_query = """
+            SELECT p.*, c.name as category_name
+            FROM products p
+            LEFT JOIN categories c ON p.category_id = c.id
+            WHERE 1=1
+        """
+    
+    # Aggiungi filtro per categoria
+    if category_id is not None:
+        sql_query += " AND p.category_id = ?"
+        params.append(category_id)
+    
+    # Aggiungi filtro per prezzo minimo
+    if min_price is not None:
+        sql_query += " AND p.price >= ?"
+        params.append(min_price)
+    
+    # Aggiungi filtro per prezzo massimo
+    if max_price is not None:
+        sql_query += " AND p.price <= ?"
+        params.append(max_price)
+
+    # Limite superiore escluso di una fascia di prezzo (facets.PRICE_BUCKETS)
+    if price_below is not None:
+        sql_query += " AND p.price < ?"
+        params.append(price_below)
+    
+    return sql_query, params, match_query
+
+# Modalità di ordinamento della ricerca: (espressione SQL, colonna, discendente)
+SORT_MODES = {
+    'name': ('p.name', 'name', False),
+    'price_asc': ('p.price', 'price', False),
+    'price_desc': ('p.price', 'price', True),
+    'relevance': (fts.BM25_RANK, 'score', False),
+}
+
 # Route per la ricerca
-@app.route('/search')
+@bp.route('/search')
+@cached_page
 def search():
     query = request.args.get('query', '')
     min_price = request.args.get('min_price', '')
     max_price = request.args.get('max_price', '')
-    sort_by = request.args.get('sort_by', 'name')
+    price_below = request.args.get('price_below', '')
     category_id = request.args.get('category_id', '')
+    # Con un testo di ricerca l'ordinamento predefinito è per pertinenza
+    sort_by = request.args.get('sort_by', 'relevance' if fts.build_match_query(query) else 'name')
     
     # Permetti l'ordinamento anche senza filtri di ricerca
     # if not query and not min_price and not max_price and not category_id:
     #     flash('Inserisci un termine di ricerca o un filtro di prezzo', 'warning')
-    #     return redirect(url_for('index'))
+    #     return redirect(url_for('main.index'))
     
-    conn = sqlite3.connect(os.path.join(DATABASE_FOLDER, 'pokemon_cards.db'))
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
     # Ottieni tutte le categorie per il form di filtro
@@ -499,47 +684,166 @@ def search():
     categories = cursor.fetchall()
     
     # Costruisci la query SQL in base ai filtri
-    sql_query = """
-        SELECT p.*, c.name as category_name 
-        FROM products p 
-        LEFT JOIN categories c ON p.category_id = c.id 
-        WHERE 1=1
-    """
-    params = []
-    
-    # Aggiungi filtro per nome o codice
-    if query:
-        sql_query += " AND (p.name LIKE ? OR p.code LIKE ?)"
-        params.extend([f'%{query}%', f'%{query}%'])
-    
-    # Aggiungi filtro per categoria
-    if category_id and category_id.isdigit():
-        sql_query += " AND p.category_id = ?"
-        params.append(int(category_id))
+    sql_query, params, match_query = build_search_query(request.args)
     
-    # Aggiungi filtro per prezzo minimo
-    if min_price and min_price.replace('.', '', 1).isdigit():
-        sql_query += " AND p.price >= ?"
-        params.append(float(min_price))
+    # Aggiungi ordinamento e paginazione
+    if sort_by not in SORT_MODES or (sort_by == 'relevance' and not match_query):
+        sort_by = 'name'
+    sort_expr, sort_column, descending = SORT_MODES[sort_by]
+    page = paginate(cursor, sql_query, params, sort_expr, sort_column, descending)
     
-    # Aggiungi filtro per prezzo massimo
-    if max_price and max_price.replace('.', '', 1).isdigit():
-        sql_query += " AND p.price <= ?"
-        params.append(float(max_price))
+    # Conteggi per espansione e per fascia di prezzo, per restringere la ricerca
+    search_facets = facets.compute_facets(cursor, *search_filters(request.args))
     
-    # Aggiungi ordinamento
-    if sort_by == 'price_asc':
-        sql_query += " ORDER BY p.price ASC"
-    elif sort_by == 'price_desc':
-        sql_query += " ORDER BY p.price DESC"
-    else:
-        sql_query += " ORDER BY p.name"
-    
-    cursor.execute(sql_query, params)
-    products = cursor.fetchall()
-    conn.close()
+    return render_template('search_results.html', products=page.items, page=page, categories=categories, query=query, min_price=min_price, max_price=max_price, price_below=price_below, sort_by=sort_by, category_id=category_id, facets=search_facets)
+
+# URL della ricerca corrente con alcuni parametri cambiati (None li toglie);
+# si riparte sempre dalla prima pagina dei risultati
+@bp.app_template_global()
+def search_url(**changes):
+    args = {key: value for key, value in request.args.items() if key not in ('after', 'before')}
+    for key, value in changes.items():
+        if value is None:
+            args.pop(key, None)
+        else:
+            args[key] = value
+    return url_for('main.search', **args)
+
+# API JSON del catalogo: le risposte portano un ETag legato alla versione
+# del catalogo, così i client che interrogano spesso ricevono un 304
+
+# Numero massimo di carte per pagina nelle API
+API_MAX_LIMIT = 100
+
+# Rappresentazione JSON di una carta
+def product_to_dict(product):
+    image_url = None
+    variants = None
+    if product['image_path']:
+        image_url = url_for('static', filename=product['image_path'])
+        paths = images_lookup(product['image_path'])
+        if paths:
+            variants = {name: url_for('static', filename=path) for name, path in paths.items()}
+    return {
+        'id': product['id'],
+        'name': product['name'],
+        'code': product['code'],
+        'price': product['price'],
+        'category_id': product['category_id'],
+        'category_name': product['category_name'],
+        'additional_info': product['additional_info'],
+        'image_url': image_url,
+        'image_variants': variants,
+        'image_status': product['image_status'],
+    }
+
+@bp.route('/api/products')
+@conditional_on_catalog
+@cached_page
+def api_products():
+    sql_query, params, match_query = build_search_query(request.args)
+    
+    sort_by = request.args.get('sort_by', 'relevance' if match_query else 'name')
+    if sort_by not in SORT_MODES or (sort_by == 'relevance' and not match_query):
+        sort_by = 'name'
+    limit = request.args.get('limit', '')
+    limit = min(int(limit), API_MAX_LIMIT) if limit.isdigit() and int(limit) > 0 else PAGE_SIZE
+    
+    sort_expr, sort_column, descending = SORT_MODES[sort_by]
+    page = paginate(get_db().cursor(), sql_query, params, sort_expr, sort_column, descending, limit)
+    
+    return jsonify({
+        'items': [product_to_dict(product) for product in page.items],
+        'next': page.next_url,
+        'prev': page.prev_url,
+    })
+
+@bp.route('/api/products/<int:product_id>')
+@conditional_on_catalog
+@cached_page
+def api_product(product_id):
+    cursor = get_db().cursor()
+    cursor.execute("""
+        SELECT p.*, c.name as category_name
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.id = ?
+    """, (product_id,))
+    product = cursor.fetchone()
     
-    return render_template('search_results.html', products=products, categories=categories, query=query, min_price=min_price, max_price=max_price, sort_by=sort_by, category_id=category_id)
+    if not product:
+        return jsonify({'error': 'Prodotto non trovato'}), 404
+    return jsonify(product_to_dict(product))
+
+# Suggerimenti per la barra di ricerca: nomi e codici che iniziano con q.
+# Niente database e niente cache delle pagine: la risposta arriva dall'indice
+# in memoria. Il browser può riusarla per un minuto.
+@bp.route('/api/suggest')
+def api_suggest():
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', '')
+    limit = min(int(limit), suggest.TOP_K) if limit.isdigit() and int(limit) > 0 else suggest.TOP_K
+    suggest_index.ensure_loaded(get_db)
+    suggestions = suggest_index.suggest(query, limit)
+    for suggestion in suggestions:
+        suggestion['url'] = url_for('main.search', query=suggestion['label'])
+    response = jsonify({'query': query, 'suggestions': suggestions})
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+@bp.route('/api/categories')
+@conditional_on_catalog
+@cached_page
+def api_categories():
+    cursor = get_db().cursor()
+    cursor.execute("SELECT id, name, description FROM categories ORDER BY name")
+    return jsonify([dict(category) for category in cursor.fetchall()])
+
+# Numero massimo di id accettati da /api/products/images
+MAX_IMAGE_BATCH = 500
+# Id per singola query IN (...), ben sotto il limite di variabili di SQLite
+IMAGE_QUERY_CHUNK = 250
+
+# Id richiesti a /api/products/images, ordinati e senza duplicati: lo stesso
+# insieme di id produce sempre la stessa chiave di cache
+def requested_image_ids():
+    ids = set()
+    for value in request.args.get('ids', '').split(','):
+        value = value.strip()
+        if value.isdigit():
+            ids.add(int(value))
+    return tuple(sorted(ids))
+
+# Immagini di più carte con una sola richiesta: ?ids=1,2,3
+@bp.route('/api/products/images')
+@conditional_on_catalog
+@cached_page_by(requested_image_ids)
+def api_product_images():
+    ids = requested_image_ids()
+    if len(ids) > MAX_IMAGE_BATCH:
+        return jsonify({'error': f'Massimo {MAX_IMAGE_BATCH} carte per richiesta'}), 400
+    
+    cursor = get_db().cursor()
+    result = {}
+    for start in range(0, len(ids), IMAGE_QUERY_CHUNK):
+        chunk = ids[start:start + IMAGE_QUERY_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f"SELECT id, image_path FROM products WHERE id IN ({placeholders})", chunk)
+        for product_id, image_path in cursor.fetchall():
+            if not image_path:
+                result[product_id] = None
+                continue
+            urls = {'image': url_for('static', filename=image_path)}
+            paths = images_lookup(image_path)
+            if paths:
+                urls.update((name, url_for('static', filename=path)) for name, path in paths.items())
+            result[product_id] = urls
+    
+    return jsonify(result)
 
+# Server di sviluppo; in produzione si usa serve.py. Senza manifest gli
+# asset si servono dai file sorgente, senza build.
 if __name__ == '__main__':
+    app = create_app({'ASSET_MANIFEST': False})
+    health.warmup(app)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,207 @@
+# Asset statici con l'hash del contenuto nel nome (css/style.css ->
+# dist/css/style.1a2b3c4d5e.css) e versioni già compresse accanto (.gz e, se
+# il modulo brotli è installato, .br). build() genera i file e il manifest;
+# con il manifest caricato url_for('static', ...) restituisce l'URL con l'hash
+# e la risposta può restare in cache un anno.
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import tempfile
+
+from flask import current_app, request, send_from_directory
+
+import bundler
+from imagestore import IMMUTABLE_CACHE_CONTROL, is_content_addressed
+
+try:
+    import brotli
+except ImportError:
+    # Opzionale: senza il modulo si generano solo le versioni gzip
+    brotli = None
+
+# File (relativi a static/) pubblicati con l'hash nel nome; con le dipendenze
+# presenti in static/vendor/ si aggiungono i bundle di bundler.BUNDLES
+SOURCES = ('css/style.css', 'js/typeahead.js', 'js/image-modal.js')
+# Solo i file di testo hanno le versioni compresse (i font WOFF2 lo sono già)
+COMPRESSIBLE = ('.css', '.js', '.svg')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 10
+# Codifiche in ordine di preferenza: Content-Encoding -> suffisso del file
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+# Immagini caricate prima dell'archivio per digest: nome fisso, versione nell'URL
+UPLOADS_DIR = 'uploads/'
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+# Scrittura atomica: un worker che serve il file non lo vede mai a metà
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        # Leggibili anche da un eventuale proxy che serve static/ direttamente
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _compressed(data):
+    variants = {'gzip': gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+def read_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# Scrive data in dist/ con l'hash nel nome (e le versioni compresse) e
+# restituisce il percorso relativo a static/
+def _fingerprint(static_folder, name, data):
+    base, ext = posixpath.splitext(name)
+    target = f"{DIST_DIR}/{base}.{_digest(data)}{ext}"
+    path = os.path.join(static_folder, target)
+    if not os.path.exists(path):
+        _write(path, data)
+    if ext in COMPRESSIBLE:
+        for encoding, compressed in _compressed(data).items():
+            if not os.path.exists(path + ENCODINGS[encoding]):
+                _write(path + ENCODINGS[encoding], compressed)
+    return target
+
+
+# Bundle CSS e JavaScript dalle dipendenze in static/vendor/; i file
+# referenziati dal CSS (font) vengono pubblicati anch'essi con l'hash
+def _build_bundles(static_folder, template_folder, manifest):
+    names = bundler.used_names(template_folder, os.path.join(static_folder, 'js'))
+    for bundle, sources in bundler.BUNDLES.items():
+        if bundle.endswith('.css'):
+            css, resources = bundler.build_css(static_folder, sources, names)
+            bundle_dir = posixpath.dirname(f"{DIST_DIR}/{bundle}")
+            for path, data in resources.items():
+                manifest[path] = _fingerprint(static_folder, path, data)
+                css = css.replace(f'{{{{{path}}}}}', posixpath.relpath(manifest[path], bundle_dir))
+            data = css.encode()
+        else:
+            data = bundler.build_js(static_folder, sources).encode()
+        manifest[bundle] = _fingerprint(static_folder, bundle, data)
+
+
+# Genera i file con l'hash e il manifest. Restano i file della build
+# precedente, ancora usati dai worker in chiusura durante un reload e dalle
+# pagine già in cache nei browser; quelli più vecchi vengono eliminati.
+def build(static_folder, template_folder):
+    dist = os.path.join(static_folder, DIST_DIR)
+    previous = read_manifest(static_folder)
+    manifest = {}
+    for source in SOURCES:
+        with open(os.path.join(static_folder, source), 'rb') as f:
+            manifest[source] = _fingerprint(static_folder, source, f.read())
+    if bundler.available(static_folder):
+        _build_bundles(static_folder, template_folder, manifest)
+    _write(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+
+    keep = set(manifest.values()) | set(previous.values())
+    for root, _, files in os.walk(dist):
+        for name in files:
+            relative = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            original = relative
+            for suffix in ENCODINGS.values():
+                original = original.removesuffix(suffix)
+            if name != MANIFEST_NAME and original not in keep:
+                os.unlink(os.path.join(root, name))
+    return manifest
+
+
+class AssetManifest:
+    def __init__(self, static_folder, manifest):
+        self.static_folder = static_folder
+        self.manifest = manifest
+        # File con l'hash -> codifiche disponibili, in ordine di preferenza
+        self.encodings = {
+            target: [encoding for encoding, suffix in ENCODINGS.items()
+                     if os.path.exists(os.path.join(static_folder, target + suffix))]
+            for target in manifest.values()
+        }
+        # Versione delle immagini caricate con il nome originale: quei file
+        # non vengono più riscritti (i nuovi upload vanno nell'archivio per
+        # digest), quindi l'hash si calcola una volta sola
+        self._upload_versions = {}
+
+    def upload_version(self, filename):
+        version = self._upload_versions.get(filename)
+        if version is None:
+            try:
+                with open(os.path.join(self.static_folder, filename), 'rb') as f:
+                    version = _digest(f.read())
+            except OSError:
+                return None
+            self._upload_versions[filename] = version
+        return version
+
+    # Hook url_defaults: url_for('static', filename='css/style.css') punta al
+    # file con l'hash; le vecchie immagini caricate ricevono ?v=<hash>
+    def url_defaults(self, endpoint, values):
+        if endpoint != 'static':
+            return
+        filename = values.get('filename', '')
+        if filename in self.manifest:
+            values['filename'] = self.manifest[filename]
+        elif filename.startswith(UPLOADS_DIR) and not is_content_addressed(filename):
+            version = self.upload_version(filename)
+            if version:
+                values['v'] = version
+
+    def _send_encoded(self, filename):
+        encoding = request.accept_encodings.best_match(self.encodings[filename])
+        if encoding is None:
+            return current_app.send_static_file(filename)
+        response = send_from_directory(self.static_folder, filename + ENCODINGS[encoding],
+                                       mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    # Vista che sostituisce quella predefinita di /static
+    def send(self, filename):
+        if filename in self.encodings:
+            response = self._send_encoded(filename)
+            response.vary.add('Accept-Encoding')
+        else:
+            response = current_app.send_static_file(filename)
+            version = request.args.get('v')
+            if not (version and filename.startswith(UPLOADS_DIR)
+                    and version == self.upload_version(filename)):
+                return response
+        if response.status_code in (200, 206, 304):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            response.headers.pop('Expires', None)
+        return response
+
+
+# Con ASSET_MANIFEST a False (server di sviluppo) gli URL restano quelli dei
+# file sorgente, così le modifiche a CSS e JavaScript si vedono subito
+def init_app(app):
+    manifest = read_manifest(app.static_folder) if app.config.get('ASSET_MANIFEST', True) else {}
+    assets = AssetManifest(app.static_folder, manifest)
+    app.extensions['assets'] = assets
+    # Con il bundle il layout carica un solo CSS e un solo script dal sito,
+    # altrimenti i file sorgente di ciascun bundle
+    app.jinja_env.globals['asset_bundle'] = 'css/bundle.css' in manifest
+    app.jinja_env.globals['asset_sources'] = bundler.BUNDLES
+    app.url_defaults(assets.url_defaults)
+    app.view_functions['static'] = assets.send
@@ -0,0 +1,112 @@
+# Verifica delle credenziali con costo limitato: bcrypt gira su un pool di
+# thread di dimensione fissa e i tentativi sono limitati per IP e per utente,
+# così un attacco sul login non può togliere CPU alla navigazione del catalogo.
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import bcrypt
+
+# Thread dedicati a bcrypt (il calcolo rilascia il GIL)
+VERIFY_WORKERS = 2
+# Verifiche in corso o in attesa oltre le quali il login risponde subito "occupato"
+MAX_PENDING = 8
+VERIFY_TIMEOUT = 5.0
+
+# Token bucket: BURST tentativi subito, poi uno ogni REFILL_SECONDS
+IP_BURST = 10
+IP_REFILL_SECONDS = 6.0
+USER_BURST = 5
+USER_REFILL_SECONDS = 12.0
+# Chiavi ricordate al massimo per limitatore; oltre si dimenticano le meno recenti
+MAX_TRACKED_KEYS = 10000
+
+# Hash con lo stesso costo di users.hash_password, verificato quando l'utente
+# non esiste: la risposta impiega lo stesso tempo e non rivela i nomi validi
+DUMMY_HASH = b'$2b$12$19fSxGbT69mJ8CmuZOd2XOYh5wyNk6//YWMb0.sssczlaQpMI8T0G'
+
+# Esiti di Authenticator.verify
+OK = 'ok'
+INVALID = 'invalid'
+BUSY = 'busy'
+
+
+class RateLimiter:
+    def __init__(self, burst, refill_seconds, max_keys=MAX_TRACKED_KEYS):
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # chiave -> (token disponibili, istante dell'ultimo aggiornamento)
+        self._buckets = OrderedDict()
+
+    # Consuma un token se disponibile. Il costo è lo stesso sia che il
+    # tentativo venga accettato sia che venga rifiutato.
+    def allow(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) / self.refill_seconds)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    # Secondi di attesa prima del prossimo token
+    def retry_after(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) / self.refill_seconds)
+        return max(0.0, (1 - tokens) * self.refill_seconds)
+
+
+class Authenticator:
+    def __init__(self, workers=VERIFY_WORKERS, max_pending=MAX_PENDING):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='auth')
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self.by_ip = RateLimiter(IP_BURST, IP_REFILL_SECONDS)
+        self.by_username = RateLimiter(USER_BURST, USER_REFILL_SECONDS)
+
+    # Vero se il tentativo rientra nei limiti sia dell'IP sia dell'utente.
+    # Un IP già bloccato non consuma i token dell'utente: altrimenti un solo
+    # attaccante terrebbe bloccato il vero utente anche da un altro IP.
+    def allow(self, remote_addr, username):
+        if not self.by_ip.allow(remote_addr):
+            return False
+        return self.by_username.allow(username.casefold())
+
+    def retry_after(self, remote_addr, username):
+        return max(self.by_ip.retry_after(remote_addr), self.by_username.retry_after(username.casefold()))
+
+    # Verifica la password contro l'hash salvato (None se l'utente non esiste)
+    def verify(self, stored_hash, password):
+        if not self._pending.acquire(blocking=False):
+            return BUSY
+        hashed = stored_hash.encode() if stored_hash else DUMMY_HASH
+        try:
+            future = self._executor.submit(bcrypt.checkpw, password.encode(), hashed)
+        except BaseException:
+            self._pending.release()
+            raise
+        # Il posto si libera quando bcrypt termina, anche se nessuno aspetta più
+        future.add_done_callback(lambda _: self._pending.release())
+        try:
+            matches = future.result(VERIFY_TIMEOUT)
+        except TimeoutError:
+            return BUSY
+        except ValueError:
+            # Hash salvato non valido
+            matches = False
+        return OK if matches and stored_hash else INVALID
+
+
+def init_app(app):
+    app.extensions['auth'] = Authenticator(
+        app.config.get('AUTH_WORKERS', VERIFY_WORKERS),
+        app.config.get('AUTH_MAX_PENDING', MAX_PENDING),
+    )
@@ -0,0 +1,2 @@
+# Benchmark riproducibili: generatore di cataloghi sintetici (generate) e
+# misure di latenza delle rotte principali (run)
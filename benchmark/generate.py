@@ -0,0 +1,155 @@
+# Genera un catalogo sintetico e riproducibile per i benchmark.
+#
+#   python -m benchmark.generate --products 1000000 --categories 120 --seed 1
+#
+# Lo stesso seme produce sempre lo stesso database.
+import argparse
+import importlib
+import itertools
+import os
+import random
+import sys
+import time
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'database', 'benchmark.db')
+INSERT_BATCH = 10000
+
+# Nomi in ordine di popolarità: la frequenza segue una legge di Zipf
+POKEMON = (
+    'Pikachu', 'Charizard', 'Eevee', 'Mewtwo', 'Gengar', 'Lucario', 'Snorlax', 'Gyarados',
+    'Dragonite', 'Umbreon', 'Blastoise', 'Venusaur', 'Bulbasaur', 'Charmander', 'Squirtle',
+    'Jigglypuff', 'Mew', 'Rayquaza', 'Greninja', 'Sylveon', 'Espeon', 'Vaporeon', 'Jolteon',
+    'Flareon', 'Lugia', 'Ho-Oh', 'Tyranitar', 'Garchomp', 'Gardevoir', 'Alakazam', 'Machamp',
+    'Arcanine', 'Lapras', 'Ditto', 'Psyduck', 'Magikarp', 'Scyther', 'Onix', 'Cubone',
+    'Togepi', 'Mimikyu', 'Zoroark', 'Darkrai', 'Giratina', 'Arceus', 'Dialga', 'Palkia',
+    'Kyogre', 'Groudon', 'Latias', 'Latios', 'Absol', 'Metagross', 'Salamence', 'Blaziken',
+    'Sceptile', 'Swampert', 'Infernape', 'Empoleon', 'Torterra', 'Zapdos', 'Moltres',
+    'Articuno', 'Raichu', 'Clefairy', 'Vulpix', 'Ninetales', 'Meowth', 'Slowpoke', 'Haunter',
+    'Gastly', 'Hitmonlee', 'Hitmonchan', 'Kangaskhan', 'Starmie', 'Pinsir', 'Tauros',
+    'Aerodactyl', 'Kabutops', 'Omastar', 'Zekrom', 'Reshiram', 'Kyurem', 'Xerneas', 'Yveltal',
+)
+# Varianti della carta e loro frequenza
+SUFFIXES = (('', 60), (' ex', 10), (' V', 8), (' VMAX', 4), (' VSTAR', 3), (' GX', 6),
+            (' EX', 4), (' δ', 1), (' di Team Rocket', 2), (' Oscuro', 2))
+ADDITIONAL_INFO = (('', 50), ('Holo', 15), ('Reverse Holo', 15), ('Prima edizione', 5),
+                   ('Full Art', 6), ('Promo', 4), ('Illustrazione speciale', 3), ('Segreta', 2))
+SERIES = ('Set Base', 'Giungla', 'Fossil', 'Team Rocket', 'Gym Heroes', 'Neo Genesis',
+          'Neo Destiny', 'Rubino e Zaffiro', 'Diamante e Perla', 'Platino', 'HeartGold SoulSilver',
+          'Nero e Bianco', 'XY', 'Sole e Luna', 'Spada e Scudo', 'Scarlatto e Violetto')
+# Quota di carte con immagine e, tra queste, quota che riusa un file già caricato
+IMAGE_RATIO = 0.85
+SHARED_IMAGE_RATIO = 0.1
+
+
+# Valori e pesi cumulativi, da passare a random.choices senza ricalcolarli a ogni carta
+def _weighted(pairs):
+    pairs = list(pairs)
+    return [value for value, _ in pairs], list(itertools.accumulate(weight for _, weight in pairs))
+
+
+def generate_categories(rng, count):
+    categories = []
+    for index in range(count):
+        series = SERIES[index % len(SERIES)]
+        number = index // len(SERIES) + 1
+        name = series if number == 1 else f"{series} {number}"
+        prefix = ''.join(word[0] for word in series.split()).upper() + str(number)
+        # Le espansioni hanno dimensioni molto diverse tra loro
+        weight = rng.paretovariate(1.5)
+        categories.append((name, f"Espansione sintetica {name}", prefix, weight))
+    return categories
+
+
+# Produce le righe di products come tuple (name, code, price, image_path, category_id, additional_info)
+def generate_products(rng, count, category_ids, prefixes, weights):
+    names, name_weights = _weighted((name, 1 / rank) for rank, name in enumerate(POKEMON, start=1))
+    category_weights = list(itertools.accumulate(weights))
+    suffixes, suffix_weights = _weighted(SUFFIXES)
+    infos, info_weights = _weighted(ADDITIONAL_INFO)
+    counters = dict.fromkeys(category_ids, 0)
+    images = []
+    for _ in range(count):
+        category_id = rng.choices(category_ids, cum_weights=category_weights)[0]
+        counters[category_id] += 1
+        name = (rng.choices(names, cum_weights=name_weights)[0]
+                + rng.choices(suffixes, cum_weights=suffix_weights)[0])
+        code = f"{prefixes[category_id]}-{counters[category_id]:03d}"
+        price = max(0.1, round(rng.lognormvariate(0.5, 1.3), 2))
+        image_path = None
+        if rng.random() < IMAGE_RATIO:
+            if images and rng.random() < SHARED_IMAGE_RATIO:
+                image_path = rng.choice(images)
+            else:
+                digest = f"{rng.getrandbits(256):064x}"
+                image_path = f"uploads/cas/{digest[:2]}/{digest}.jpg"
+                images.append(image_path)
+        yield (name, code, price, image_path, category_id, rng.choices(infos, cum_weights=info_weights)[0])
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(path, products, categories, seed):
+    # Lo schema viene creato dall'applicazione sul database indicato
+    app = importlib.import_module('app').create_app({'DATABASE': path, 'JOBS_ENABLED': False})
+    import db
+
+    rng = random.Random(seed)
+    conn = db.connect(app.config['DATABASE'])
+    category_rows = generate_categories(rng, categories)
+    with conn:
+        conn.executemany("INSERT INTO categories (name, description) VALUES (?, ?)",
+                         [(name, description) for name, description, _, _ in category_rows])
+    ids = {row['name']: row['id'] for row in conn.execute("SELECT id, name FROM categories")}
+    category_ids = [ids[name] for name, _, _, _ in category_rows]
+    prefixes = {ids[name]: prefix for name, _, prefix, _ in category_rows}
+    weights = [weight for _, _, _, weight in category_rows]
+
+    inserted = 0
+    for batch in _batches(generate_products(rng, products, category_ids, prefixes, weights), INSERT_BATCH):
+        with conn:
+            conn.executemany(
+                "INSERT INTO products (name, code, price, image_path, category_id, additional_info)"
+                " VALUES (?, ?, ?, ?, ?, ?)", batch)
+        inserted += len(batch)
+        print(f"\r{inserted}/{products} carte", end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un catalogo sintetico per i benchmark")
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help="file del database da creare")
+    parser.add_argument('--products', type=int, default=100000, help="numero di carte (fino a 1M)")
+    parser.add_argument('--categories', type=int, default=60, help="numero di espansioni")
+    parser.add_argument('--seed', type=int, default=1, help="seme del generatore casuale")
+    parser.add_argument('--force', action='store_true', help="sovrascrive il database se esiste già")
+    args = parser.parse_args(argv)
+
+    if args.products < 0 or args.categories < 1:
+        parser.error("servono almeno un'espansione e un numero di carte non negativo")
+    path = os.path.abspath(args.database)
+    if os.path.exists(path):
+        if not args.force:
+            parser.error(f"{path} esiste già (usa --force per sovrascriverlo)")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    start = time.perf_counter()
+    generate(path, args.products, args.categories, args.seed)
+    print(f"Catalogo generato in {path} ({time.perf_counter() - start:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# Misura la latenza delle rotte principali con il test client di Flask.
+#
+#   python -m benchmark.run --output results.json
+#   python -m benchmark.run --output new.json --compare results.json
+#
+# Per ogni scenario riporta p50/p95/p99 in millisecondi; per l'intera
+# esecuzione il picco di memoria residente (RSS) del processo.
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmark.generate import DEFAULT_DATABASE
+
+SEARCH_FILTERS = ('query', 'category_id', 'price')
+SEARCH_SORTS = ('name', 'price_asc', 'price_desc', 'relevance')
+# Aumento massimo del p95 rispetto al confronto prima di segnalare una regressione
+DEFAULT_THRESHOLD = 0.10
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta kilobyte, macOS byte
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Percentile con il metodo nearest-rank su una lista già ordinata
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(durations):
+    values = sorted(d * 1000 for d in durations)
+    return {
+        'requests': len(values),
+        'p50_ms': round(percentile(values, 50), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'mean_ms': round(sum(values) / len(values), 3),
+        'max_ms': round(values[-1], 3),
+    }
+
+
+# Valori realistici per i filtri, presi dal catalogo stesso
+def _sample_values(conn):
+    name = conn.execute(
+        "SELECT name FROM products GROUP BY name ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    category = conn.execute(
+        "SELECT category_id FROM products GROUP BY category_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    middle = conn.execute(
+        "SELECT name, id FROM products ORDER BY name, id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM products)"
+    ).fetchone()
+    return {
+        'query': name[0].split()[0] if name else 'Pikachu',
+        'category_id': category[0] if category and category[0] else 1,
+        'middle': tuple(middle) if middle else None,
+    }
+
+
+# Elenco degli scenari: (nome, percorso, richiede login)
+def build_scenarios(samples):
+    from pagination import encode_cursor
+
+    scenarios = [('index', '/', False)]
+    if samples['middle']:
+        scenarios.append(('index_middle_page', '/?after=' + encode_cursor(*samples['middle']), False))
+    scenarios.append(('category', f"/category/{samples['category_id']}", False))
+    # Ogni combinazione di filtri per ogni ordinamento
+    for size in range(len(SEARCH_FILTERS) + 1):
+        for filters in itertools.combinations(SEARCH_FILTERS, size):
+            params = {}
+            if 'query' in filters:
+                params['query'] = samples['query']
+            if 'category_id' in filters:
+                params['category_id'] = samples['category_id']
+            if 'price' in filters:
+                params.update(min_price='2', max_price='20')
+            for sort in SEARCH_SORTS:
+                query = '&'.join(f"{key}={value}" for key, value in {**params, 'sort_by': sort}.items())
+                label = '+'.join(filters) or 'nessun_filtro'
+                scenarios.append((f"search[{label}][{sort}]", '/search?' + query, False))
+    scenarios += [
+        ('admin_products', '/admin/products', True),
+        ('admin_categories', '/admin/categories', True),
+    ]
+    return scenarios
+
+
+def run_scenario(client, path, iterations, warmup):
+    for _ in range(warmup):
+        client.get(path)
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = client.get(path)
+        durations.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path}: risposta {response.status_code}")
+    return durations
+
+
+def run(database, iterations, warmup, page_cache, only=None):
+    # I lavori in background non devono competere con le richieste misurate
+    app = importlib.import_module('app').create_app(
+        {'DATABASE': database, 'TESTING': True, 'JOBS_ENABLED': False})
+    if not page_cache:
+        # Con zero voci ogni richiesta esegue davvero le query
+        app.extensions['page_cache'].max_entries = 0
+
+    conn = sqlite3.connect(database)
+    samples = _sample_values(conn)
+    products, categories = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM products), (SELECT COUNT(*) FROM categories)").fetchone()
+    conn.close()
+
+    public = app.test_client()
+    admin = app.test_client()
+    with admin.session_transaction() as session:
+        session['user_id'] = 1
+        session['username'] = 'admin'
+
+    results = {}
+    started = time.perf_counter()
+    for name, path, needs_login in build_scenarios(samples):
+        if only and only not in name:
+            continue
+        durations = run_scenario(admin if needs_login else public, path, iterations, warmup)
+        results[name] = {'path': path, **summarize(durations)}
+        print(f"{name:55} p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms"
+              f"  p99 {results[name]['p99_ms']:8.2f} ms", file=sys.stderr)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'database': database,
+            'products': products,
+            'categories': categories,
+            'iterations': iterations,
+            'warmup': warmup,
+            'page_cache': page_cache,
+            'duration_s': round(time.perf_counter() - started, 2),
+        },
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'scenarios': results,
+    }
+
+
+# Confronta il p95 di ogni scenario con un'esecuzione precedente.
+# Restituisce la lista delle regressioni oltre la soglia.
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before or not before['p95_ms']:
+            continue
+        change = result['p95_ms'] / before['p95_ms'] - 1
+        if change > threshold:
+            regressions.append((name, before['p95_ms'], result['p95_ms'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark delle rotte principali")
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help="database generato con python -m benchmark.generate")
+    parser.add_argument('--iterations', type=int, default=50, help="richieste misurate per scenario")
+    parser.add_argument('--warmup', type=int, default=5, help="richieste iniziali non misurate")
+    parser.add_argument('--page-cache', action='store_true',
+                        help="lascia attiva la cache delle pagine pubbliche")
+    parser.add_argument('--only', help="esegue solo gli scenari il cui nome contiene questo testo")
+    parser.add_argument('--output', help="file JSON in cui salvare i risultati (default: stdout)")
+    parser.add_argument('--compare', help="risultati JSON di un'esecuzione precedente")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="aumento relativo del p95 considerato regressione (default 0.10)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} non esiste: generalo con python -m benchmark.generate")
+    if args.iterations < 1:
+        parser.error("--iterations deve essere almeno 1")
+
+    results = run(os.path.abspath(args.database), args.iterations, args.warmup, args.page_cache, args.only)
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSIONE {name}: p95 {before:.2f} -> {after:.2f} ms ({change:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
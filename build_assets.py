@@ -0,0 +1,27 @@
+import argparse
+import os
+
+import assets
+import bundler
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Genera CSS e JavaScript con l'hash del contenuto nel nome e le versioni compresse")
+    parser.add_argument('--static-folder', default=os.path.join(ROOT, 'static'),
+                        help="cartella dei file statici")
+    parser.add_argument('--template-folder', default=os.path.join(ROOT, 'templates'),
+                        help="cartella dei template (per le classi CSS usate)")
+    args = parser.parse_args()
+
+    manifest = assets.build(args.static_folder, args.template_folder)
+    for source, target in manifest.items():
+        print(f"{source} -> {target}")
+    if not bundler.available(args.static_folder):
+        print("Vendor files missing from static/vendor/: bundles were not built,"
+              " pages load each source file separately.")
+    if assets.brotli is None:
+        print("brotli not installed: only gzip variants were generated, icon fonts were not subset.")
+    elif bundler.font_subset is None:
+        print("fontTools not installed: icon fonts were not subset.")
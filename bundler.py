@@ -0,0 +1,338 @@
+# Bundle del front-end: le dipendenze copiate in static/vendor/ e i file del
+# sito diventano un solo CSS e un solo JavaScript. Dal CSS si tolgono le
+# regole che non corrispondono a nessuna classe usata nei template o nei
+# nostri script, e il font delle icone viene ridotto ai glifi rimasti.
+import io
+import os
+import posixpath
+import re
+
+try:
+    import brotli  # noqa: F401 (serve a fontTools per leggere e scrivere i WOFF2)
+    from fontTools import subset as font_subset
+except ImportError:
+    # Opzionali: senza fontTools (e brotli per leggere i WOFF2) il font delle
+    # icone resta completo
+    font_subset = None
+
+VENDOR_DIR = 'vendor'
+# Dipendenze in static/vendor/, aggiunte al repository: la build e il sito
+# non usano la rete. Vengono dai pacchetti pubblicati su PyPI (file -> origine).
+# I font sono i TTF dei pacchetti convertiti in WOFF2 con fontTools (i WOFF2
+# di Font Awesome 6.0.0-beta3 non si decomprimono), Poppins con i soli
+# caratteri latini:
+#   pyftsubset Poppins-Regular.ttf --flavor=woff2 --layout-features='*' \
+#       --unicodes=<unicode-range di css/fonts.css> --output-file=poppins-latin-400-normal.woff2
+_BOOTSTRAP = 'django-bootstrap-static==5.3.3 bootstrap/static/bootstrap'
+_FONTAWESOME = 'fontawesomefree==6.0.0b3 fontawesomefree/static/fontawesomefree'
+_POPPINS = 'fontpkg-poppins==4.4 fontpkg_poppins/files'
+VENDOR_FILES = {
+    'bootstrap/bootstrap.min.css': f'{_BOOTSTRAP}/css/bootstrap.min.css',
+    'bootstrap/bootstrap.bundle.min.js': f'{_BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'bootstrap/LICENSE': 'MIT, dall\'intestazione di bootstrap.min.css',
+    'fontawesome/css/all.min.css': f'{_FONTAWESOME}/css/all.min.css',
+    'fontawesome/LICENSE.txt': f'{_FONTAWESOME}/LICENSE.txt',
+    **{f'fontawesome/webfonts/{name}.woff2': f'{_FONTAWESOME}/webfonts/{name}.ttf'
+       for name in ('fa-solid-900', 'fa-regular-400', 'fa-brands-400', 'fa-v4compatibility')},
+    **{f'poppins/poppins-latin-{weight}-normal.woff2': f'{_POPPINS}/Poppins-{style}.ttf'
+       for weight, style in ((400, 'Regular'), (500, 'Medium'), (600, 'SemiBold'), (700, 'Bold'))},
+    'poppins/OFL.txt': 'fontpkg-poppins==4.4 LICENSE',
+}
+
+# Bundle -> file (relativi a static/) concatenati in quest'ordine
+BUNDLES = {
+    'css/bundle.css': (
+        'vendor/bootstrap/bootstrap.min.css',
+        'vendor/fontawesome/css/all.min.css',
+        'css/fonts.css',
+        'css/style.css',
+    ),
+    'js/bundle.js': (
+        'vendor/bootstrap/bootstrap.bundle.min.js',
+        'js/typeahead.js',
+        'js/image-modal.js',
+    ),
+}
+
+# Classi aggiunte a runtime da Bootstrap o dal codice Python (categorie dei
+# messaggi flash): non compaiono nei template ma le loro regole servono
+SAFELIST = frozenset((
+    'show', 'showing', 'hiding', 'collapsing', 'collapse-horizontal', 'fade', 'active', 'disabled',
+    'modal-open', 'modal-backdrop', 'modal-static', 'offcanvas-backdrop', 'dropdown-menu-end',
+    'alert-success', 'alert-danger', 'alert-warning', 'alert-info', 'alert-message',
+))
+# Famiglie di font delle icone, ridotte ai caratteri usati nelle regole rimaste
+ICON_FONT_FAMILIES = ('Font Awesome 6 Free', 'Font Awesome 6 Brands')
+
+# Regole che contengono altre regole: si filtra il loro contenuto
+GROUP_RULES = ('@media', '@supports', '@layer', '@container')
+
+_STRING_OR_COMMENT = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*(!?)[\s\S]*?\*/''')
+_CLASS = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+_TOKEN = re.compile(r'[A-Za-z_][\w-]*')
+_URL = re.compile(r'''url\(\s*(["']?)([^"')]+)\1\s*\)''')
+_CODEPOINT = re.compile(r'"\\([0-9a-fA-F]{4,6})"')
+
+
+# Vero se tutti i file di tutti i bundle sono presenti
+def available(static_folder):
+    return all(os.path.exists(os.path.join(static_folder, source))
+               for sources in BUNDLES.values() for source in sources)
+
+
+# Nomi (classi, id, parole) usati nei template e nei nostri script: una
+# regola CSS resta solo se tutte le sue classi compaiono qui
+def used_names(template_folder, script_folder):
+    names = set(SAFELIST)
+    for folder, ext in ((template_folder, '.html'), (script_folder, '.js')):
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith(ext):
+                    with open(os.path.join(root, name), encoding='utf-8') as f:
+                        names.update(_TOKEN.findall(f.read()))
+    return names
+
+
+# Indice del primo carattere di stops fuori da stringhe e parentesi
+def _scan(text, start, stops):
+    depth = 0
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char in '"\'':
+            i += 1
+            while i < len(text) and text[i] != char:
+                i += 2 if text[i] == '\\' else 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and char in stops:
+            return i
+        i += 1
+    return len(text)
+
+
+def _parse(text, i=0):
+    nodes = []
+    while i < len(text):
+        while i < len(text) and text[i].isspace():
+            i += 1
+        if i >= len(text):
+            break
+        if text[i] == '}':
+            return nodes, i + 1
+        j = _scan(text, i, '{;}')
+        prelude = text[i:j].strip()
+        if j >= len(text) or text[j] != '{':
+            # @charset, @import o residui senza blocco
+            if prelude:
+                nodes.append(('statement', prelude, None))
+            i = j + 1 if j < len(text) and text[j] == ';' else j
+            continue
+        if prelude.split(None, 1)[0].lower() in GROUP_RULES:
+            children, i = _parse(text, j + 1)
+            nodes.append(('group', prelude, children))
+        else:
+            depth, k = 1, j + 1
+            while depth:
+                k = _scan(text, k, '{}')
+                if k >= len(text):
+                    break
+                depth += 1 if text[k] == '{' else -1
+                k += 1
+            nodes.append(('rule', prelude, text[j + 1:k - 1]))
+            i = k
+    return nodes, i
+
+
+# Spazi superflui fuori dalle stringhe. Lo spazio prima di ':' resta (nei
+# selettori ".a :hover" è diverso da ".a:hover"), così come quelli attorno a
+# + e - che in calc() sono obbligatori.
+def _squeeze(text):
+    parts = re.split(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''', text)
+    for index in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[index])
+        part = re.sub(r' ?([{};,>]) ?', r'\1', part)
+        parts[index] = re.sub(r': ', ':', part)
+    return ''.join(parts).replace(';}', '}').strip().rstrip(';')
+
+
+def _split_top(text, separator=','):
+    items, start = [], 0
+    while start <= len(text):
+        end = _scan(text, start, separator)
+        items.append(text[start:end].strip())
+        start = end + 1
+    return [item for item in items if item]
+
+
+class _Shaker:
+    def __init__(self, static_folder, names):
+        self.static_folder = static_folder
+        self.names = names
+        # Percorsi (relativi a static/) dei file referenziati con url()
+        self.resources = {}
+
+    def _keep_selector(self, selector):
+        return all(name in self.names for name in _CLASS.findall(selector))
+
+    # Riscrive gli url() relativi al CSS di origine in percorsi relativi a
+    # static/; None se il file non esiste
+    def _resolve(self, source, url):
+        if re.match(r'^(?:[a-z]+:|/|#)', url, re.IGNORECASE):
+            return url
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), url.split('?')[0].split('#')[0]))
+        if not os.path.exists(os.path.join(self.static_folder, path)):
+            return None
+        self.resources[path] = None
+        return f'{{{{{path}}}}}'
+
+    def _rewrite_urls(self, source, body):
+        def replace(match):
+            resolved = self._resolve(source, match.group(2))
+            return f'url({resolved})' if resolved else 'url()'
+        return _URL.sub(replace, body)
+
+    # Nel src di un @font-face restano solo le voci con il file presente
+    def _font_face(self, source, body):
+        declarations = []
+        for declaration in _split_top(body, ';'):
+            name, _, value = declaration.partition(':')
+            if name.strip().lower() == 'src':
+                entries = [self._rewrite_urls(source, entry) for entry in _split_top(value)]
+                entries = [entry for entry in entries if 'url()' not in entry]
+                if not entries:
+                    return None
+                value = ','.join(entries)
+            declarations.append(f'{name.strip()}:{value.strip()}')
+        return ';'.join(declarations)
+
+    def shake(self, source, nodes):
+        kept = []
+        for kind, prelude, content in nodes:
+            if kind == 'group':
+                children = self.shake(source, content)
+                if children:
+                    kept.append((kind, prelude, children))
+            elif kind == 'statement' and prelude.lower().startswith('@charset'):
+                # Valido solo all'inizio del file: il bundle è servito in UTF-8
+                continue
+            elif kind == 'statement' or prelude.startswith('@'):
+                if prelude.lower() == '@font-face':
+                    content = self._font_face(source, content)
+                    if content is None:
+                        continue
+                kept.append((kind, prelude, content))
+            else:
+                selectors = [selector for selector in _split_top(prelude) if self._keep_selector(selector)]
+                if selectors:
+                    kept.append((kind, ','.join(selectors), self._rewrite_urls(source, content)))
+        return kept
+
+
+def _emit(nodes):
+    out = []
+    for kind, prelude, content in nodes:
+        if kind == 'statement':
+            out.append(_squeeze(prelude) + ';')
+        elif kind == 'group':
+            out.append(_squeeze(prelude) + '{' + _emit(content) + '}')
+        else:
+            out.append(_squeeze(prelude) + '{' + _squeeze(content) + '}')
+    return ''.join(out)
+
+
+# Le regole senza @keyframes e @font-face, anche dentro @media
+def _plain_rules(nodes):
+    kept = []
+    for kind, prelude, content in nodes:
+        if kind == 'group':
+            kept.append((kind, prelude, _plain_rules(content)))
+        elif not (kind == 'rule' and prelude.startswith('@')):
+            kept.append((kind, prelude, content))
+    return kept
+
+
+# Toglie @keyframes e @font-face che nessuna regola rimasta usa
+def _drop_unreferenced(nodes, text):
+    kept = []
+    for kind, prelude, content in nodes:
+        if kind == 'group':
+            content = _drop_unreferenced(content, text)
+            if not content:
+                continue
+        elif kind == 'rule' and re.match(r'@(-\w+-)?keyframes\s', prelude):
+            if prelude.split()[-1] not in text:
+                continue
+        elif kind == 'rule' and prelude.lower() == '@font-face':
+            family = re.search(r'font-family\s*:\s*["\']?([^;"\']+)', content)
+            if family and family.group(1).strip() not in text:
+                continue
+        kept.append((kind, prelude, content))
+    return kept
+
+
+def _subset_font(data, codepoints):
+    options = font_subset.Options()
+    options.flavor = 'woff2'
+    font = font_subset.load_font(io.BytesIO(data), options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    out = io.BytesIO()
+    font_subset.save_font(font, out, options)
+    return out.getvalue()
+
+
+# CSS del bundle: ogni file viene ripulito, i bundle concatenati e
+# minimizzati. Restituisce (testo con segnaposto {{percorso}} per i file
+# referenziati, {percorso: contenuto} di quei file).
+def build_css(static_folder, sources, names):
+    shaker = _Shaker(static_folder, names)
+    licenses = []
+    nodes = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            text = f.read()
+
+        def strip_comment(match):
+            if match.group(1):
+                return match.group(1)
+            if match.group(2):
+                licenses.append(match.group(0))
+            return ''
+        text = _STRING_OR_COMMENT.sub(strip_comment, text)
+        nodes.extend(shaker.shake(source, _parse(text)[0]))
+
+    # Testo delle regole normali: dice quali animazioni, font e glifi servono
+    body = _emit(_plain_rules(nodes))
+    nodes = _drop_unreferenced(nodes, body)
+    css = ''.join(licenses) + _emit(nodes)
+
+    icon_fonts = set()
+    for kind, prelude, content in nodes:
+        if prelude.lower() == '@font-face' and any(family in content for family in ICON_FONT_FAMILIES):
+            icon_fonts.update(re.findall(r'\{\{([^}]+)\}\}', content))
+    codepoints = {int(code, 16) for code in _CODEPOINT.findall(body)}
+
+    resources = {}
+    for path in shaker.resources:
+        if path not in css:
+            continue
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        if path in icon_fonts and font_subset is not None and path.endswith('.woff2'):
+            data = _subset_font(data, codepoints)
+        resources[path] = data
+    return css, resources
+
+
+# Gli script sono già minimizzati (Bootstrap) o piccoli: si concatenano
+def build_js(static_folder, sources):
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            # Le mappe dei sorgenti non sono incluse
+            parts.append(re.sub(r'^//# sourceMappingURL=.*$', '', f.read(), flags=re.MULTILINE).strip())
+    return ';\n'.join(parts) + ';\n'
@@ -0,0 +1,52 @@
+# Esportazione del catalogo in streaming (CSV o NDJSON)
+import csv
+import io
+import json
+
+# Righe lette dal cursore a ogni giro: la memoria resta costante
+BATCH_SIZE = 1000
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+COLUMNS = ('id', 'code', 'name', 'price', 'category_id', 'category_name',
+           'additional_info', 'image_path', 'created_at')
+
+
+# Legge i risultati a blocchi di batch_size invece di caricarli tutti
+def iter_batches(cursor, batch_size=BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def iter_csv(cursor, batch_size=BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in iter_batches(cursor, batch_size):
+        writer.writerows([row[column] for column in COLUMNS] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(cursor, batch_size=BATCH_SIZE):
+    for rows in iter_batches(cursor, batch_size):
+        yield ''.join(
+            json.dumps({column: row[column] for column in COLUMNS}, ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+
+# Generatore del contenuto esportato nel formato richiesto
+def export_rows(cursor, fmt, batch_size=BATCH_SIZE):
+    if fmt == 'csv':
+        return iter_csv(cursor, batch_size)
+    return iter_ndjson(cursor, batch_size)
@@ -0,0 +1,179 @@
+# Importazione in blocco del catalogo da CSV o NDJSON
+import csv
+import json
+import math
+import sqlite3
+
+# Righe scritte in ogni transazione
+CHUNK_SIZE = 5000
+# Numero massimo di errori riportati nel resoconto
+MAX_REPORTED_ERRORS = 200
+
+FORMATS = ('csv', 'ndjson')
+
+# Se il codice esiste già la carta viene aggiornata (l'immagine resta invariata)
+UPSERT_SQL = """
+    INSERT INTO products (name, code, price, category_id, additional_info)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (code) DO UPDATE SET
+        name = excluded.name,
+        price = excluded.price,
+        category_id = excluded.category_id,
+        additional_info = excluded.additional_info
+"""
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.categories_created = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+# Deduce il formato dal nome del file (None se non supportato)
+def detect_format(filename):
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext == 'csv':
+        return 'csv'
+    if ext in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    return None
+
+
+# Decodifica lo stream una riga alla volta. Una riga non in UTF-8 (ad esempio
+# un file salvato in Latin-1) viene letta con caratteri sostitutivi e il suo
+# numero finisce in `invalid`: diventa un errore di quella riga invece di
+# interrompere l'importazione.
+def _decode_lines(stream, invalid):
+    for line_number, raw in enumerate(stream, start=1):
+        try:
+            yield raw.decode('utf-8-sig' if line_number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            invalid.add(line_number)
+            yield raw.decode('utf-8', errors='replace')
+
+
+def _encoding_error():
+    return ValueError("testo non codificato in UTF-8: salva il file come UTF-8")
+
+
+# Legge le righe una alla volta da uno stream binario: (numero di riga, dizionario)
+def iter_records(stream, fmt):
+    invalid = set()
+    lines = _decode_lines(stream, invalid)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        first_line = 1
+        for record in reader:
+            # Un campo tra virgolette può occupare più righe del file
+            if invalid and not invalid.isdisjoint(range(first_line, reader.line_num + 1)):
+                yield reader.line_num, _encoding_error()
+            else:
+                yield reader.line_num, record
+            first_line = reader.line_num + 1
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            if line_number in invalid:
+                yield line_number, _encoding_error()
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"JSON non valido: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield line_number, ValueError("ogni riga deve essere un oggetto JSON")
+                continue
+            yield line_number, record
+
+
+class CategoryResolver:
+    def __init__(self, conn, result):
+        self.conn = conn
+        self.result = result
+        self.ids = {row['name']: row['id'] for row in conn.execute("SELECT id, name FROM categories")}
+        self.known_ids = set(self.ids.values())
+
+    # Converte il nome (o l'id) dell'espansione nel suo id, creandola se manca
+    def resolve(self, record):
+        category_id = str(record.get('category_id') or '').strip()
+        if category_id:
+            if not category_id.isdigit() or int(category_id) not in self.known_ids:
+                raise ValueError(f"espansione {category_id} inesistente")
+            return int(category_id)
+        name = str(record.get('category') or '').strip()
+        if not name:
+            return None
+        if name not in self.ids:
+            cursor = self.conn.execute("INSERT INTO categories (name) VALUES (?)", (name,))
+            # Salvata subito: non deve sparire se il blocco corrente fallisce
+            self.conn.commit()
+            self.ids[name] = cursor.lastrowid
+            self.known_ids.add(cursor.lastrowid)
+            self.result.categories_created += 1
+        return self.ids[name]
+
+
+# Valida una riga e la trasforma nei parametri di UPSERT_SQL
+def _to_params(record, categories):
+    name = str(record.get('name') or '').strip()
+    code = str(record.get('code') or '').strip()
+    if not name:
+        raise ValueError("nome mancante")
+    if not code:
+        raise ValueError("codice mancante")
+    try:
+        price = float(str(record.get('price', '')).replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"prezzo non valido: {record.get('price')!r}")
+    if not math.isfinite(price) or price < 0:
+        raise ValueError(f"prezzo non valido: {record.get('price')!r}")
+    additional_info = record.get('additional_info') or ''
+    return (name, code, price, categories.resolve(record), str(additional_info))
+
+
+def _write_chunk(conn, chunk, result):
+    try:
+        with conn:
+            conn.executemany(UPSERT_SQL, [params for _, params in chunk])
+        result.imported += len(chunk)
+    except sqlite3.Error:
+        # Se il blocco fallisce si riprova riga per riga per isolare gli errori
+        for line, params in chunk:
+            try:
+                with conn:
+                    conn.execute(UPSERT_SQL, params)
+                result.imported += 1
+            except sqlite3.Error as e:
+                result.add_error(line, str(e))
+
+
+# Importa tutte le righe dello stream a blocchi di chunk_size, ognuno nella
+# propria transazione. Le righe non valide vengono saltate e riportate.
+def import_catalog(conn, stream, fmt, chunk_size=CHUNK_SIZE):
+    result = ImportResult()
+    categories = CategoryResolver(conn, result)
+    chunk = []
+    for line, record in iter_records(stream, fmt):
+        if isinstance(record, Exception):
+            result.add_error(line, str(record))
+            continue
+        try:
+            chunk.append((line, _to_params(record, categories)))
+        except ValueError as e:
+            result.add_error(line, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            _write_chunk(conn, chunk, result)
+            chunk = []
+    if chunk:
+        _write_chunk(conn, chunk, result)
+    return result
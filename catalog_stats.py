@@ -0,0 +1,63 @@
+# Riepilogo del catalogo per espansione (numero di carte e prezzi) mantenuto
+# dai trigger della migrazione 4: le pagine leggono una riga per espansione
+# invece di contare ogni volta tutte le carte.
+#
+# Le carte senza espansione sono contate nella riga con category_id = 0.
+
+# Scarto ammesso sulla somma dei prezzi: somme e sottrazioni ripetute di
+# numeri in virgola mobile accumulano piccoli errori di arrotondamento
+PRICE_SUM_TOLERANCE = 0.005
+
+# Valori attesi calcolati direttamente da products
+EXPECTED_SQL = """
+    SELECT IFNULL(category_id, 0) AS category_id, COUNT(*) AS product_count,
+           SUM(price) AS price_sum, MIN(price) AS price_min, MAX(price) AS price_max
+    FROM products
+    GROUP BY IFNULL(category_id, 0)
+"""
+
+# Espansioni con il loro riepilogo, per admin_categories
+CATEGORIES_SQL = """
+    SELECT c.*, IFNULL(s.product_count, 0) AS product_count,
+           s.price_min, s.price_max, s.price_sum / s.product_count AS price_avg
+    FROM categories c
+    LEFT JOIN category_stats s ON s.category_id = c.id
+    ORDER BY c.name
+"""
+
+
+def total_products(conn):
+    return conn.execute("SELECT IFNULL(SUM(product_count), 0) FROM category_stats").fetchone()[0]
+
+
+def category_product_count(conn, category_id):
+    row = conn.execute("SELECT product_count FROM category_stats WHERE category_id = ?", (category_id,)).fetchone()
+    return row[0] if row else 0
+
+
+# Confronta il riepilogo con i valori calcolati da products.
+# Restituisce una lista di (category_id, campo, valore salvato, valore atteso).
+def check_stats(conn):
+    stored = {row['category_id']: row for row in conn.execute("SELECT * FROM category_stats WHERE product_count > 0")}
+    expected = {row['category_id']: row for row in conn.execute(EXPECTED_SQL)}
+    problems = []
+    for category_id in sorted(stored.keys() | expected.keys()):
+        have = stored.get(category_id)
+        want = expected.get(category_id)
+        if have is None or want is None:
+            problems.append((category_id, 'product_count',
+                             have['product_count'] if have else 0, want['product_count'] if want else 0))
+            continue
+        for field in ('product_count', 'price_min', 'price_max'):
+            if have[field] != want[field]:
+                problems.append((category_id, field, have[field], want[field]))
+        if abs(have['price_sum'] - want['price_sum']) > PRICE_SUM_TOLERANCE:
+            problems.append((category_id, 'price_sum', have['price_sum'], want['price_sum']))
+    return problems
+
+
+# Ricalcola da zero l'intero riepilogo nella transazione corrente
+def rebuild_stats(conn):
+    conn.execute("DELETE FROM category_stats")
+    conn.execute(
+        "INSERT INTO category_stats (category_id, product_count, price_sum, price_min, price_max) " + EXPECTED_SQL)
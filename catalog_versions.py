@@ -0,0 +1,44 @@
+# Versioni di carte ed espansioni salvate nel database (tabella
+# catalog_versions, migrazione 6) e incrementate dai trigger: valgono anche
+# per le modifiche fatte da processi che non raggiungono la memoria condivisa
+# dei worker, come import_catalog.py o una shell sqlite3.
+# Prima di ogni richiesta il worker le confronta con le ultime lette da un
+# qualunque worker e, se sono cambiate, incrementa i contatori condivisi:
+# pagine in cache, ETag e indice dei suggerimenti si aggiornano come dopo una
+# modifica fatta dal sito.
+from flask import request
+
+import db
+
+# Versione nel database -> (contatore da incrementare, contatore con l'ultima versione letta)
+COUNTERS = {
+    'catalog': ('catalog', 'catalog_db'),
+    'suggest': ('suggest', 'suggest_db'),
+}
+
+
+def read_versions(conn):
+    return dict(conn.execute("SELECT name, version FROM catalog_versions").fetchall())
+
+
+# Restituisce i nomi delle versioni cambiate dall'ultima lettura
+def sync(state, conn):
+    changed = []
+    for name, version in read_versions(conn).items():
+        counter, seen = COUNTERS[name]
+        # Tra più worker solo quello che aggiorna il valore letto incrementa
+        if state.counter(seen).update(version):
+            state.counter(counter).increment()
+            changed.append(name)
+    return changed
+
+
+# Da registrare dopo shared e db
+def init_app(app):
+    state = app.extensions['shared_state']
+
+    def sync_versions():
+        # I file statici non dipendono dal catalogo
+        if request.endpoint != 'static':
+            sync(state, db.get_db())
+    app.before_request(sync_versions)
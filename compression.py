@@ -0,0 +1,106 @@
+# Compressione delle risposte dinamiche (pagine, API JSON, esportazioni)
+# secondo Accept-Encoding. Le risposte in streaming vengono compresse man mano;
+# le pagine in cache tengono le versioni compresse (vedi pagecache.CachedPage).
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # Opzionale: senza il modulo si usa solo gzip
+    brotli = None
+
+# Tipi compressi; gli asset statici sono già compressi in fase di build
+COMPRESS_MIMETYPES = ('text/html', 'application/json', 'text/csv', 'application/x-ndjson')
+# Sotto questa dimensione la compressione non conviene
+COMPRESS_MIN_SIZE = 1024
+# Livelli pensati per la compressione a ogni richiesta, non per la massima resa
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class Compressor:
+    def __init__(self, mimetypes=COMPRESS_MIMETYPES, min_size=COMPRESS_MIN_SIZE,
+                 gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY):
+        self.mimetypes = frozenset(mimetypes)
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # In ordine di preferenza a parità di qualità nell'Accept-Encoding
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def compressible(self, mimetype):
+        return mimetype in self.mimetypes
+
+    # Codifica da usare per la richiesta corrente, o None per il corpo così com'è
+    def choose(self, mimetype, size=None):
+        if not self.compressible(mimetype) or (size is not None and size < self.min_size):
+            return None
+        return request.accept_encodings.best_match(self.encodings)
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, self.gzip_level, mtime=0)
+
+    # Comprime un corpo in streaming un pezzo alla volta, chiudendo alla fine
+    # l'iterabile originale (stream_with_context rilascia lì il contesto)
+    def stream(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            process, finish = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            process, finish = compressor.compress, compressor.flush
+        try:
+            for chunk in chunks:
+                data = process(chunk.encode() if isinstance(chunk, str) else chunk)
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    # Imposta il corpo (già codificato) e le intestazioni relative
+    def set_body(self, response, body, encoding):
+        response.set_data(body)
+        if self.compressible(response.mimetype):
+            response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+
+    def compress_response(self, response):
+        if (response.direct_passthrough or 'Content-Encoding' in response.headers
+                or not self.compressible(response.mimetype)):
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.status_code != 200:
+            return response
+        if response.is_streamed:
+            encoding = self.choose(response.mimetype)
+            if encoding is None:
+                return response
+            response.response = self.stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoding
+            return response
+        body = response.get_data()
+        encoding = self.choose(response.mimetype, len(body))
+        if encoding is not None:
+            self.set_body(response, self.compress(body, encoding), encoding)
+        return response
+
+
+def init_app(app):
+    compressor = Compressor(
+        app.config.get('COMPRESS_MIMETYPES', COMPRESS_MIMETYPES),
+        app.config.get('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE),
+        app.config.get('COMPRESS_GZIP_LEVEL', GZIP_LEVEL),
+        app.config.get('COMPRESS_BROTLI_QUALITY', BROTLI_QUALITY),
+    )
+    app.extensions['compression'] = compressor
+    app.after_request(compressor.compress_response)
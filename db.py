@@ -0,0 +1,86 @@
+# Livello di accesso al database condiviso da tutte le rotte
+import queue
+import sqlite3
+
+from flask import current_app, g
+
+# Numero massimo di connessioni inattive tenute nel pool
+POOL_SIZE = 8
+# Numero di statement preparati tenuti in cache per ogni connessione
+STATEMENT_CACHE_SIZE = 256
+
+# PRAGMA applicati a ogni nuova connessione: WAL permette alle letture
+# pubbliche di non bloccarsi durante le scritture dell'amministrazione
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -16000),   # circa 16 MB di page cache
+    ('mmap_size', 268435456),  # 256 MB di memoria mappata
+    ('temp_store', 'MEMORY'),
+)
+
+
+# Apre una connessione già configurata
+def connect(path, factory=sqlite3.Connection):
+    conn = sqlite3.connect(
+        path,
+        timeout=5,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=factory,
+    )
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, factory=sqlite3.Connection):
+        self.path = path
+        self.factory = factory
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path, self.factory)
+
+    def release(self, conn):
+        # Non restituire al pool una connessione con una transazione aperta
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Restituisce la connessione legata al contesto dell'applicazione corrente
+def get_db():
+    if 'db' not in g:
+        g.db = current_app.extensions['db_pool'].acquire()
+    return g.db
+
+
+# Riconsegna la connessione al pool alla fine del contesto
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        current_app.extensions['db_pool'].release(conn)
+
+
+def init_app(app):
+    app.extensions['db_pool'] = ConnectionPool(
+        app.config['DATABASE'], app.config.get('DB_POOL_SIZE', POOL_SIZE)
+    )
+    app.teardown_appcontext(close_db)
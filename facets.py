@@ -0,0 +1,74 @@
+# Faccette della ricerca: carte trovate per espansione e istogramma dei prezzi,
+# calcolati con due query aggregate sui risultati della ricerca
+
+# Limiti inferiori delle fasce di prezzo (l'ultima fascia non ha limite superiore)
+PRICE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250)
+
+
+class PriceBucket:
+    def __init__(self, low, high, count):
+        self.low = low
+        self.high = high
+        self.count = count
+
+
+class Facets:
+    def __init__(self, category_counts, buckets):
+        self.category_counts = category_counts
+        self.buckets = buckets
+
+    @property
+    def max_bucket_count(self):
+        return max((bucket.count for bucket in self.buckets), default=0)
+
+
+def _bucket_case(column):
+    cases = ' '.join(f"WHEN {column} < {high} THEN {index}" for index, high in enumerate(PRICE_BUCKETS[1:]))
+    return f"CASE {cases} ELSE {len(PRICE_BUCKETS) - 1} END"
+
+
+# Risultati della ricerca con le condizioni date: (FROM ... WHERE ..., parametri)
+def _source(match_query, conditions, params):
+    if match_query:
+        source = "FROM products_fts JOIN products p ON p.id = products_fts.rowid WHERE products_fts MATCH ?"
+        params = [match_query] + params
+    else:
+        source = "FROM products p WHERE 1=1"
+    return source + ''.join(f" AND {condition}" for condition in conditions), params
+
+
+# Ogni faccetta ignora il proprio filtro e rispetta gli altri: i conteggi per
+# espansione tengono conto della fascia di prezzo scelta, l'istogramma
+# dell'espansione scelta. Il testo cercato vale per entrambe.
+# Entrambe le query raggruppano in SQL tutti i risultati (senza testo sono
+# coperte dall'indice su (category_id, price)): al più espansioni e fasce righe.
+def compute_facets(cursor, match_query, category_id=None, min_price=None, max_price=None, price_below=None):
+    price_conditions = []
+    price_params = []
+    if min_price is not None:
+        price_conditions.append("p.price >= ?")
+        price_params.append(min_price)
+    if max_price is not None:
+        price_conditions.append("p.price <= ?")
+        price_params.append(max_price)
+    if price_below is not None:
+        # Limite di una fascia scelta: la fascia 5-10 è 5 <= prezzo < 10
+        price_conditions.append("p.price < ?")
+        price_params.append(price_below)
+
+    source, params = _source(match_query, price_conditions + ["p.category_id IS NOT NULL"], price_params)
+    cursor.execute(f"SELECT p.category_id, COUNT(*) AS hits {source} GROUP BY p.category_id", params)
+    category_counts = {row['category_id']: row['hits'] for row in cursor.fetchall()}
+
+    if category_id is not None:
+        source, params = _source(match_query, ["p.category_id = ?"], [category_id])
+    else:
+        source, params = _source(match_query, [], [])
+    cursor.execute(f"SELECT {_bucket_case('p.price')} AS bucket, COUNT(*) AS hits {source} GROUP BY bucket", params)
+    bucket_counts = [0] * len(PRICE_BUCKETS)
+    for row in cursor.fetchall():
+        bucket_counts[row['bucket']] = row['hits']
+
+    highs = PRICE_BUCKETS[1:] + (None,)
+    buckets = [PriceBucket(low, high, count) for low, high, count in zip(PRICE_BUCKETS, highs, bucket_counts)]
+    return Facets(category_counts, buckets)
@@ -0,0 +1,69 @@
+# Indice full-text (FTS5) sulle carte usato dalla rotta /search
+import re
+
+# Tabella FTS5 a contenuto esterno: i testi restano in products e l'indice
+# contiene solo i token. I trigger la tengono allineata a ogni
+# INSERT/UPDATE/DELETE fatta dalle rotte di amministrazione.
+FTS_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, code, additional_info,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, code, additional_info)
+        VALUES (new.id, new.name, new.code, new.additional_info);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, code, additional_info)
+        VALUES ('delete', old.id, old.name, old.code, old.additional_info);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, code, additional_info ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, code, additional_info)
+        VALUES ('delete', old.id, old.name, old.code, old.additional_info);
+        INSERT INTO products_fts (rowid, name, code, additional_info)
+        VALUES (new.id, new.name, new.code, new.additional_info);
+    END
+    """,
+)
+
+# Pesi BM25 per colonna (name, code, additional_info)
+BM25_RANK = "bm25(products_fts, 10.0, 5.0, 1.0)"
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# Crea tabella e trigger; al primo avvio indicizza le carte già presenti
+def init_fts(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+    exists = cursor.fetchone() is not None
+    for statement in FTS_SCHEMA:
+        cursor.execute(statement)
+    if not exists:
+        rebuild_fts(cursor)
+
+
+# Ricostruisce l'indice dal contenuto della tabella products
+def rebuild_fts(cursor):
+    cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+# Trasforma il testo digitato dall'utente in un'espressione MATCH sicura.
+# Ogni parola diventa una frase con ricerca per prefisso sull'ultimo token,
+# così "BS-01" cerca la sequenza "bs" seguita da un token che inizia per "01".
+# Restituisce None se il testo non contiene nulla di ricercabile.
+def build_match_query(text):
+    terms = []
+    for word in text.split():
+        tokens = TOKEN_RE.findall(word)
+        if tokens:
+            terms.append('"' + ' '.join(tokens) + '"*')
+    return ' '.join(terms) if terms else None
@@ -0,0 +1,58 @@
+# Preparazione dei worker prima di ricevere traffico e stato di prontezza
+# esposto su /ready per il bilanciatore
+import logging
+import os
+import time
+
+from flask import current_app, jsonify
+
+from db import get_db
+
+log = logging.getLogger(__name__)
+
+
+class Readiness:
+    def __init__(self):
+        # Vero dopo warmup(); draining quando il worker sta per fermarsi
+        self.ready = False
+        self.draining = False
+
+
+# Apre la prima connessione del pool (PRAGMA e prime pagine del database in
+# cache), compila tutti i template e carica l'indice dei suggerimenti, così
+# la prima richiesta non paga nessuno di questi costi
+def warmup(app):
+    started = time.perf_counter()
+    with app.app_context():
+        conn = get_db()
+        conn.execute("SELECT COUNT(*) FROM categories").fetchone()
+        conn.execute("SELECT id FROM products ORDER BY name, id LIMIT 50").fetchall()
+        templates = app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))
+        for name in templates:
+            app.jinja_env.get_template(name)
+        app.extensions['suggest_index'].ensure_loaded(get_db)
+    app.extensions['readiness'].ready = True
+    log.info("worker pronto", extra={
+        'pid': os.getpid(),
+        'templates': len(templates),
+        'warmup_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+def ready_view():
+    state = current_app.extensions['readiness']
+    if state.draining:
+        status = 'draining'
+    elif state.ready:
+        status = 'ready'
+    else:
+        status = 'starting'
+    response = jsonify({'status': status, 'pid': os.getpid()})
+    response.status_code = 200 if status == 'ready' else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def init_app(app):
+    app.extensions['readiness'] = Readiness()
+    app.add_url_rule('/ready', 'ready', ready_view)
@@ -0,0 +1,106 @@
+# Generazione delle versioni ridotte (miniatura, anteprima, WebP) delle immagini caricate
+import os
+
+from PIL import Image, ImageOps
+
+# Varianti generate per ogni immagine: (nome, lato massimo in pixel).
+# La miniatura copre il riquadro .card-thumbnail (180px) anche con lo zoom
+# al passaggio del mouse; l'anteprima è la versione per schermi ad alta densità.
+DERIVATIVES = (('thumb', 240), ('medium', 480))
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+# Percorso (relativo a static/) di una variante: uploads/x.jpg -> uploads/x.thumb.webp
+def derivative_path(image_path, name, ext):
+    base, _ = os.path.splitext(image_path)
+    return f"{base}.{name}.{ext}"
+
+
+# Estensione usata per le varianti non WebP, compatibili con ogni browser
+def _fallback_ext(image_path):
+    ext = image_path.rsplit('.', 1)[-1].lower()
+    return 'jpg' if ext in ('jpg', 'jpeg') else 'png'
+
+
+def derivative_paths(image_path):
+    fallback = _fallback_ext(image_path)
+    paths = {}
+    for name, _ in DERIVATIVES:
+        paths[name] = derivative_path(image_path, name, fallback)
+        paths[f'{name}_webp'] = derivative_path(image_path, name, 'webp')
+    return paths
+
+
+# Crea tutte le varianti accanto all'originale. Restituisce False se
+# l'immagine non è leggibile (le pagine useranno l'originale).
+def generate_derivatives(static_folder, image_path):
+    source = os.path.join(static_folder, image_path)
+    paths = derivative_paths(image_path)
+    fallback = _fallback_ext(image_path)
+    try:
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    except (OSError, Image.DecompressionBombError):
+        return False
+
+    if fallback == 'jpg':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    for name, size in DERIVATIVES:
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        resized.save(os.path.join(static_folder, paths[f'{name}_webp']), 'WEBP', quality=WEBP_QUALITY, method=4)
+        if fallback == 'jpg':
+            resized.save(os.path.join(static_folder, paths[name]), 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        else:
+            resized.save(os.path.join(static_folder, paths[name]), 'PNG', optimize=True)
+    return True
+
+
+# Elimina le varianti di un'immagine (l'originale è gestito dal chiamante)
+def remove_derivatives(static_folder, image_path):
+    for path in derivative_paths(image_path).values():
+        full_path = os.path.join(static_folder, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+
+class DerivativeLookup:
+    def __init__(self, static_folder, counter):
+        self.static_folder = static_folder
+        # Versione del catalogo (contatore condiviso tra i processi): il
+        # rilascio di un'immagine la incrementa, quindi un risultato ricordato
+        # vale solo per la versione con cui è stato letto
+        self.counter = counter
+        # Solo i risultati positivi vengono ricordati: image_path -> (versione, varianti)
+        self._known = {}
+
+    # Varianti disponibili per un'immagine, o None se non sono state generate
+    def __call__(self, image_path):
+        if not image_path:
+            return None
+        # Letta prima del controllo sul disco: un'eliminazione successiva
+        # cambia la versione e invalida il risultato
+        version = self.counter.value
+        known = self._known.get(image_path)
+        if known is not None and known[0] == version:
+            return known[1]
+        paths = derivative_paths(image_path)
+        last = paths[f'{DERIVATIVES[-1][0]}_webp']
+        if not os.path.exists(os.path.join(self.static_folder, last)):
+            return None
+        self._known[image_path] = (version, paths)
+        return paths
+
+    def forget(self, image_path):
+        self._known.pop(image_path, None)
+
+
+def init_app(app):
+    lookup = DerivativeLookup(app.static_folder, app.extensions['shared_state'].counter('catalog'))
+    app.extensions['image_variants'] = lookup
+    app.jinja_env.globals['image_variants'] = lookup
@@ -0,0 +1,146 @@
+# Archivio delle immagini indirizzato per contenuto (SHA-256)
+import hashlib
+import os
+import tempfile
+
+from flask import current_app, request
+
+import images
+import jobqueue
+from db import get_db
+from pagecache import bump_catalog_version
+
+# Cartella (relativa a static/) che contiene le immagini salvate per digest
+CAS_DIR = 'uploads/cas'
+CHUNK_SIZE = 64 * 1024
+# Un file indirizzato per contenuto non cambia mai: può restare in cache un anno
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _extension(filename):
+    ext = filename.rsplit('.', 1)[1].lower()
+    return 'jpg' if ext == 'jpeg' else ext
+
+
+# Salva un upload calcolandone l'hash mentre viene scritto su disco.
+# Restituisce (image_path, nuovo): se la stessa immagine era già presente
+# il file temporaneo viene scartato e si riusa quello esistente.
+def store_upload(static_folder, file):
+    ext = _extension(file.filename)
+    upload_dir = os.path.join(static_folder, CAS_DIR)
+    os.makedirs(upload_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+
+        hexdigest = digest.hexdigest()
+        image_path = f"{CAS_DIR}/{hexdigest[:2]}/{hexdigest}.{ext}"
+        target = os.path.join(static_folder, image_path)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+            return image_path, False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        return image_path, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Rilascia un riferimento a un'immagine: il file (con le sue varianti) viene
+# eliminato solo quando nessuna carta usa più quel percorso. Va chiamata dopo
+# il commit che ha tolto il riferimento. Restituisce True se il file è stato rimosso.
+# Conteggio ed eliminazione avvengono con il lock di scrittura del database:
+# una carta che inizia a usare la stessa immagine viene salvata o prima (e il
+# file resta) o dopo, e allora ensure_stored() lo trova mancante.
+def release(conn, static_folder, image_path):
+    if not image_path:
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT COUNT(*) FROM products WHERE image_path = ?", (image_path,)).fetchone()
+        if row[0]:
+            return False
+        full_path = os.path.join(static_folder, image_path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+        images.remove_derivatives(static_folder, image_path)
+        return True
+    finally:
+        conn.commit()
+
+
+# Da chiamare dopo l'INSERT o l'UPDATE che salva image_path nella carta, prima
+# del commit: la transazione ha già il lock di scrittura, quindi un rilascio
+# concorrente è terminato. Se ha eliminato il file appena riusato da
+# store_upload() (stessa immagine dell'ultima carta eliminata), lo si riscrive.
+def ensure_stored(static_folder, image_path, file):
+    if not os.path.exists(os.path.join(static_folder, image_path)):
+        file.stream.seek(0)
+        store_upload(static_folder, file)
+
+
+# Accoda la generazione delle varianti: va chiamata nella stessa transazione
+# che salva la carta con image_status = 'pending'
+def schedule_derivatives(conn, image_path):
+    jobqueue.enqueue(conn, 'derivatives', image_path=image_path)
+
+
+# Accoda il rilascio di un'immagine non più usata da una carta
+def schedule_release(conn, image_path):
+    if image_path:
+        jobqueue.enqueue(conn, 'release', image_path=image_path)
+
+
+def _set_image_status(image_path, status):
+    conn = get_db()
+    conn.execute("UPDATE products SET image_status = ? WHERE image_path = ?", (status, image_path))
+    conn.commit()
+    # Le pagine in cache vanno rigenerate con le nuove varianti
+    bump_catalog_version()
+
+
+# Lavoro 'derivatives': le varianti già presenti non vengono rigenerate
+def _build_derivatives(image_path):
+    static_folder = current_app.static_folder
+    ready = (current_app.extensions['image_variants'](image_path) is not None
+             or images.generate_derivatives(static_folder, image_path))
+    # Un file illeggibile non migliora riprovando
+    _set_image_status(image_path, 'ready' if ready else 'failed')
+
+
+def _derivatives_failed(image_path):
+    _set_image_status(image_path, 'failed')
+
+
+# Lavoro 'release'
+def _release(image_path):
+    if release(get_db(), current_app.static_folder, image_path):
+        current_app.extensions['image_variants'].forget(image_path)
+        # Anche gli altri processi smettono di usare le varianti che
+        # ricordavano per questa immagine (vedi images.DerivativeLookup)
+        bump_catalog_version()
+
+
+def is_content_addressed(path):
+    return path.startswith(CAS_DIR + '/')
+
+
+def init_app(app):
+    jobs = app.extensions['jobs']
+    jobs.register('derivatives', _build_derivatives, on_failure=_derivatives_failed)
+    jobs.register('release', _release)
+
+    @app.after_request
+    def immutable_cache_headers(response):
+        if (request.endpoint == 'static' and response.status_code == 200
+                and is_content_addressed(request.view_args.get('filename', ''))):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            response.headers.pop('Expires', None)
+        return response
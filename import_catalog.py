@@ -0,0 +1,34 @@
+import argparse
+import sys
+
+import catalog_import
+import db
+from app import create_app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Importa carte da un file CSV o NDJSON")
+    parser.add_argument('path', help="file da importare (.csv, .ndjson o .jsonl)")
+    parser.add_argument('--format', choices=catalog_import.FORMATS,
+                        help="formato del file (di default dedotto dall'estensione)")
+    parser.add_argument('--chunk-size', type=int, default=catalog_import.CHUNK_SIZE,
+                        help="righe scritte in ogni transazione")
+    args = parser.parse_args()
+
+    fmt = args.format or catalog_import.detect_format(args.path)
+    if not fmt:
+        parser.error("impossibile dedurre il formato, usa --format")
+
+    # I worker in esecuzione vedono l'import dalla tabella catalog_versions,
+    # aggiornata dai trigger (vedi catalog_versions.py)
+    app = create_app({'JOBS_ENABLED': False})
+    conn = db.connect(app.config['DATABASE'])
+    with open(args.path, 'rb') as stream:
+        result = catalog_import.import_catalog(conn, stream, fmt, args.chunk_size)
+    conn.close()
+
+    for line, message in result.errors:
+        print(f"riga {line}: {message}", file=sys.stderr)
+    print(f"Imported {result.imported} rows, {result.failed} failed, "
+          f"{result.categories_created} categories created.")
+    if result.failed:
+        sys.exit(1)
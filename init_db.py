@@ -1,6 +1,84 @@
-from app import init_db
+import argparse
+import getpass
+import os
+import sys
+
+import catalog_stats
+import db
+import images
+import migrations
+import users
+from app import create_app
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inizializza il database e applica le migrazioni")
+    parser.add_argument('--check-plans', action='store_true',
+                        help="verifica con EXPLAIN QUERY PLAN che le query principali usino gli indici")
+    parser.add_argument('--check-stats', action='store_true',
+                        help="confronta il riepilogo per espansione con il contenuto di products")
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help="ricalcola da zero il riepilogo per espansione")
+    parser.add_argument('--create-admin', nargs='?', const='admin', metavar='USERNAME',
+                        help="crea l'utente amministratore (o ne cambia la password); la password"
+                             " si legge da CARTE_ADMIN_PASSWORD o viene chiesta")
+    parser.add_argument('--build-derivatives', action='store_true',
+                        help="genera le miniature e le versioni WebP delle immagini già caricate")
+    args = parser.parse_args()
+
     print("Initializing database...")
-    init_db()
-    print("Database initialization completed.")
\ No newline at end of file
+    # Lo schema viene creato o aggiornato da create_app
+    app = create_app({'JOBS_ENABLED': False})
+    print("Database initialization completed.")
+
+    if args.create_admin:
+        password = os.environ.get('CARTE_ADMIN_PASSWORD')
+        if not password:
+            password = getpass.getpass(f"Password for {args.create_admin}: ")
+            if password != getpass.getpass("Repeat password: "):
+                sys.exit("Passwords do not match.")
+        if not password:
+            sys.exit("Empty password.")
+        conn = db.connect(app.config['DATABASE'])
+        with conn:
+            created = users.set_password(conn, args.create_admin, password)
+        conn.close()
+        print(f"User {args.create_admin} {'created' if created else 'updated'}.")
+
+    if args.check_plans:
+        conn = db.connect(app.config['DATABASE'])
+        problems = migrations.check_query_plans(conn)
+        conn.close()
+        for description, detail in problems:
+            print(f"[{description}] {detail}")
+        if problems:
+            sys.exit(1)
+        print("Query plans OK.")
+
+    if args.check_stats or args.rebuild_stats:
+        conn = db.connect(app.config['DATABASE'])
+        problems = catalog_stats.check_stats(conn)
+        for category_id, field, stored, expected in problems:
+            print(f"[category {category_id}] {field}: {stored} (expected {expected})")
+        if args.rebuild_stats:
+            with conn:
+                catalog_stats.rebuild_stats(conn)
+            print(f"Category stats rebuilt ({len(problems)} differences fixed).")
+        elif problems:
+            conn.close()
+            sys.exit(1)
+        else:
+            print("Category stats OK.")
+        conn.close()
+
+    if args.build_derivatives:
+        conn = db.connect(app.config['DATABASE'])
+        rows = conn.execute("SELECT DISTINCT image_path FROM products WHERE image_path IS NOT NULL").fetchall()
+        built = 0
+        for row in rows:
+            ready = images.generate_derivatives(app.static_folder, row['image_path'])
+            built += ready
+            conn.execute("UPDATE products SET image_status = ? WHERE image_path = ?",
+                         ('ready' if ready else 'failed', row['image_path']))
+        conn.commit()
+        conn.close()
+        print(f"Derivatives built for {built} of {len(rows)} images.")
@@ -0,0 +1,170 @@
+# Coda di lavori in background: i lavori sono righe della tabella jobs
+# (sopravvivono ai riavvii) eseguite da un pool di thread nel processo.
+import atexit
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from db import get_db
+
+log = logging.getLogger(__name__)
+
+WORKERS = 2
+# Attesa massima tra due controlli della tabella quando nessuno sveglia il dispatcher
+POLL_INTERVAL = 5.0
+MAX_ATTEMPTS = 3
+# Un lavoro 'running' il cui processo è morto torna disponibile dopo questo tempo
+LEASE_SECONDS = 300
+RETRY_DELAY = 10.0
+
+
+# Accoda un lavoro sulla connessione indicata senza fare commit: il lavoro
+# diventa visibile insieme alle modifiche che lo hanno generato.
+def enqueue(conn, kind, **payload):
+    conn.execute("INSERT INTO jobs (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload)))
+
+
+# Da chiamare dopo il commit per far partire subito i lavori appena accodati
+def wake():
+    queue = current_app.extensions.get('jobs')
+    if queue is not None:
+        queue.wake()
+
+
+class JobQueue:
+    def __init__(self, app, workers=WORKERS):
+        self.app = app
+        self.workers = workers
+        self._handlers = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._slots = threading.Semaphore(workers)
+        self._executor = None
+        self._dispatcher = None
+
+    # handler(**payload) viene eseguito in un contesto dell'applicazione;
+    # on_failure(**payload) quando i tentativi sono esauriti.
+    def register(self, kind, handler, on_failure=None):
+        self._handlers[kind] = (handler, on_failure)
+
+    def start(self):
+        if self._dispatcher is not None:
+            return
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='job')
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    # Termina il dispatcher e attende i lavori in corso
+    def stop(self):
+        if self._dispatcher is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        self._dispatcher = None
+
+    def wake(self):
+        self._wake.set()
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self._claim()
+            except Exception:
+                log.exception("lettura della coda dei lavori non riuscita")
+                claimed = []
+            for job in claimed:
+                try:
+                    self._executor.submit(self._run, job)
+                except RuntimeError:
+                    # L'interprete sta terminando e il pool è già chiuso: il
+                    # lavoro verrà ripreso alla scadenza della prenotazione
+                    self._slots.release()
+                    return
+            if not claimed:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+
+    # Prenota tanti lavori quanti sono i thread liberi
+    def _claim(self):
+        free = 0
+        while free < self.workers and self._slots.acquire(blocking=False):
+            free += 1
+        if not free:
+            # Tutti i thread sono occupati: si riprova quando uno si libera
+            self._slots.acquire()
+            self._slots.release()
+            return []
+        try:
+            with self.app.app_context():
+                conn = get_db()
+                now = time.time()
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute(
+                    "SELECT * FROM jobs"
+                    " WHERE (status = 'pending' AND run_after <= ?) OR (status = 'running' AND locked_until < ?)"
+                    " ORDER BY id LIMIT ?", (now, now, free)).fetchall()
+                conn.executemany(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                    [(now + LEASE_SECONDS, row['id']) for row in rows])
+                conn.commit()
+        except BaseException:
+            rows = []
+            raise
+        finally:
+            # Restituisce i posti non usati
+            for _ in range(free - len(rows)):
+                self._slots.release()
+        return rows
+
+    def _run(self, job):
+        handler, on_failure = self._handlers.get(job['kind'], (None, None))
+        payload = json.loads(job['payload'])
+        try:
+            with self.app.app_context():
+                conn = get_db()
+                try:
+                    if handler is None:
+                        raise LookupError(f"tipo di lavoro sconosciuto: {job['kind']}")
+                    handler(**payload)
+                except Exception as e:
+                    conn.rollback()
+                    log.exception("lavoro non riuscito", extra={'job_id': job['id'], 'kind': job['kind']})
+                    # attempts è il valore letto prima della prenotazione
+                    if job['attempts'] + 1 >= MAX_ATTEMPTS:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'failed', last_error = ?, finished_at = CURRENT_TIMESTAMP"
+                            " WHERE id = ?", (repr(e), job['id']))
+                        if on_failure is not None:
+                            on_failure(**payload)
+                    else:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'pending', last_error = ?, run_after = ? WHERE id = ?",
+                            (repr(e), time.time() + RETRY_DELAY * (job['attempts'] + 1), job['id']))
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'done', last_error = NULL, finished_at = CURRENT_TIMESTAMP"
+                        " WHERE id = ?", (job['id'],))
+                conn.commit()
+        except Exception:
+            log.exception("aggiornamento dello stato del lavoro non riuscito", extra={'job_id': job['id']})
+        finally:
+            self._slots.release()
+            self._wake.set()
+
+
+def init_app(app):
+    app.extensions['jobs'] = JobQueue(app, app.config.get('JOB_WORKERS', WORKERS))
+
+
+# Avvia il dispatcher: va chiamata quando la tabella jobs esiste già
+def start(app):
+    queue = app.extensions['jobs']
+    if app.config.get('JOBS_ENABLED', True):
+        queue.start()
+        atexit.register(queue.stop)
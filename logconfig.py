@@ -0,0 +1,114 @@
+# Log strutturati in JSON scritti da un thread separato (QueueHandler/QueueListener)
+import atexit
+import copy
+import json
+import logging
+import queue
+import re
+import secrets
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+# Campi mai scritti in chiaro nei log
+SENSITIVE_KEYS = frozenset({'pin', 'verification_code', 'password', 'session', 'secret', 'token', 'cookie'})
+REDACTED = '[redacted]'
+# Un X-Request-ID ricevuto dal proxy viene accettato solo se ha questa forma
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributi standard di LogRecord: tutto il resto arriva da extra={...}
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'request_id'}
+
+
+def _redact(key, value):
+    if key.lower() in SENSITIVE_KEYS:
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: _redact(k, v) for k, v in value.items()}
+    return value
+
+
+# Una riga JSON per record
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = _redact(key, value)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Sul thread della richiesta fa solo il minimo indispensabile: aggiunge l'id
+# della richiesta e risolve gli argomenti. Serializzazione e scrittura
+# avvengono nel thread del listener.
+class RequestQueueHandler(QueueHandler):
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.request_id = g.get('request_id') if has_request_context() else None
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Il traceback trattiene i frame: va convertito in testo subito
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# Il logging è unico per processo: un'altra applicazione creata nello stesso
+# processo (test, script) sostituisce il listener precedente
+_listener = None
+
+
+# Ferma il listener scrivendo i record rimasti in coda (si può chiamare più volte)
+def stop_listener(listener):
+    if listener._thread is not None:
+        listener.stop()
+
+
+def init_app(app):
+    if 'log_listener' in app.extensions:
+        return
+    if app.config.get('LOG_FILE'):
+        output = logging.FileHandler(app.config['LOG_FILE'], encoding='utf-8')
+    else:
+        output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    # Svuota la coda prima che il processo termini
+    atexit.register(stop_listener, listener)
+    app.extensions['log_listener'] = listener
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(RequestQueueHandler(log_queue))
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+
+    global _listener
+    if _listener is not None:
+        stop_listener(_listener)
+    _listener = listener
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get('X-Request-ID', '')
+        g.request_id = incoming if REQUEST_ID_RE.match(incoming) else secrets.token_hex(8)
+
+    @app.after_request
+    def expose_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
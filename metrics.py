@@ -0,0 +1,220 @@
+# Metriche di latenza per rotta, tempo SQL e render dei template (formato Prometheus).
+# I valori sono di un solo processo: con serve.py ogni worker ha i propri e
+# ogni campione porta l'etichetta pid, così i contatori di worker diversi non
+# si confondono (Prometheus li somma con sum without (pid)).
+import os
+import sqlite3
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from time import perf_counter
+
+from flask import Response, abort, before_render_template, g, has_request_context, request, session, template_rendered
+
+# Limiti superiori (in secondi) dei bucket degli istogrammi
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Indirizzi da cui /metrics si legge senza login (collector sulla stessa macchina)
+METRICS_ALLOWED_ADDRS = ('127.0.0.1', '::1')
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(Histogram)        # (endpoint, method, status)
+        self.sql_statements = defaultdict(int)        # endpoint
+        self.sql_seconds = defaultdict(float)         # endpoint
+        self.sql_per_request = defaultdict(Histogram)  # endpoint
+        self.templates = defaultdict(Histogram)       # nome del template
+
+    def observe_request(self, endpoint, method, status, duration, sql_count, sql_time):
+        with self._lock:
+            self.requests[(endpoint, method, status)].observe(duration)
+            self.sql_statements[endpoint] += sql_count
+            self.sql_seconds[endpoint] += sql_time
+            self.sql_per_request[endpoint].observe(sql_time)
+
+    def observe_template(self, name, duration):
+        with self._lock:
+            self.templates[name].observe(duration)
+
+    def _histogram_lines(self, name, series):
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                yield f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}'
+            yield f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram.count}'
+            yield f'{name}_sum{_labels(**labels)} {histogram.sum}'
+            yield f'{name}_count{_labels(**labels)} {histogram.count}'
+
+    # Testo nel formato di esposizione di Prometheus (versione 0.0.4)
+    def render(self):
+        pid = os.getpid()
+        with self._lock:
+            lines = [
+                '# HELP http_request_duration_seconds Latenza delle richieste per rotta.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            lines.extend(self._histogram_lines('http_request_duration_seconds', (
+                (dict(endpoint=e, method=m, status=s, pid=pid), h) for (e, m, s), h in sorted(self.requests.items())
+            )))
+            lines += [
+                '# HELP db_statements_total Istruzioni SQL eseguite per rotta.',
+                '# TYPE db_statements_total counter',
+            ]
+            lines.extend(f'db_statements_total{_labels(endpoint=e, pid=pid)} {n}' for e, n in sorted(self.sql_statements.items()))
+            lines += [
+                '# HELP db_statement_seconds_total Tempo speso in SQL per rotta (esecuzione e lettura delle righe).',
+                '# TYPE db_statement_seconds_total counter',
+            ]
+            lines.extend(f'db_statement_seconds_total{_labels(endpoint=e, pid=pid)} {t}' for e, t in sorted(self.sql_seconds.items()))
+            lines += [
+                '# HELP db_request_seconds Tempo SQL per singola richiesta.',
+                '# TYPE db_request_seconds histogram',
+            ]
+            lines.extend(self._histogram_lines('db_request_seconds', (
+                (dict(endpoint=e, pid=pid), h) for e, h in sorted(self.sql_per_request.items())
+            )))
+            lines += [
+                '# HELP template_render_seconds Tempo di render dei template.',
+                '# TYPE template_render_seconds histogram',
+            ]
+            lines.extend(self._histogram_lines('template_render_seconds', (
+                (dict(template=t, pid=pid), h) for t, h in sorted(self.templates.items())
+            )))
+        return '\n'.join(lines) + '\n'
+
+
+# Somma il tempo di un'istruzione SQL ai totali della richiesta corrente;
+# statements è 0 per la lettura delle righe di un'istruzione già contata
+def _record_sql(duration, statements=1):
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + statements
+        g.sql_time = g.get('sql_time', 0.0) + duration
+
+
+# SQLite esegue la query un po' alla volta mentre si leggono le righe: oltre
+# a execute si misurano anche fetch* e l'iterazione sul cursore
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_sql(perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_sql(perf_counter() - start)
+
+    def fetchone(self):
+        start = perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record_sql(perf_counter() - start, 0)
+
+    def fetchmany(self, size=None):
+        start = perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _record_sql(perf_counter() - start, 0)
+
+    def fetchall(self):
+        start = perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_sql(perf_counter() - start, 0)
+
+    def __next__(self):
+        start = perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _record_sql(perf_counter() - start, 0)
+
+
+# Connessione i cui cursori misurano ogni istruzione eseguita
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def init_app(app):
+    registry = Metrics()
+    app.extensions['metrics'] = registry
+    # Le nuove connessioni del pool saranno strumentate
+    app.extensions['db_pool'].factory = TimedConnection
+
+    @app.before_request
+    def start_timer():
+        g.request_start = perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('request_start', None)
+        if start is None:
+            return response
+        duration = perf_counter() - start
+        sql_count = g.get('sql_count', 0)
+        sql_time = g.get('sql_time', 0.0)
+        registry.observe_request(request.endpoint or 'none', request.method,
+                                 response.status_code, duration, sql_count, sql_time)
+        response.headers['Server-Timing'] = f'db;dur={sql_time * 1000:.2f}, app;dur={duration * 1000:.2f}'
+        return response
+
+    def template_started(sender, template, context, **extra):
+        g.setdefault('template_starts', []).append(perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        starts = g.get('template_starts')
+        if starts:
+            registry.observe_template(template.name or 'string', perf_counter() - starts.pop())
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    allowed = frozenset(app.config.get('METRICS_ALLOWED_ADDRS', METRICS_ALLOWED_ADDRS))
+
+    # Leggibile dall'amministratore o da un collector locale. Una richiesta
+    # inoltrata da un proxy sulla stessa macchina arriva da 127.0.0.1 ma porta
+    # X-Forwarded-For: non conta come locale.
+    def metrics_view():
+        local = request.remote_addr in allowed and 'X-Forwarded-For' not in request.headers
+        if not (local or 'user_id' in session):
+            abort(403)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
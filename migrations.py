@@ -0,0 +1,278 @@
+# Migrazioni versionate dello schema del database
+import re
+
+# Elenco ordinato delle migrazioni: (versione, descrizione, istruzioni SQL).
+# Una migrazione già applicata non va mai modificata: per cambiare lo schema
+# si aggiunge una nuova voce in fondo.
+MIGRATIONS = [
+    (1, 'indici per elenco carte, espansioni e ricerca', (
+        # index(), admin_products() e ricerca per nome: ORDER BY p.name, p.id
+        "CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)",
+        # category(): WHERE category_id = ? ORDER BY name, id
+        # admin_categories(): conteggio prodotti per categoria
+        "CREATE INDEX IF NOT EXISTS idx_products_category_name ON products (category_id, name)",
+        # search(): filtri e ordinamento per prezzo
+        "CREATE INDEX IF NOT EXISTS idx_products_price ON products (price)",
+        # search(): categoria + filtri/ordinamento per prezzo
+        "CREATE INDEX IF NOT EXISTS idx_products_category_price ON products (category_id, price)",
+    )),
+    (2, 'indice per il conteggio dei riferimenti alle immagini', (
+        # imagestore.release(): COUNT(*) WHERE image_path = ?
+        "CREATE INDEX IF NOT EXISTS idx_products_image_path ON products (image_path)",
+    )),
+    (3, 'coda dei lavori in background e stato delle immagini', (
+        # jobqueue: un lavoro per riga, prenotato con status/locked_until
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after REAL NOT NULL DEFAULT 0,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after)",
+        # NULL se la carta non ha immagine, poi 'pending' -> 'ready' o 'failed'
+        "ALTER TABLE products ADD COLUMN image_status TEXT",
+        # Le immagini già caricate passano dalla coda per generare le varianti mancanti
+        "UPDATE products SET image_status = 'pending' WHERE image_path IS NOT NULL",
+        "INSERT INTO jobs (kind, payload)"
+        " SELECT 'derivatives', json_object('image_path', image_path)"
+        " FROM products WHERE image_path IS NOT NULL GROUP BY image_path",
+    )),
+    (4, 'riepilogo per espansione mantenuto dai trigger', (
+        # catalog_stats: una riga per espansione, 0 per le carte senza espansione
+        """
+        CREATE TABLE IF NOT EXISTS category_stats (
+            category_id INTEGER PRIMARY KEY,
+            product_count INTEGER NOT NULL DEFAULT 0,
+            price_sum REAL NOT NULL DEFAULT 0,
+            price_min REAL,
+            price_max REAL
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS category_stats_ai AFTER INSERT ON products BEGIN
+            INSERT INTO category_stats (category_id, product_count, price_sum, price_min, price_max)
+            VALUES (IFNULL(new.category_id, 0), 1, new.price, new.price, new.price)
+            ON CONFLICT (category_id) DO UPDATE SET
+                product_count = product_count + 1,
+                price_sum = price_sum + excluded.price_sum,
+                price_min = MIN(IFNULL(price_min, excluded.price_min), excluded.price_min),
+                price_max = MAX(IFNULL(price_max, excluded.price_max), excluded.price_max);
+        END
+        """,
+        # Dopo un'eliminazione minimo e massimo si rileggono da idx_products_category_price
+        """
+        CREATE TRIGGER IF NOT EXISTS category_stats_ad AFTER DELETE ON products BEGIN
+            UPDATE category_stats SET
+                product_count = product_count - 1,
+                price_sum = price_sum - old.price,
+                price_min = (SELECT MIN(price) FROM products WHERE category_id IS old.category_id),
+                price_max = (SELECT MAX(price) FROM products WHERE category_id IS old.category_id)
+            WHERE category_id = IFNULL(old.category_id, 0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS category_stats_au AFTER UPDATE OF price, category_id ON products BEGIN
+            UPDATE category_stats SET
+                product_count = product_count - 1,
+                price_sum = price_sum - old.price,
+                price_min = (SELECT MIN(price) FROM products WHERE category_id IS old.category_id),
+                price_max = (SELECT MAX(price) FROM products WHERE category_id IS old.category_id)
+            WHERE category_id = IFNULL(old.category_id, 0);
+            INSERT INTO category_stats (category_id, product_count, price_sum, price_min, price_max)
+            VALUES (IFNULL(new.category_id, 0), 1, new.price, new.price, new.price)
+            ON CONFLICT (category_id) DO UPDATE SET
+                product_count = product_count + 1,
+                price_sum = price_sum + excluded.price_sum,
+                price_min = MIN(IFNULL(price_min, excluded.price_min), excluded.price_min),
+                price_max = MAX(IFNULL(price_max, excluded.price_max), excluded.price_max);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS category_stats_category_ad AFTER DELETE ON categories BEGIN
+            DELETE FROM category_stats WHERE category_id = old.id;
+        END
+        """,
+        "INSERT INTO category_stats (category_id, product_count, price_sum, price_min, price_max)"
+        " SELECT IFNULL(category_id, 0), COUNT(*), SUM(price), MIN(price), MAX(price)"
+        " FROM products GROUP BY IFNULL(category_id, 0)",
+    )),
+    (5, 'sessioni lato server condivise tra i processi', (
+        # sessions: dati serializzati della sessione, id firmato nel cookie
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+        # Eliminazione periodica delle sessioni scadute
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
+    )),
+    (6, 'versioni del catalogo incrementate dai trigger', (
+        # catalog: qualunque modifica a carte o espansioni; suggest: nomi e codici.
+        # Le legge catalog_versions.sync, così anche le modifiche fatte da altri
+        # processi (import_catalog.py) invalidano le cache dei worker.
+        """
+        CREATE TABLE IF NOT EXISTS catalog_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT OR IGNORE INTO catalog_versions (name) VALUES ('catalog'), ('suggest')",
+        """
+        CREATE TRIGGER IF NOT EXISTS catalog_versions_ai AFTER INSERT ON products BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name IN ('catalog', 'suggest');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS catalog_versions_ad AFTER DELETE ON products BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name IN ('catalog', 'suggest');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS catalog_versions_au AFTER UPDATE ON products BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS catalog_versions_name_au AFTER UPDATE OF name, code ON products
+        WHEN old.name IS NOT new.name OR old.code IS NOT new.code BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = 'suggest';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS catalog_versions_category_ai AFTER INSERT ON categories BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS catalog_versions_category_ad AFTER DELETE ON categories BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS catalog_versions_category_au AFTER UPDATE ON categories BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        """,
+    )),
+]
+
+# Query rappresentative delle rotte, usate per verificare con
+# EXPLAIN QUERY PLAN che gli indici vengano effettivamente usati.
+# (descrizione, sql, parametri, ordinamento in memoria ammesso)
+PLAN_CHECKS = [
+    ('index / admin_products',
+     "SELECT p.*, c.name AS category_name FROM products p LEFT JOIN categories c ON p.category_id = c.id"
+     " WHERE (p.name, p.id) > (?, ?) ORDER BY p.name, p.id LIMIT 49",
+     ('', 0), False),
+    ('category',
+     "SELECT p.* FROM products p WHERE p.category_id = ? AND (p.name, p.id) > (?, ?)"
+     " ORDER BY p.name, p.id LIMIT 49",
+     (1, '', 0), False),
+    ('search prezzo crescente',
+     "SELECT p.*, c.name AS category_name FROM products p LEFT JOIN categories c ON p.category_id = c.id"
+     " WHERE p.price >= ? AND p.price <= ? ORDER BY p.price, p.id LIMIT 49",
+     (1.0, 10.0), False),
+    ('search categoria + prezzo decrescente',
+     "SELECT p.*, c.name AS category_name FROM products p LEFT JOIN categories c ON p.category_id = c.id"
+     " WHERE p.category_id = ? AND p.price >= ? ORDER BY p.price DESC, p.id DESC LIMIT 49",
+     (1, 1.0), False),
+    ('search faccette: carte per espansione',
+     "SELECT p.category_id, COUNT(*) AS hits FROM products p WHERE 1=1 AND p.price >= ?"
+     " AND p.category_id IS NOT NULL GROUP BY p.category_id",
+     (1.0,), False),
+    ('search faccette: fasce di prezzo di un\'espansione',
+     "SELECT CASE WHEN p.price < 1 THEN 0 ELSE 1 END AS bucket, COUNT(*) AS hits"
+     " FROM products p WHERE 1=1 AND p.category_id = ? GROUP BY bucket",
+     (1,), True),
+    ('admin_categories',
+     "SELECT c.*, IFNULL(s.product_count, 0) AS product_count FROM categories c"
+     " LEFT JOIN category_stats s ON s.category_id = c.id ORDER BY c.name",
+     (), True),
+    ("trigger category_stats: minimo dopo un'eliminazione",
+     "SELECT MIN(price) FROM products WHERE category_id IS ?",
+     (1,), False),
+]
+
+FULL_SCAN_RE = re.compile(r'^SCAN (p|products)$')
+
+# Versione dello schema richiesta da questo codice
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# Crea la tabella di versione se manca e restituisce la versione corrente
+def current_version(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+# Vero se il database ha già tutte le migrazioni. Non crea né modifica nulla:
+# all'avvio basta questa query per saltare le istruzioni di creazione.
+def schema_is_current(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone()
+    if row is None:
+        return False
+    version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    return (version or 0) >= LATEST_VERSION
+
+
+# Applica in ordine le migrazioni mancanti, ognuna nella propria transazione.
+# Il BEGIN esplicito serve perché il modulo sqlite3 apre da sé la transazione
+# solo prima di INSERT/UPDATE/DELETE: senza, CREATE e ALTER verrebbero
+# confermati subito e un errore lascerebbe lo schema a metà.
+# Restituisce l'elenco delle versioni applicate.
+def run_migrations(conn):
+    applied = []
+    version = current_version(conn)
+    conn.commit()
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (number, description),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(number)
+    if applied:
+        # Aggiorna le statistiche usate dal query planner
+        conn.execute("PRAGMA optimize")
+    return applied
+
+
+# Controlla i piani di esecuzione delle query in PLAN_CHECKS.
+# Restituisce una lista di (descrizione, problema); vuota se è tutto a posto.
+def check_query_plans(conn):
+    problems = []
+    for description, sql, params, allow_temp_sort in PLAN_CHECKS:
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[3]
+            if FULL_SCAN_RE.match(detail):
+                problems.append((description, detail))
+            elif 'TEMP B-TREE' in detail and not allow_temp_sort:
+                problems.append((description, detail))
+    return problems
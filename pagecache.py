@@ -0,0 +1,163 @@
+# Cache delle pagine pubbliche già renderizzate
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app, make_response, request, session
+
+# Numero massimo di pagine tenute in memoria
+PAGE_CACHE_SIZE = 256
+
+
+class CachedPage:
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        # Codifica (None per il corpo non compresso) -> corpo. Le versioni
+        # compresse si calcolano alla prima richiesta che le accetta, poi i
+        # hit le servono senza ricomprimere.
+        self.bodies = {None: body}
+
+    def body(self, encoding):
+        body = self.bodies.get(encoding)
+        if body is None:
+            body = current_app.extensions['compression'].compress(self.bodies[None], encoding)
+            self.bodies[encoding] = body
+        return body
+
+
+class PageCache:
+    def __init__(self, counter, epoch, max_entries=PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        # Versione del catalogo: cambia a ogni modifica fatta dall'amministrazione,
+        # in qualunque processo worker (contatore condiviso, vedi shared.py).
+        # L'epoca distingue le versioni di un avvio precedente.
+        self.counter = counter
+        self.epoch = epoch
+        self._seen = counter.value
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Letta a ogni richiesta: se un altro processo ha modificato il catalogo
+    # le pagine in memoria vengono scartate
+    @property
+    def version(self):
+        version = self.counter.value
+        if version != self._seen:
+            with self._lock:
+                if version != self._seen:
+                    self._seen = version
+                    self._entries.clear()
+        return version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def bump_version(self):
+        with self._lock:
+            self._seen = self.counter.increment()
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Parametri della query string normalizzati: ordinati e senza valori vuoti
+def normalized_args():
+    return tuple(sorted((k, v) for k, v in request.args.items(multi=True) if v != ''))
+
+
+# La chiave comprende la versione del catalogo letta a inizio richiesta: una
+# pagina renderizzata durante una modifica non viene mai servita dopo
+def make_key(version, key_args=normalized_args):
+    view_args = tuple(sorted((request.view_args or {}).items()))
+    return (version, request.endpoint, view_args, key_args())
+
+
+# Decoratore per le rotte pubbliche. Le pagine viste da un amministratore o
+# con messaggi flash in sospeso dipendono dalla sessione e non vanno in cache.
+# `key_args` calcola la parte della chiave che dipende dalla query string.
+def cached_page_by(key_args):
+    def decorator(view):
+        return _cached_view(view, key_args)
+    return decorator
+
+
+def _cached_view(view, key_args):
+    @functools.wraps(view)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' in session or '_flashes' in session:
+            return view(*args, **kwargs)
+
+        cache = current_app.extensions['page_cache']
+        key = make_key(cache.version, key_args)
+        entry = cache.get(key)
+        if entry is not None:
+            response = current_app.response_class(mimetype=entry.mimetype)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            entry = CachedPage(response.get_data(), response.mimetype)
+            cache.set(key, entry)
+
+        compression = current_app.extensions['compression']
+        encoding = compression.choose(entry.mimetype, len(entry.bodies[None]))
+        compression.set_body(response, entry.body(encoding), encoding)
+        return response
+    return decorated_function
+
+
+cached_page = cached_page_by(normalized_args)
+
+
+# Da chiamare dopo ogni commit che modifica carte o espansioni
+def bump_catalog_version():
+    current_app.extensions['page_cache'].bump_version()
+
+
+def catalog_version():
+    return current_app.extensions['page_cache'].version
+
+
+# ETag della risposta per l'URL corrente alla versione attuale del catalogo
+def catalog_etag():
+    cache = current_app.extensions['page_cache']
+    digest = hashlib.sha1(request.full_path.encode()).hexdigest()[:16]
+    return f"{cache.epoch}-{cache.version}-{digest}"
+
+
+# Decoratore per le API in sola lettura: se il client ha già la versione
+# corrente (If-None-Match) risponde 304 senza eseguire la vista. L'ETag è
+# debole perché lo stesso contenuto può arrivare compresso o no.
+def conditional_on_catalog(view):
+    @functools.wraps(view)
+    def decorated_function(*args, **kwargs):
+        etag = catalog_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return decorated_function
+
+
+def init_app(app):
+    state = app.extensions['shared_state']
+    app.extensions['page_cache'] = PageCache(
+        state.counter('catalog'), state.epoch, app.config.get('PAGE_CACHE_SIZE', PAGE_CACHE_SIZE))
@@ -0,0 +1,84 @@
+# Paginazione a cursore (keyset) per gli elenchi di carte
+import base64
+import json
+
+from flask import request, url_for
+
+# Numero di carte per pagina (multiplo di 3 per la griglia)
+PAGE_SIZE = 48
+
+
+class Page:
+    def __init__(self, items, next_url=None, prev_url=None):
+        self.items = items
+        self.next_url = next_url
+        self.prev_url = prev_url
+
+
+# Il cursore è la coppia (chiave di ordinamento, id) dell'ultima/prima riga
+def encode_cursor(value, row_id):
+    raw = json.dumps([value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(row_id, int) or not isinstance(value, (str, int, float)):
+        return None
+    return value, row_id
+
+
+# URL della stessa pagina con gli stessi filtri ma un cursore diverso
+def _page_url(param, token):
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args[param] = token
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+# Esegue `sql` (una SELECT con WHERE e senza ORDER BY) una pagina alla volta.
+# `sort_expr` è l'espressione su cui ordinare; l'id della carta (p.id)
+# rende l'ordinamento stabile anche a parità di nome o prezzo.
+# `sort_column` è la colonna della riga che contiene il valore di sort_expr.
+def paginate(cursor, sql, params, sort_expr, sort_column, descending=False, page_size=PAGE_SIZE):
+    after = decode_cursor(request.args.get('after', ''))
+    before = decode_cursor(request.args.get('before', '')) if not after else None
+
+    params = list(params)
+    # Per tornare indietro si scorre in senso inverso e si ribalta il risultato
+    backwards = before is not None
+    reverse = descending != backwards
+    seek = after or before
+    if seek:
+        sql += f" AND ({sort_expr}, p.id) {'<' if reverse else '>'} (?, ?)"
+        params.extend(seek)
+    direction = 'DESC' if reverse else 'ASC'
+    sql += f" ORDER BY {sort_expr} {direction}, p.id {direction} LIMIT ?"
+    params.append(page_size + 1)
+
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    # Scorrendo indietro la pagina successiva esiste sempre (è quella di
+    # partenza); scorrendo in avanti esiste sempre quella precedente
+    has_next = True if backwards else has_more
+    has_prev = has_more if backwards else after is not None
+
+    next_url = prev_url = None
+    if rows:
+        if has_next:
+            last = rows[-1]
+            next_url = _page_url('after', encode_cursor(last[sort_column], last['id']))
+        if has_prev:
+            first = rows[0]
+            prev_url = _page_url('before', encode_cursor(first[sort_column], first['id']))
+    return Page(rows, next_url, prev_url)
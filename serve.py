@@ -0,0 +1,333 @@
+# Server per la produzione: il processo master apre il socket e avvia N
+# worker con fork; ogni worker crea la propria applicazione, la prepara
+# (health.warmup) e serve le richieste con un pool di thread.
+#
+#   python serve.py --workers 4 --threads 8 --port 8000
+#
+# SIGHUP ricarica il codice del sito: applica le migrazioni, avvia una nuova
+# generazione di worker e, solo quando sono tutti pronti, chiede ai vecchi di
+# fermarsi. Il socket resta sempre aperto e i vecchi worker finiscono le
+# richieste in corso, quindi nessuna connessione va persa.
+# SIGTERM e SIGINT fermano tutto nello stesso modo ordinato.
+#
+# Il master importa solo la libreria standard e werkzeug: app e gli altri
+# moduli del sito si importano nei processi figli dopo il fork, così ogni
+# generazione legge il codice nuovo. Le modifiche a questo file e gli
+# aggiornamenti di werkzeug richiedono invece un riavvio completo.
+import argparse
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import secrets
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+log = logging.getLogger('serve')
+
+DEFAULT_THREADS = 8
+BACKLOG = 1024
+# Attesa massima della preparazione di un worker
+READY_TIMEOUT = 120.0
+# Attesa massima delle richieste in corso quando un worker si ferma
+GRACEFUL_TIMEOUT = 30.0
+POLL_INTERVAL = 0.2
+# Memoria per i contatori di shared.SharedState: una pagina basta per 512
+# contatori, anche se una versione caricata con un reload ne aggiunge
+SHARED_MEMORY_SIZE = mmap.PAGESIZE
+
+# Attributi standard di LogRecord: tutto il resto arriva da extra={...}
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message'}
+
+
+# Log JSON del master nello stesso formato di logconfig.JsonFormatter, che il
+# master non importa
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': None,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Memoria, lock ed epoch condivisi da tutte le generazioni di worker
+def create_shared_memory():
+    return mmap.mmap(-1, SHARED_MEMORY_SIZE), multiprocessing.Lock(), secrets.token_hex(4)
+
+
+# Nel processo figlio: lo stato condiviso costruito sulla memoria del master
+def _shared_state(memory):
+    import shared
+
+    buffer, lock, epoch = memory
+    return shared.SharedState(buffer=buffer, lock=lock, epoch=epoch)
+
+
+class RequestHandler(WSGIRequestHandler):
+    # Una richiesta per connessione: con il keep-alive una connessione
+    # inattiva terrebbe occupato un thread del pool
+    protocol_version = 'HTTP/1.0'
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, fd, threads):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='request')
+        # Con tutti i thread occupati il worker smette di accettare
+        # connessioni, che restano in coda per gli altri worker
+        self._slots = threading.Semaphore(threads)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+
+# Codice eseguito nel processo worker dopo il fork. L'applicazione viene
+# importata qui, così dopo un SIGHUP i nuovi worker leggono il codice nuovo.
+def run_worker(args, listener, memory, ready_fd):
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    import app as app_module
+    import health
+    import logconfig
+
+    application = app_module.create_app({'SHARED_STATE': _shared_state(memory)})
+    health.warmup(application)
+    server = PooledWSGIServer(args.host, args.port, application, listener.fileno(), args.threads)
+
+    def stop(signum, frame):
+        application.extensions['readiness'].draining = True
+        # shutdown() aspetta la fine di serve_forever: non può girare nel
+        # thread principale, che è dentro serve_forever
+        threading.Thread(target=server.shutdown, name='shutdown').start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+
+    server.serve_forever(poll_interval=0.5)
+    # Nessuna nuova connessione: si attendono le richieste in corso
+    server.pool.shutdown(wait=True)
+    server.server_close()
+    application.extensions['jobs'].stop()
+    logconfig.stop_listener(application.extensions['log_listener'])
+
+
+# Applica le migrazioni e genera gli asset con l'hash in un processo a parte,
+# una sola volta per avvio o reload, prima che partano i worker (che leggono
+# il manifest appena scritto)
+def migrate_worker(memory):
+    import app as app_module
+    import assets
+    import logconfig
+
+    application = app_module.create_app({'SHARED_STATE': _shared_state(memory), 'JOBS_ENABLED': False})
+    assets.build(application.static_folder, os.path.join(application.root_path, application.template_folder))
+    logconfig.stop_listener(application.extensions['log_listener'])
+
+
+class Master:
+    def __init__(self, args):
+        self.args = args
+        self.memory = create_shared_memory()
+        self.listener = socket.create_server((args.host, args.port), backlog=BACKLOG)
+        # pid -> generazione dei worker attivi
+        self.workers = {}
+        # pid -> istante oltre il quale il worker in chiusura viene ucciso
+        self.retiring = {}
+        self.generation = 0
+        self.stopping = False
+        self.reload_requested = False
+
+    def _fork(self, target, *target_args):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                target(*target_args)
+            except BaseException:
+                log.exception("processo figlio terminato con un errore", extra={'pid': os.getpid()})
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+
+    def migrate(self):
+        pid = self._fork(migrate_worker, self.memory)
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status) == 0
+
+    def _spawn(self):
+        read_fd, write_fd = os.pipe()
+        pid = self._fork(self._worker_main, read_fd, write_fd)
+        os.close(write_fd)
+        return pid, read_fd
+
+    def _worker_main(self, read_fd, write_fd):
+        os.close(read_fd)
+        run_worker(self.args, self.listener, self.memory, write_fd)
+
+    # Avvia count worker e attende che siano pronti. Restituisce i pid, o
+    # None se qualcuno non si è preparato in tempo (vengono tutti fermati).
+    def spawn(self, count):
+        pending = dict(self._spawn() for _ in range(count))
+        pids = list(pending)
+        waiting = {read_fd: pid for pid, read_fd in pending.items()}
+        deadline = time.monotonic() + READY_TIMEOUT
+        failed = False
+        while waiting and not failed:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                failed = True
+                break
+            readable, _, _ = select.select(list(waiting), [], [], timeout)
+            for read_fd in readable:
+                # Un byte se il worker è pronto, fine del file se è terminato
+                failed = failed or os.read(read_fd, 1) != b'1'
+                os.close(read_fd)
+                del waiting[read_fd]
+        for read_fd in waiting:
+            os.close(read_fd)
+        if failed:
+            for pid in pids:
+                self._signal(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            return None
+        return pids
+
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def start(self):
+        if not self.migrate():
+            sys.exit("Migrazioni non riuscite: server non avviato.")
+        pids = self.spawn(self.args.workers)
+        if pids is None:
+            sys.exit("I worker non si sono avviati.")
+        self.workers = dict.fromkeys(pids, self.generation)
+        log.info("server avviato", extra={
+            'pid': os.getpid(), 'address': f"{self.args.host}:{self.args.port}",
+            'workers': self.args.workers, 'threads': self.args.threads})
+
+    def reload(self):
+        log.info("reload richiesto", extra={'generation': self.generation + 1})
+        if not self.migrate():
+            log.error("reload annullato: migrazioni non riuscite")
+            return
+        pids = self.spawn(self.args.workers)
+        if pids is None:
+            log.error("reload annullato: i nuovi worker non si sono avviati")
+            return
+        self.generation += 1
+        self.retire(list(self.workers))
+        self.workers = dict.fromkeys(pids, self.generation)
+        log.info("reload completato", extra={'generation': self.generation, 'workers': pids})
+
+    # Chiede ai worker di fermarsi dopo le richieste in corso
+    def retire(self, pids):
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        for pid in pids:
+            self._signal(pid, signal.SIGTERM)
+            self.retiring[pid] = deadline
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.pop(pid, None)
+            if pid in self.workers:
+                generation = self.workers.pop(pid)
+                log.error("worker terminato inaspettatamente",
+                          extra={'worker': pid, 'exit_code': os.waitstatus_to_exitcode(status)})
+                if not self.stopping:
+                    replacement = self.spawn(1)
+                    if replacement:
+                        self.workers[replacement[0]] = generation
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                log.warning("worker ucciso: richieste in corso oltre il limite", extra={'worker': pid})
+                self._signal(pid, signal.SIGKILL)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        self.start()
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self.reap()
+            time.sleep(POLL_INTERVAL)
+        self.retire(list(self.workers))
+        self.workers = {}
+        while self.retiring:
+            self.reap()
+            time.sleep(POLL_INTERVAL)
+        self.listener.close()
+        log.info("server fermato")
+
+    def _on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Avvia il sito con più processi worker")
+    parser.add_argument('--host', default='127.0.0.1', help="indirizzo su cui ascoltare")
+    parser.add_argument('--port', type=int, default=8000, help="porta su cui ascoltare")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processi worker")
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help="thread per worker")
+    args = parser.parse_args(argv)
+
+    # Log JSON anche dal master; i worker li sostituiscono con i propri
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+    logging.basicConfig(level=logging.INFO, handlers=[output])
+
+    Master(args).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# Sessioni lato server: il cookie contiene solo un id firmato, i dati stanno
+# in uno store condiviso (di default la tabella sessions del database, in
+# WAL) così più processi vedono le stesse sessioni e un riavvio non le perde.
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+import db
+
+# Ogni quanto al massimo un processo elimina le sessioni scadute
+EVICT_INTERVAL = 300.0
+# Una sessione non modificata viene riscritta (allungandone la scadenza)
+# solo quando è trascorsa questa frazione della sua durata
+REFRESH_FRACTION = 0.5
+# Connessioni tenute dal pool dello store SQLite
+SESSION_POOL_SIZE = 2
+
+
+# Chiave segreta condivisa: se non è configurata viene generata una volta e
+# salvata in un file leggibile solo dal proprietario. Il primo processo che
+# la crea vince, gli altri leggono la sua.
+def load_secret_key(path):
+    try:
+        with open(path, encoding='ascii') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    key = secrets.token_hex(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return load_secret_key(path)
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(key)
+    return key
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.rotate = False
+
+    # Assegna un nuovo id al prossimo salvataggio (da chiamare al login,
+    # così un id ottenuto prima dell'accesso non vale per l'utente autenticato)
+    def regenerate(self):
+        self.rotate = True
+        self.modified = True
+
+
+# Store in memoria, utile nei test o con un solo processo
+class MemorySessionStore:
+    def __init__(self, app):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def load(self, sid, now):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is not None and entry[1] <= now:
+                del self._data[sid]
+                return None
+            return entry
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._data[sid] = (data, expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def evict(self, now):
+        with self._lock:
+            for sid in [sid for sid, (_, expires_at) in self._data.items() if expires_at <= now]:
+                del self._data[sid]
+
+
+# Store nella tabella sessions (migrazione 5), con un pool di connessioni
+# separato da quello delle rotte: il commit della sessione non deve mai
+# includere modifiche lasciate a metà da una richiesta.
+class SQLiteSessionStore:
+    def __init__(self, app):
+        self.pool = db.ConnectionPool(app.config['DATABASE'], app.config.get('SESSION_POOL_SIZE', SESSION_POOL_SIZE))
+
+    def load(self, sid, now):
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute("SELECT data, expires_at FROM sessions WHERE id = ?", (sid,)).fetchone()
+            if row is None:
+                return None
+            if row['expires_at'] <= now:
+                with conn:
+                    conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+                return None
+            return row['data'], row['expires_at']
+        finally:
+            self.pool.release(conn)
+
+    def save(self, sid, data, expires_at):
+        conn = self.pool.acquire()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+                    (sid, data, expires_at))
+        finally:
+            self.pool.release(conn)
+
+    def delete(self, sid):
+        conn = self.pool.acquire()
+        try:
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+        finally:
+            self.pool.release(conn)
+
+    def evict(self, now):
+        conn = self.pool.acquire()
+        try:
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        finally:
+            self.pool.release(conn)
+
+
+# Valori ammessi per SESSION_BACKEND
+BACKENDS = {
+    'sqlite': SQLiteSessionStore,
+    'memory': MemorySessionStore,
+}
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+        self._evict_lock = threading.Lock()
+        self._next_evict = 0.0
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session')
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    # Le sessioni scadute si eliminano al più una volta ogni EVICT_INTERVAL,
+    # durante il salvataggio di una sessione: nessun thread dedicato
+    def _maybe_evict(self, now):
+        if now < self._next_evict or not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_evict = now + EVICT_INTERVAL
+            self.store.evict(now)
+        finally:
+            self._evict_lock.release()
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return ServerSession()
+        try:
+            sid = self._signer(app).unsign(cookie).decode('ascii')
+        except BadSignature:
+            return ServerSession()
+        entry = self.store.load(sid, time.time())
+        if entry is None:
+            return ServerSession()
+        data, expires_at = entry
+        return ServerSession(self.serializer.loads(data), sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = time.time()
+
+        # Sessione svuotata (logout): si elimina dallo store e dal browser
+        if not session:
+            if session.modified and session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        lifetime = self._lifetime(app)
+        stale = session.expires_at is not None and session.expires_at - now < lifetime * REFRESH_FRACTION
+        if not (session.modified or stale):
+            return
+
+        if session.new and '_permanent' not in session:
+            session.permanent = app.config.get('SESSION_PERMANENT', True)
+        if session.rotate and session.sid is not None:
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        session.rotate = False
+        session.expires_at = now + lifetime
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), session.expires_at)
+        self._maybe_evict(now)
+
+        response.vary.add('Cookie')
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode('ascii')).decode('ascii'),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            partitioned=self.get_cookie_partitioned(app),
+        )
+
+
+def init_app(app):
+    backend = app.config.get('SESSION_BACKEND', 'sqlite')
+    if backend not in BACKENDS:
+        raise ValueError(f"SESSION_BACKEND non valido: {backend}")
+    app.session_interface = ServerSessionInterface(BACKENDS[backend](app))
@@ -0,0 +1,72 @@
+# Stato condiviso tra i processi worker avviati da serve.py: contatori in
+# memoria anonima creata dal master prima del fork, quindi visibili a tutti
+# i worker (anche a quelli avviati dopo un reload). Con un solo processo
+# (server di sviluppo, script, test) funziona allo stesso modo.
+import mmap
+import multiprocessing
+import secrets
+import struct
+
+# Contatori disponibili: versione del catalogo (pagine in cache ed ETag),
+# versione di nomi e codici (indice dei suggerimenti) e ultime versioni lette
+# dalla tabella catalog_versions (vedi catalog_versions.py). La posizione è
+# lo spostamento nella memoria condivisa: i nuovi contatori vanno in fondo,
+# così i worker avviati da un reload leggono gli stessi valori dei precedenti.
+COUNTERS = ('catalog', 'suggest', 'catalog_db', 'suggest_db')
+
+_SLOT = struct.Struct('q')
+
+
+class SharedCounter:
+    def __init__(self, buffer, offset, lock):
+        self._buffer = buffer
+        self._offset = offset
+        self._lock = lock
+
+    @property
+    def value(self):
+        # Una lettura allineata di 8 byte: non serve il lock
+        return _SLOT.unpack_from(self._buffer, self._offset)[0]
+
+    # Incrementa e restituisce il nuovo valore
+    def increment(self):
+        with self._lock:
+            value = _SLOT.unpack_from(self._buffer, self._offset)[0] + 1
+            _SLOT.pack_into(self._buffer, self._offset, value)
+            return value
+
+    # Imposta il valore; vero solo per il processo che lo ha cambiato
+    def update(self, value):
+        with self._lock:
+            if _SLOT.unpack_from(self._buffer, self._offset)[0] == value:
+                return False
+            _SLOT.pack_into(self._buffer, self._offset, value)
+            return True
+
+
+class SharedState:
+    # buffer, lock ed epoch si passano quando la memoria è stata creata
+    # altrove: il master di serve.py la crea senza importare questo modulo
+    def __init__(self, names=COUNTERS, buffer=None, lock=None, epoch=None):
+        size = _SLOT.size * len(names)
+        if buffer is None:
+            buffer = mmap.mmap(-1, size)
+        elif len(buffer) < size:
+            raise ValueError(f"memoria condivisa troppo piccola per {len(names)} contatori")
+        if lock is None:
+            lock = multiprocessing.Lock()
+        self._buffer = buffer
+        self.counters = {name: SharedCounter(self._buffer, index * _SLOT.size, lock)
+                         for index, name in enumerate(names)}
+        # Distingue le versioni di questo gruppo di processi da quelle di un
+        # avvio precedente (negli ETag)
+        self.epoch = epoch or secrets.token_hex(4)
+
+    def counter(self, name):
+        return self.counters[name]
+
+
+# Da chiamare prima delle estensioni che usano i contatori. serve.py passa lo
+# stato creato dal master in SHARED_STATE; altrimenti ogni app ha il proprio.
+def init_app(app):
+    app.extensions['shared_state'] = app.config.get('SHARED_STATE') or SharedState()
@@ -0,0 +1,28 @@
+// Immagine a tutto schermo al clic sulle miniature delle carte
+document.addEventListener('DOMContentLoaded', function() {
+    // Get the modal
+    const modal = document.getElementById('imageModal');
+    const modalImg = document.getElementById('modalImage');
+    const closeBtn = document.getElementsByClassName('close-modal')[0];
+    
+    // Add click event to all card thumbnails
+    const thumbnails = document.querySelectorAll('.card-thumbnail');
+    thumbnails.forEach(img => {
+        img.onclick = function() {
+            modal.style.display = "flex";
+            modalImg.src = this.dataset.full || this.src;
+        }
+    });
+    
+    // Close the modal when clicking the × button
+    closeBtn.onclick = function() {
+        modal.style.display = "none";
+    }
+    
+    // Close the modal when clicking outside the image
+    modal.onclick = function(event) {
+        if (event.target === modal) {
+            modal.style.display = "none";
+        }
+    }
+});
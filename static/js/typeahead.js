@@ -0,0 +1,95 @@
+// Suggerimenti durante la digitazione per la barra di ricerca
+document.addEventListener('DOMContentLoaded', function() {
+    const input = document.getElementById('navbarSearch');
+    const menu = document.getElementById('navbarSuggestions');
+    if (!input || !menu) {
+        return;
+    }
+
+    const DEBOUNCE_MS = 120;
+    let timer = null;
+    let controller = null;
+    let active = -1;
+
+    function close() {
+        menu.hidden = true;
+        menu.innerHTML = '';
+        active = -1;
+    }
+
+    function highlight(index) {
+        const items = menu.querySelectorAll('li');
+        items.forEach((item, i) => item.classList.toggle('active', i === index));
+        active = index;
+    }
+
+    function render(suggestions) {
+        menu.innerHTML = '';
+        suggestions.forEach(suggestion => {
+            const item = document.createElement('li');
+            item.setAttribute('role', 'option');
+            const link = document.createElement('a');
+            link.href = suggestion.url;
+            link.textContent = suggestion.label;
+            const detail = document.createElement('span');
+            detail.className = 'typeahead-detail';
+            detail.textContent = suggestion.type === 'code' ? suggestion.name : suggestion.count + ' carte';
+            link.appendChild(detail);
+            item.appendChild(link);
+            menu.appendChild(item);
+        });
+        menu.hidden = suggestions.length === 0;
+        active = -1;
+    }
+
+    function fetchSuggestions() {
+        const query = input.value.trim();
+        if (!query) {
+            close();
+            return;
+        }
+        // Una risposta arrivata tardi non deve sovrascrivere quella più recente
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        fetch(input.dataset.suggestUrl + '?q=' + encodeURIComponent(query), {signal: controller.signal})
+            .then(response => response.json())
+            .then(data => render(data.suggestions))
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    close();
+                }
+            });
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, DEBOUNCE_MS);
+    });
+
+    input.addEventListener('keydown', function(event) {
+        const items = menu.querySelectorAll('li');
+        if (menu.hidden || !items.length) {
+            return;
+        }
+        if (event.key === 'ArrowDown') {
+            event.preventDefault();
+            highlight((active + 1) % items.length);
+        } else if (event.key === 'ArrowUp') {
+            event.preventDefault();
+            highlight((active - 1 + items.length) % items.length);
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault();
+            window.location.href = items[active].querySelector('a').href;
+        } else if (event.key === 'Escape') {
+            close();
+        }
+    });
+
+    document.addEventListener('click', function(event) {
+        if (!menu.contains(event.target) && event.target !== input) {
+            close();
+        }
+    });
+});
@@ -0,0 +1,216 @@
+# Suggerimenti durante la digitazione: indice in memoria dei prefissi di
+# nomi e codici delle carte, senza interrogare il database a ogni tasto
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left
+
+import db
+
+log = logging.getLogger(__name__)
+
+# Suggerimenti restituiti al massimo
+TOP_K = 8
+# Voci esaminate al massimo per prefisso prima di ordinarle: limita il
+# lavoro per i prefissi molto corti (una sola lettera)
+SCAN_LIMIT = 256
+MAX_QUERY_LENGTH = 64
+
+
+# Minuscolo e senza accenti, come il tokenizer dell'indice FTS
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).strip()
+
+
+# Coppie (chiave, valore) ordinate per chiave, con ricerca per prefisso via bisect
+class SortedPrefixList:
+    def __init__(self, items=()):
+        items = sorted(items)
+        self.keys = [key for key, _ in items]
+        self.values = [value for _, value in items]
+
+    def add(self, key, value):
+        index = bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        self.values.insert(index, value)
+
+    def remove(self, key, value):
+        index = bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            if self.values[index] == value:
+                del self.keys[index]
+                del self.values[index]
+                return True
+            index += 1
+        return False
+
+    def scan(self, prefix, limit):
+        index = bisect_left(self.keys, prefix)
+        end = min(index + limit, len(self.keys))
+        while index < end and self.keys[index].startswith(prefix):
+            yield self.keys[index], self.values[index]
+            index += 1
+
+
+# Con più processi worker ognuno ha il proprio indice: ogni modifica
+# incrementa un contatore condiviso (shared.py) e un indice che scopre di
+# essere rimasto indietro si ricostruisce in background, continuando intanto
+# a rispondere con i dati che ha.
+class SuggestIndex:
+    def __init__(self, counter, database):
+        self.counter = counter
+        self.database = database
+        self._lock = threading.Lock()
+        # Nomi distinti: chiave normalizzata -> [nome, numero di carte]
+        self._names = {}
+        # Prefissi dei nomi: il nome intero e ogni parola successiva alla
+        # prima ("Pikachu VMAX" si trova anche scrivendo "vmax")
+        self._name_keys = SortedPrefixList()
+        # Codici: chiave normalizzata -> (codice, nome, id)
+        self._codes = SortedPrefixList()
+        self._loaded = False
+        # Valore del contatore a cui corrisponde il contenuto dell'indice
+        self._seen = None
+        self._refreshing = False
+
+    def __len__(self):
+        return len(self._codes.keys)
+
+    @staticmethod
+    def _name_prefixes(key):
+        words = key.split()
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    def _build(self, conn):
+        names = {}
+        codes = []
+        for product_id, name, code in conn.execute("SELECT id, name, code FROM products"):
+            key = normalize(name)
+            entry = names.get(key)
+            if entry is None:
+                names[key] = [name, 1]
+            else:
+                entry[1] += 1
+            codes.append((normalize(code), (code, names[key][0], product_id)))
+        name_keys = SortedPrefixList(
+            (prefix, key) for key in names for prefix in self._name_prefixes(key)
+        )
+        return names, name_keys, SortedPrefixList(codes)
+
+    # Ricostruisce l'indice dall'intera tabella products; con notify=True
+    # anche gli indici degli altri processi si ricostruiranno
+    def load(self, conn, notify=False):
+        if notify:
+            self.counter.increment()
+        version = self.counter.value
+        built = self._build(conn)
+        with self._lock:
+            self._names, self._name_keys, self._codes = built
+            self._loaded = True
+            self._seen = version
+
+    # Carica l'indice alla prima richiesta. Il caricamento avviene con il lock
+    # preso, così le modifiche fatte nel frattempo aspettano e non vanno perse.
+    # Se un altro processo ha cambiato nomi o codici avvia la ricostruzione.
+    def ensure_loaded(self, connect):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._seen = self.counter.value
+                    self._names, self._name_keys, self._codes = self._build(connect())
+                    self._loaded = True
+            return
+        if self.counter.value != self._seen and not self._refreshing:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='suggest-refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            conn = db.connect(self.database)
+            try:
+                self.load(conn)
+            finally:
+                conn.close()
+        except Exception:
+            log.exception("ricostruzione dell'indice dei suggerimenti non riuscita")
+        finally:
+            self._refreshing = False
+
+    # Da chiamare con il lock preso dopo una modifica fatta da questo processo:
+    # se nel frattempo nessun altro ha cambiato nulla l'indice resta aggiornato
+    def _changed(self):
+        version = self.counter.increment()
+        if self._seen == version - 1:
+            self._seen = version
+
+    def add(self, product_id, name, code):
+        key = normalize(name)
+        with self._lock:
+            self._changed()
+            # Finché l'indice non è caricato le modifiche sono già nel database
+            if not self._loaded:
+                return
+            entry = self._names.get(key)
+            if entry is None:
+                entry = self._names[key] = [name, 0]
+                for prefix in self._name_prefixes(key):
+                    self._name_keys.add(prefix, key)
+            entry[1] += 1
+            self._codes.add(normalize(code), (code, entry[0], product_id))
+
+    def remove(self, product_id, name, code):
+        key = normalize(name)
+        with self._lock:
+            self._changed()
+            if not self._loaded:
+                return
+            entry = self._names.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._names[key]
+                    for prefix in self._name_prefixes(key):
+                        self._name_keys.remove(prefix, key)
+            code_key = normalize(code)
+            for stored_key, value in list(self._codes.scan(code_key, SCAN_LIMIT)):
+                if stored_key == code_key and value[2] == product_id:
+                    self._codes.remove(stored_key, value)
+                    break
+
+    def update(self, product_id, old_name, old_code, name, code):
+        if (old_name, old_code) != (name, code):
+            self.remove(product_id, old_name, old_code)
+            self.add(product_id, name, code)
+
+    # Fino a k suggerimenti: prima i nomi che iniziano con il testo digitato,
+    # poi i codici, poi i nomi in cui il testo inizia una parola successiva;
+    # a parità, i nomi con più carte.
+    def suggest(self, text, k=TOP_K):
+        prefix = normalize(text[:MAX_QUERY_LENGTH])
+        if not prefix:
+            return []
+        results = []
+        with self._lock:
+            ranks = {}
+            for stored_key, name_key in self._name_keys.scan(prefix, SCAN_LIMIT):
+                rank = 0 if stored_key == name_key else 2
+                ranks[name_key] = min(rank, ranks.get(name_key, rank))
+            for name_key, rank in ranks.items():
+                name, count = self._names[name_key]
+                results.append((rank, -count, name, {'type': 'name', 'label': name, 'count': count}))
+            for _, (code, name, product_id) in self._codes.scan(prefix, SCAN_LIMIT):
+                results.append((1, 0, code, {'type': 'code', 'label': code, 'name': name, 'id': product_id}))
+        results.sort(key=lambda item: item[:3])
+        return [item[3] for item in results[:k]]
+
+
+def init_app(app):
+    app.extensions['suggest_index'] = SuggestIndex(
+        app.extensions['shared_state'].counter('suggest'), app.config['DATABASE'])
@@ -0,0 +1,108 @@
+# Fixture comuni: ogni test ha un database nuovo in una cartella temporanea,
+# con static/ copiata lì per i test che scrivono immagini o asset
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app import create_app  # noqa: E402
+
+ADMIN_PASSWORD = 'password-di-prova'
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'test.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'SECRET_KEY': 'chiave-di-prova',
+        'JOBS_ENABLED': False,
+        'ASSET_MANIFEST': False,
+        'LOG_LEVEL': 'WARNING',
+    })
+    yield app
+    app.extensions['jobs'].stop()
+    app.extensions['db_pool'].close_all()
+
+
+# static/ in una cartella temporanea, per i test che vi scrivono file
+@pytest.fixture
+def static_app(app, tmp_path):
+    static_folder = tmp_path / 'static'
+    shutil.copytree(app.static_folder, static_folder,
+                    ignore=shutil.ignore_patterns('uploads', 'dist'))
+    os.makedirs(static_folder / 'uploads')
+    app.static_folder = str(static_folder)
+    app.extensions['image_variants'].static_folder = str(static_folder)
+    return app
+
+
+# Esegue nel thread del test i lavori in coda, finché ce ne sono
+@pytest.fixture
+def run_jobs(app):
+    queue = app.extensions['jobs']
+
+    def run():
+        while True:
+            jobs = queue._claim()
+            if not jobs:
+                return
+            for job in jobs:
+                queue._run(job)
+    return run
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# Client con la sessione dell'amministratore già aperta (distinto da client, che resta anonimo)
+@pytest.fixture
+def admin(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['username'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def conn(app):
+    import db
+    conn = db.connect(app.config['DATABASE'])
+    yield conn
+    conn.close()
+
+
+# Utente 'admin' con password ADMIN_PASSWORD, per i test che passano dal login
+@pytest.fixture
+def admin_user(conn):
+    import users
+    users.set_password(conn, 'admin', ADMIN_PASSWORD)
+    conn.commit()
+    return conn.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()['id']
+
+
+# Crea una categoria e i prodotti indicati come (nome, codice, prezzo)
+# passando dalle rotte dell'amministrazione; restituisce l'id della categoria
+@pytest.fixture
+def add_catalog(admin, conn):
+    def add(products, category='Base Set'):
+        response = admin.post('/admin/categories/add', data={'name': category, 'description': ''})
+        assert response.status_code == 302
+        category_id = conn.execute("SELECT id FROM categories WHERE name = ?", (category,)).fetchone()['id']
+        for name, code, price in products:
+            response = admin.post('/admin/products/add', data={
+                'name': name, 'code': code, 'price': str(price),
+                'category_id': str(category_id), 'additional_info': '',
+            })
+            assert response.status_code == 302
+        return category_id
+    return add
@@ -0,0 +1,90 @@
+import io
+
+from PIL import Image
+
+
+def test_products_api_revalidates_with_etag(client, add_catalog):
+    add_catalog([('Pikachu', 'BS-001', 2)])
+    first = client.get('/api/products')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    second = client.get('/api/products', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+
+
+def test_etag_depends_on_url(client, add_catalog):
+    add_catalog([('Pikachu', 'BS-001', 2)])
+    etag = client.get('/api/products').headers['ETag']
+    other = client.get('/api/products?limit=1', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.headers['ETag'] != etag
+
+
+def test_catalog_change_invalidates_etag(app, client, admin, add_catalog):
+    add_catalog([('Pikachu', 'BS-001', 2)])
+    etag = client.get('/api/categories').headers['ETag']
+    assert admin.post('/admin/categories/add', data={'name': 'Jungle', 'description': ''}).status_code == 302
+
+    response = client.get('/api/categories', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [category['name'] for category in response.get_json()] == ['Base Set', 'Jungle']
+    assert response.headers['ETag'] != etag
+
+    # Una modifica fatta da un altro worker vale allo stesso modo
+    etag = response.headers['ETag']
+    app.extensions['shared_state'].counter('catalog').increment()
+    assert client.get('/api/categories', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_etag_from_previous_start_is_not_accepted(app, client, add_catalog):
+    add_catalog([('Pikachu', 'BS-001', 2)])
+    etag = client.get('/api/products').headers['ETag']
+    # Stessa versione del catalogo ma epoca diversa (processi riavviati)
+    stale = etag.replace(app.extensions['page_cache'].epoch, 'deadbeef')
+    assert client.get('/api/products', headers={'If-None-Match': stale}).status_code == 200
+
+
+def test_product_api(client, add_catalog, conn):
+    add_catalog([('Pikachu', 'BS-001', 2)])
+    product_id = conn.execute("SELECT id FROM products").fetchone()[0]
+    body = client.get(f'/api/products/{product_id}').get_json()
+    assert (body['code'], body['category_name'], body['image_url']) == ('BS-001', 'Base Set', None)
+    missing = client.get('/api/products/999')
+    assert missing.status_code == 404
+    assert 'ETag' not in missing.headers
+
+
+def test_batch_image_lookup(static_app, client, admin, add_catalog, conn, run_jobs):
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 300), (10, 200, 10)).save(buffer, 'PNG')
+    add_catalog([('Pikachu', 'BS-001', 2)])
+    admin.post('/admin/products/add', data={
+        'name': 'Raichu', 'code': 'BS-002', 'price': '3', 'category_id': '', 'additional_info': '',
+        'image': (io.BytesIO(buffer.getvalue()), 'raichu.png'),
+    }, content_type='multipart/form-data')
+    run_jobs()
+    ids = dict(conn.execute("SELECT code, id FROM products").fetchall())
+
+    response = client.get(f"/api/products/images?ids={ids['BS-002']},{ids['BS-001']},999,x")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert set(body) == {str(ids['BS-001']), str(ids['BS-002'])}
+    assert body[str(ids['BS-001'])] is None
+    assert set(body[str(ids['BS-002'])]) == {'image', 'thumb', 'thumb_webp', 'medium', 'medium_webp'}
+
+    # Stesso insieme di id in un altro ordine: stessa voce in cache
+    cache = client.application.extensions['page_cache']
+    entries = len(cache)
+    again = client.get(f"/api/products/images?ids=999,{ids['BS-001']},{ids['BS-002']},{ids['BS-001']}")
+    assert again.get_json() == body
+    assert len(cache) == entries
+
+
+def test_batch_image_lookup_is_bounded(client):
+    ids = ','.join(str(i) for i in range(1, 502))
+    assert client.get(f'/api/products/images?ids={ids}').status_code == 400
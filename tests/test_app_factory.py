@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import logconfig
+from app import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Eseguito in un processo nuovo: importa app e riporta thread e file creati
+IMPORT_CHECK = """
+import os, sys, threading
+sys.path.insert(0, sys.argv[1])
+before = set(os.listdir(sys.argv[2]))
+import app
+print(threading.active_count(), sorted(set(os.listdir(sys.argv[2])) - before), hasattr(app, 'app'))
+"""
+
+
+def test_import_does_no_io(tmp_path):
+    env = dict(os.environ, CARTE_DATABASE=str(tmp_path / 'nuovo' / 'test.db'))
+    output = subprocess.run([sys.executable, '-c', IMPORT_CHECK, ROOT, str(tmp_path)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ['1', '[]', 'False']
+
+
+def test_create_app_sets_up_database_and_folders(tmp_path):
+    app = create_app({
+        'DATABASE': str(tmp_path / 'db' / 'nuovo.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'JOBS_ENABLED': False,
+    })
+    assert os.path.exists(tmp_path / 'db' / 'nuovo.db')
+    assert os.path.isdir(tmp_path / 'uploads')
+    # Senza chiave configurata se ne genera una accanto al database, uguale tra un avvio e l'altro
+    assert os.path.exists(tmp_path / 'db' / 'secret_key')
+    again = create_app({'DATABASE': str(tmp_path / 'db' / 'nuovo.db'), 'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                        'JOBS_ENABLED': False})
+    assert again.config['SECRET_KEY'] == app.config['SECRET_KEY']
+    assert not app.extensions['jobs']._dispatcher
+    for application in (app, again):
+        application.extensions['db_pool'].close_all()
+
+
+def test_logging_init_is_idempotent_and_replaced_by_new_app(app, tmp_path):
+    listener = app.extensions['log_listener']
+    logconfig.init_app(app)
+    assert app.extensions['log_listener'] is listener
+    assert listener._thread is not None
+
+    other = create_app({'DATABASE': str(tmp_path / 'altro.db'), 'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                        'SECRET_KEY': 'x', 'JOBS_ENABLED': False})
+    # Un solo listener attivo per processo
+    assert listener._thread is None
+    assert other.extensions['log_listener']._thread is not None
+    other.extensions['db_pool'].close_all()
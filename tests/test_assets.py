@@ -0,0 +1,144 @@
+import os
+import re
+
+import brotli
+import pytest
+from flask import Flask, url_for
+
+import assets
+import bundler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES = os.path.join(ROOT, 'templates')
+
+_JINJA = re.compile(r'{{.*?}}|{%.*?%}', re.DOTALL)
+_IDENT = re.compile(r'-?[_a-zA-Z][\w-]*$')
+# Classi assegnate dagli script: classList.add/toggle/remove, className e selettori
+_JS_CLASSES = re.compile(r'''classList\.\w+\(\s*'([\w-]+)'|className\s*=\s*'([^']+)'|querySelector(?:All)?\('\.([\w-]+)''')
+
+
+# Classi usate nei template (attributi class, senza le parti Jinja) e negli script
+def used_classes():
+    classes = set()
+    for folder, _, names in os.walk(TEMPLATES):
+        for name in names:
+            with open(os.path.join(folder, name), encoding='utf-8') as f:
+                for value in re.findall(r'class="([^"]*)"', _JINJA.sub(' ', f.read())):
+                    classes.update(token for token in value.split() if _IDENT.match(token))
+    for name in os.listdir(os.path.join(ROOT, 'static', 'js')):
+        with open(os.path.join(ROOT, 'static', 'js', name), encoding='utf-8') as f:
+            for match in _JS_CLASSES.finditer(f.read()):
+                classes.update(' '.join(filter(None, match.groups())).split())
+    return classes
+
+
+# Classi dei sorgenti che compaiono in almeno un selettore fatto solo di
+# classi usate: quel selettore deve restare, e con lui la classe
+def needed_classes(static_folder, sources, used):
+    classes = set()
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            text = re.sub(r'/\*[\s\S]*?\*/', '', f.read())
+        for prelude in re.findall(r'([^{};]+){', text):
+            for selector in prelude.split(','):
+                names = set(bundler._CLASS.findall(selector))
+                if names <= used | bundler.SAFELIST:
+                    classes |= names
+    return classes
+
+
+def read(static_folder, path, mode='r'):
+    with open(os.path.join(static_folder, path), mode) as f:
+        return f.read()
+
+
+@pytest.fixture
+def built(static_app):
+    static_folder = static_app.static_folder
+    return static_folder, assets.build(static_folder, TEMPLATES)
+
+
+def test_vendor_files_are_in_the_repository():
+    static_folder = os.path.join(ROOT, 'static')
+    for relative in bundler.VENDOR_FILES:
+        assert os.path.exists(os.path.join(static_folder, bundler.VENDOR_DIR, relative)), relative
+    assert bundler.available(static_folder)
+
+
+def test_bundle_keeps_every_used_class(built):
+    static_folder, manifest = built
+    sources = bundler.BUNDLES['css/bundle.css']
+    css = read(static_folder, manifest['css/bundle.css'])
+    kept = set(bundler._CLASS.findall(css))
+    used = used_classes()
+    needed = needed_classes(static_folder, sources, used)
+    # Controllo sul controllo: le classi più comuni sono state riconosciute
+    assert {'navbar', 'btn', 'card', 'fas', 'fa-gamepad', 'typeahead-detail', 'card-thumbnail'} <= needed
+    assert sorted(needed - kept) == []
+    # Le regole delle classi che nessuno usa sono state tolte
+    assert 'carousel-item' not in used and 'carousel-item' not in kept
+    # .nav-item è usata, ma Bootstrap la definisce solo insieme a classi non usate
+    assert 'nav-item' in used and 'nav-item' not in needed
+    assert len(css) < len(read(static_folder, sources[0])) / 2
+
+
+def test_bundle_fonts_are_published_and_subset(built):
+    static_folder, manifest = built
+    css = read(static_folder, manifest['css/bundle.css'])
+    bundle_dir = os.path.dirname(os.path.join(static_folder, manifest['css/bundle.css']))
+    urls = re.findall(r'url\(([^)"]+\.woff2)\)', css)
+    assert len(urls) == 7
+    for url in urls:
+        assert os.path.exists(os.path.normpath(os.path.join(bundle_dir, url))), url
+    assert '{{' not in css
+    # Il font delle icone resta solo con i glifi delle regole rimaste
+    solid = 'vendor/fontawesome/webfonts/fa-solid-900.woff2'
+    assert len(read(static_folder, manifest[solid], 'rb')) < len(read(static_folder, solid, 'rb')) / 10
+    assert 'fa-v4compatibility' not in css
+
+
+def test_bundle_js_keeps_every_script_in_order(built):
+    static_folder, manifest = built
+    js = read(static_folder, manifest['js/bundle.js'])
+    positions = [js.index(read(static_folder, source).strip()[:200]) for source in bundler.BUNDLES['js/bundle.js']]
+    assert positions == sorted(positions)
+    assert 'sourceMappingURL' not in js
+
+
+def test_manifest_urls_and_precompressed_variants(built):
+    static_folder, manifest = built
+    assert manifest == assets.read_manifest(static_folder)
+    app = Flask(__name__, static_folder=static_folder)
+    assets.init_app(app)
+    target = manifest['css/bundle.css']
+    assert re.fullmatch(r'dist/css/bundle\.[0-9a-f]{10}\.css', target)
+    with app.test_request_context():
+        assert url_for('static', filename='css/bundle.css') == f'/static/{target}'
+        # I file senza hash restano all'URL originale
+        assert url_for('static', filename='css/fonts.css') == '/static/css/fonts.css'
+
+    client = app.test_client()
+    original = read(static_folder, target, 'rb')
+    for accept, encoding, decode in (('br, gzip', 'br', brotli.decompress), ('gzip', 'gzip', None),
+                                     ('identity', None, None)):
+        response = client.get(f'/static/{target}', headers={'Accept-Encoding': accept})
+        assert response.status_code == 200
+        assert response.headers.get('Content-Encoding') == encoding
+        assert response.mimetype == 'text/css'
+        assert 'immutable' in response.headers['Cache-Control']
+        assert 'Accept-Encoding' in response.headers['Vary']
+        if decode:
+            assert decode(response.data) == original
+        response.close()
+    # I file senza hash non si possono tenere in cache per sempre
+    response = client.get('/static/css/fonts.css')
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+    response.close()
+
+
+def test_layout_without_build_loads_local_sources(client):
+    page = client.get('/').get_data(as_text=True)
+    for sources in bundler.BUNDLES.values():
+        for source in sources:
+            assert f'/static/{source}' in page
+    assert 'https://' not in page
@@ -0,0 +1,93 @@
+import auth
+from conftest import ADMIN_PASSWORD
+
+
+def login(client, username='admin', password=ADMIN_PASSWORD, **environ):
+    return client.post('/login', data={'username': username, 'password': password}, environ_base=environ)
+
+
+def test_bucket_refills_over_time():
+    limiter = auth.RateLimiter(burst=2, refill_seconds=10)
+    assert limiter.allow('ip', now=0)
+    assert limiter.allow('ip', now=0)
+    assert not limiter.allow('ip', now=1)
+    # Il tentativo rifiutato non consuma token: ne manca 0.9, cioè 9 secondi
+    assert limiter.retry_after('ip', now=1) == 9
+    assert not limiter.allow('ip', now=9.9)
+    assert limiter.allow('ip', now=10)
+    # Dopo una lunga pausa si torna al massimo BURST, non oltre
+    assert limiter.allow('ip', now=1000)
+    assert limiter.allow('ip', now=1000)
+    assert not limiter.allow('ip', now=1000)
+    # Chiavi diverse hanno secchi separati
+    assert limiter.allow('altro', now=1000)
+    assert limiter.retry_after('nuovo', now=1000) == 0
+
+
+def test_least_recent_keys_are_forgotten():
+    limiter = auth.RateLimiter(burst=1, refill_seconds=60, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        assert limiter.allow(key, now=0)
+    assert list(limiter._buckets) == ['b', 'c']
+    # 'a' dimenticata riparte con il secchio pieno
+    assert limiter.allow('a', now=0)
+    assert not limiter.allow('c', now=0)
+
+
+def test_login_against_users_table(client, admin_user):
+    response = login(client)
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin')
+    with client.session_transaction() as session:
+        assert session['user_id'] == admin_user
+    assert client.get('/admin').status_code == 200
+
+
+def test_wrong_password_and_unknown_user_are_rejected(client, admin_user):
+    for username, password in (('admin', 'sbagliata'), ('nessuno', ADMIN_PASSWORD)):
+        response = login(client, username, password)
+        assert response.status_code == 200
+        assert 'errati' in response.get_data(as_text=True)
+    assert client.get('/admin').status_code == 302
+
+
+def test_too_many_attempts_get_429_with_retry_after(client, admin_user):
+    for _ in range(auth.USER_BURST):
+        assert login(client, password='sbagliata').status_code == 200
+    # Il limite per utente vale anche con la password giusta e un nome in maiuscolo
+    response = login(client, 'ADMIN')
+    assert response.status_code == 429
+    assert 0 < int(response.headers['Retry-After']) <= auth.USER_REFILL_SECONDS
+    # Il limite per IP scatta anche cambiando utente ogni volta
+    for i in range(auth.IP_BURST):
+        assert login(client, f'utente{i}', 'x', REMOTE_ADDR='10.0.0.1').status_code == 200
+    assert login(client, 'ultimo', 'x', REMOTE_ADDR='10.0.0.1').status_code == 429
+    # Un altro IP non risente del limite del primo
+    assert login(client, 'ultimo', 'x', REMOTE_ADDR='10.0.0.2').status_code == 200
+
+
+def test_throttled_ip_does_not_drain_user_bucket():
+    authenticator = auth.Authenticator(workers=1)
+    for _ in range(auth.IP_BURST):
+        authenticator.allow('1.1.1.1', 'altro')
+    # L'IP bloccato continua a provare con 'admin'...
+    for _ in range(auth.USER_BURST * 2):
+        assert not authenticator.allow('1.1.1.1', 'admin')
+    # ...ma il vero amministratore entra da un altro IP
+    assert authenticator.allow('2.2.2.2', 'admin')
+
+
+def test_full_verify_queue_answers_busy(app, client, admin_user):
+    app.extensions['auth'] = auth.Authenticator(workers=1, max_pending=0)
+    response = login(client)
+    assert response.status_code == 503
+    assert 'occupato' in response.get_data(as_text=True)
+    assert client.get('/admin').status_code == 302
+
+
+def test_verify_releases_its_slot():
+    authenticator = auth.Authenticator(workers=1, max_pending=1)
+    stored = '$2b$04$' + 'a' * 53
+    for _ in range(3):
+        assert authenticator.verify(stored, 'password') == auth.INVALID
+    assert authenticator.verify(None, 'password') == auth.INVALID
@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+from benchmark import generate, run
+
+
+def dump(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT p.name, p.code, p.price, p.image_path, c.name, p.additional_info"
+                        " FROM products p JOIN categories c ON c.id = p.category_id ORDER BY p.id").fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / 'benchmark.db')
+    generate.generate(path, 300, 5, seed=7)
+    return path
+
+
+def test_same_seed_same_catalog(catalog, tmp_path):
+    other = str(tmp_path / 'altro.db')
+    generate.generate(other, 300, 5, seed=7)
+    rows = dump(catalog)
+    assert len(rows) == 300
+    assert dump(other) == rows
+    assert len({code for _, code, *_ in rows}) == 300
+
+    different = str(tmp_path / 'diverso.db')
+    generate.generate(different, 300, 5, seed=8)
+    assert dump(different) != rows
+
+
+def test_percentile_and_compare():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert (run.percentile(values, 50), run.percentile(values, 95), run.percentile(values, 99)) == (5, 10, 10)
+    assert run.percentile([], 50) is None
+
+    baseline = {'scenarios': {'index': {'p95_ms': 10.0}, 'category': {'p95_ms': 10.0}}}
+    current = {'scenarios': {'index': {'p95_ms': 10.5}, 'category': {'p95_ms': 12.0}, 'nuovo': {'p95_ms': 1.0}}}
+    assert [name for name, *_ in run.compare(current, baseline)] == ['category']
+
+
+def test_every_scenario_answers(catalog):
+    results = run.run(catalog, iterations=1, warmup=0, page_cache=False)
+    assert results['meta']['products'] == 300
+    assert 'index_middle_page' in results['scenarios']
+    assert 'search[query+category_id+price][relevance]' in results['scenarios']
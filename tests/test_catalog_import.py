@@ -0,0 +1,77 @@
+import io
+import json
+
+import catalog_import
+
+
+def run_import(conn, data, fmt, chunk_size=catalog_import.CHUNK_SIZE):
+    return catalog_import.import_catalog(conn, io.BytesIO(data), fmt, chunk_size)
+
+
+def products(conn):
+    rows = conn.execute("SELECT p.code, p.name, p.price, c.name AS category FROM products p"
+                        " LEFT JOIN categories c ON c.id = p.category_id ORDER BY p.code")
+    return [tuple(row) for row in rows]
+
+
+def test_csv_import_creates_categories_and_upserts(conn):
+    data = ('\ufeffname,code,price,category,additional_info\n'
+            'Pikachu,BS-001,"2,50",Base Set,holo\n'
+            'Raichu,BS-002,4,Base Set,\n'
+            'Pikachu Promo,BS-001,3,Promo,\n').encode()
+    result = run_import(conn, data, 'csv')
+    assert (result.imported, result.failed, result.categories_created) == (3, 0, 2)
+    assert products(conn) == [('BS-001', 'Pikachu Promo', 3.0, 'Promo'), ('BS-002', 'Raichu', 4.0, 'Base Set')]
+
+
+def test_invalid_rows_are_reported_and_skipped(conn):
+    lines = [
+        {'name': 'Pikachu', 'code': 'BS-001', 'price': 2},
+        {'name': '', 'code': 'BS-002', 'price': 2},
+        {'name': 'Raichu', 'code': 'BS-003', 'price': 'gratis'},
+        {'name': 'Mew', 'code': 'BS-004', 'price': 1, 'category_id': 99},
+    ]
+    data = '\n'.join(json.dumps(line) for line in lines) + '\n{non json\n\n[1, 2]\n'
+    result = run_import(conn, data.encode(), 'ndjson')
+    assert result.imported == 1
+    assert [line for line, _ in result.errors] == [2, 3, 4, 5, 7]
+    assert products(conn) == [('BS-001', 'Pikachu', 2.0, None)]
+
+
+def test_failed_chunk_is_retried_row_by_row(conn):
+    conn.execute("CREATE TRIGGER no_mew BEFORE INSERT ON products WHEN new.name = 'Mew'"
+                 " BEGIN SELECT RAISE(ABORT, 'Mew non ammesso'); END")
+    rows = ''.join(f'Carta {i},C-{i},1\n' for i in range(5)) + 'Mew,C-9,1\n'
+    result = run_import(conn, ('name,code,price\n' + rows).encode(), 'csv', chunk_size=4)
+    assert (result.imported, result.failed) == (5, 1)
+    assert result.errors == [(7, 'Mew non ammesso')]
+
+
+def test_latin1_csv_is_reported_as_import_error(conn):
+    data = ('name,code,price\n'
+            'Pikachu,BS-001,2\n'
+            'Flabébé,FL-001,1\n'
+            '"Nidoran\nmaschio",BS-002,3\n'
+            '"Nidoran\nfemmina é",BS-003,3\n').encode('latin-1')
+    result = run_import(conn, data, 'csv')
+    assert (result.imported, result.failed) == (2, 2)
+    assert [line for line, _ in result.errors] == [3, 7]
+    assert 'UTF-8' in result.errors[0][1]
+    assert [code for code, *_ in products(conn)] == ['BS-001', 'BS-002']
+
+
+def test_latin1_ndjson_is_reported_as_import_error(conn):
+    data = ('{"name": "Flabébé", "code": "FL-001", "price": 1}\n'
+            '{"name": "Pikachu", "code": "BS-001", "price": 2}\n').encode('latin-1')
+    result = run_import(conn, data, 'ndjson')
+    assert (result.imported, result.failed) == (1, 1)
+    assert result.errors[0][0] == 1
+
+
+def test_import_route_reports_encoding_errors(admin, conn):
+    data = 'name,code,price\nFlabébé,FL-001,1\n'.encode('latin-1')
+    response = admin.post('/admin/products/import', data={'file': (io.BytesIO(data), 'carte.csv')},
+                          content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert 'UTF-8' in response.get_data(as_text=True)
+    assert products(conn) == []
@@ -0,0 +1,74 @@
+import io
+
+import catalog_import
+import catalog_stats
+
+
+def stats(conn):
+    return {row['category_id']: (row['product_count'], round(row['price_sum'], 2), row['price_min'], row['price_max'])
+            for row in conn.execute("SELECT * FROM category_stats WHERE product_count > 0")}
+
+
+def run_import(conn, text):
+    result = catalog_import.import_catalog(conn, io.BytesIO(text.encode()), 'csv')
+    assert result.failed == 0
+
+
+def test_stats_follow_imports_and_deletes(admin, conn):
+    run_import(conn, 'name,code,price,category\n'
+                     'Pikachu,BS-001,2.5,Base Set\n'
+                     'Raichu,BS-002,4,Base Set\n'
+                     'Mew,PR-001,10,Promo\n'
+                     'Energia,EN-001,0.1,\n')
+    ids = dict(conn.execute("SELECT name, id FROM categories").fetchall())
+    assert stats(conn) == {ids['Base Set']: (2, 6.5, 2.5, 4), ids['Promo']: (1, 10, 10, 10), 0: (1, 0.1, 0.1, 0.1)}
+
+    # Un secondo import aggiorna prezzi ed espansioni delle carte esistenti
+    run_import(conn, 'name,code,price,category\n'
+                     'Raichu,BS-002,1,Promo\n'
+                     'Energia,EN-001,0.2,Base Set\n')
+    assert stats(conn) == {ids['Base Set']: (2, 2.7, 0.2, 2.5), ids['Promo']: (2, 11, 1, 10)}
+    assert catalog_stats.check_stats(conn) == []
+
+    # Eliminando il minimo e il massimo si rileggono da products
+    for code in ('EN-001', 'PR-001'):
+        product_id = conn.execute("SELECT id FROM products WHERE code = ?", (code,)).fetchone()[0]
+        assert admin.post(f'/admin/products/delete/{product_id}').status_code == 302
+    assert stats(conn) == {ids['Base Set']: (1, 2.5, 2.5, 2.5), ids['Promo']: (1, 1, 1, 1)}
+    assert catalog_stats.check_stats(conn) == []
+    assert catalog_stats.total_products(conn) == 2
+
+
+def test_stats_follow_edits_and_category_deletion(admin, add_catalog, conn):
+    base = add_catalog([('Pikachu', 'BS-001', 2), ('Raichu', 'BS-002', 4)])
+    jungle = add_catalog([], category='Jungle')
+    product_id = conn.execute("SELECT id FROM products WHERE code = 'BS-002'").fetchone()[0]
+    admin.post(f'/admin/products/edit/{product_id}', data={
+        'name': 'Raichu', 'code': 'BS-002', 'price': '5', 'category_id': str(jungle), 'additional_info': '',
+    })
+    assert stats(conn) == {base: (1, 2, 2, 2), jungle: (1, 5, 5, 5)}
+    assert catalog_stats.category_product_count(conn, jungle) == 1
+
+    conn.execute("DELETE FROM products WHERE category_id = ?", (jungle,))
+    conn.commit()
+    assert admin.post(f'/admin/categories/delete/{jungle}').status_code == 302
+    assert conn.execute("SELECT COUNT(*) FROM category_stats WHERE category_id = ?", (jungle,)).fetchone()[0] == 0
+    assert catalog_stats.check_stats(conn) == []
+
+
+def test_check_and_rebuild_fix_drift(add_catalog, conn):
+    category_id = add_catalog([('Pikachu', 'BS-001', 2), ('Raichu', 'BS-002', 4)])
+    conn.execute("UPDATE category_stats SET product_count = 5, price_max = 9 WHERE category_id = ?", (category_id,))
+    problems = catalog_stats.check_stats(conn)
+    assert [(field, stored, expected) for _, field, stored, expected in problems] == [
+        ('product_count', 5, 2), ('price_max', 9, 4)]
+    catalog_stats.rebuild_stats(conn)
+    assert catalog_stats.check_stats(conn) == []
+
+
+def test_pages_read_counts_from_stats(admin, add_catalog, conn):
+    category_id = add_catalog([('Pikachu', 'BS-001', 2), ('Raichu', 'BS-002', 4)])
+    conn.execute("UPDATE category_stats SET product_count = 42 WHERE category_id = ?", (category_id,))
+    conn.commit()
+    assert b'42' in admin.get('/admin').data
+    assert b'42' in admin.get('/admin/categories').data
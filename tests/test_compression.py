@@ -0,0 +1,110 @@
+import gzip
+
+import brotli
+from flask import Flask, Response, jsonify
+
+import compression
+
+BODY = 'carta ' * 400
+
+
+# Applicazione minima con il solo compressore, per i casi limite
+def make_app(**views):
+    app = Flask(__name__)
+    compression.init_app(app)
+    for name, view in views.items():
+        app.add_url_rule(f'/{name}', name, view)
+    return app.test_client()
+
+
+def get(client, url, accept='gzip, br'):
+    return client.get(url, headers={'Accept-Encoding': accept})
+
+
+def test_negotiates_brotli_then_gzip(client, add_catalog):
+    add_catalog([(f'Carta {i}', f'C-{i:02d}', i) for i in range(20)])
+    plain = get(client, '/search', accept='identity')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    response = get(client, '/search')
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.data) == plain.data
+    response = get(client, '/search', accept='gzip')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == plain.data
+    assert int(response.headers['Content-Length']) == len(response.data) < len(plain.data)
+
+
+def test_small_bodies_are_left_alone():
+    client = make_app(small=lambda: jsonify(ok=True), large=lambda: jsonify(text=BODY))
+    small = get(client, '/small')
+    assert 'Content-Encoding' not in small.headers
+    # Il tipo è comprimibile: la risposta varia comunque con Accept-Encoding
+    assert 'Accept-Encoding' in small.headers['Vary']
+    assert get(client, '/large').headers['Content-Encoding'] == 'br'
+
+
+def test_existing_content_encoding_is_kept():
+    payload = gzip.compress(BODY.encode())
+
+    def precompressed():
+        return Response(payload, mimetype='text/html', headers={'Content-Encoding': 'gzip'})
+    client = make_app(precompressed=precompressed)
+    response = get(client, '/precompressed', accept='br')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.data == payload
+
+
+def test_other_statuses_passthrough_and_types_are_not_compressed():
+    def passthrough():
+        response = Response(BODY, mimetype='text/html')
+        response.direct_passthrough = True
+        return response
+    client = make_app(
+        missing=lambda: (BODY, 404),
+        passthrough=passthrough,
+        image=lambda: Response(BODY, mimetype='image/svg+xml'),
+    )
+    for url in ('/missing', '/passthrough', '/image'):
+        response = get(client, url)
+        assert 'Content-Encoding' not in response.headers, url
+        assert response.get_data(as_text=True) == BODY
+    # Un errore di una pagina HTML può cambiare con la codifica accettata, un'immagine no
+    assert 'Accept-Encoding' in get(client, '/missing').headers['Vary']
+    assert 'Vary' not in get(client, '/image').headers
+
+
+def test_streamed_export_is_compressed_in_chunks(admin, add_catalog):
+    add_catalog([(f'Carta {i}', f'C-{i:03d}', i) for i in range(100)])
+    plain = get(admin, '/admin/products/export.csv', accept='identity')
+    assert plain.is_streamed and 'Content-Encoding' not in plain.headers
+
+    for accept, decompress in (('gzip', gzip.decompress), ('br', brotli.decompress)):
+        response = get(admin, '/admin/products/export.csv', accept=accept)
+        assert response.headers['Content-Encoding'] == accept
+        assert 'Content-Length' not in response.headers
+        assert decompress(response.data) == plain.data
+
+
+def test_cached_page_keeps_compressed_bodies(app, client, add_catalog):
+    category_id = add_catalog([(f'Carta {i}', f'C-{i:02d}', i) for i in range(20)])
+    url = f'/category/{category_id}'
+    plain = get(client, url, accept='identity').data
+    first = get(client, url, accept='br')
+    [entry] = app.extensions['page_cache']._entries.values()
+    assert set(entry.bodies) == {None, 'br'}
+    assert entry.bodies['br'] == first.data
+
+    # Il hit serve il corpo già compresso, senza ricomprimere
+    calls = []
+    compressor = app.extensions['compression']
+    original = compressor.compress
+    compressor.compress = lambda *args: calls.append(args) or original(*args)
+    second = get(client, url, accept='br')
+    assert second.headers['Content-Encoding'] == 'br'
+    assert second.data == first.data
+    assert brotli.decompress(second.data) == plain
+    assert calls == []
+    assert gzip.decompress(get(client, url, accept='gzip').data) == plain
+    assert set(entry.bodies) == {None, 'br', 'gzip'}
@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+
+import db
+
+
+def test_connect_applies_pragmas(tmp_path):
+    conn = db.connect(str(tmp_path / 'test.db'))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    conn.close()
+
+
+def test_pool_reuses_released_connection(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / 'test.db'), size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.close_all()
+
+
+def test_release_rolls_back_open_transaction(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / 'test.db'), size=2)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    assert conn.in_transaction
+    pool.release(conn)
+    assert not conn.in_transaction
+    assert pool.acquire().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close_all()
+
+
+def test_pool_closes_connections_beyond_size(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / 'test.db'), size=1)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire() is first
+    # La seconda connessione non c'era posto per tenerla: è stata chiusa
+    with pytest.raises(sqlite3.ProgrammingError):
+        second.execute("SELECT 1")
+    pool.close_all()
+
+
+def test_request_returns_connection_to_pool(app, client):
+    pool = app.extensions['db_pool']
+    client.get('/')
+    idle = pool._idle.qsize()
+    assert idle >= 1
+    client.get('/')
+    # La seconda richiesta riusa la connessione invece di aprirne un'altra
+    assert pool._idle.qsize() == idle
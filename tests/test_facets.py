@@ -0,0 +1,80 @@
+import re
+
+import facets
+from app import search_filters
+
+
+def result_codes(client, url):
+    page = client.get(url).get_data(as_text=True)
+    return re.findall(r'Codice:</strong> ([\w-]+)', page)
+
+
+def bucket_links(client, url):
+    page = client.get(url).get_data(as_text=True)
+    links = re.findall(r'<a href="([^"]*min_price=[^"]*)" class="facet-link">\s*'
+                       r'<span>[^<]*</span>\s*<span class="facet-count">(\d+)</span>', page)
+    return [(href.replace('&amp;', '&'), int(count)) for href, count in links]
+
+
+def test_bucket_count_matches_results_after_click(client, add_catalog):
+    prices = [0.5, 1, 4.999, 4.995, 5, 9.99, 9.995, 10, 24.999, 250, 1000]
+    add_catalog([(f'Carta {i}', f'C-{i:02d}', price) for i, price in enumerate(prices)])
+
+    links = bucket_links(client, '/search')
+    assert [count for _, count in links] == [1, 3, 3, 2, 2]
+    for href, count in links:
+        assert len(result_codes(client, href)) == count, href
+
+
+def test_bucket_bounds_are_exclusive(conn, add_catalog):
+    add_catalog([('Pikachu', 'BS-001', 5), ('Raichu', 'BS-002', 10), ('Mew', 'BS-003', 9.999)])
+    result = facets.compute_facets(conn.cursor(), None, None, 5.0, price_below=10.0)
+    counts = {bucket.low: bucket.count for bucket in result.buckets}
+    assert (counts[5], counts[10]) == (2, 1)
+    # Con la fascia 5-10 l'espansione conta le due carte della fascia
+    assert list(result.category_counts.values()) == [2]
+    # Il prezzo massimo scelto dall'utente invece è incluso
+    result = facets.compute_facets(conn.cursor(), None, None, 5.0, 10.0)
+    assert list(result.category_counts.values()) == [3]
+
+
+def test_max_price_filter_is_inclusive(client, admin, add_catalog):
+    add_catalog([('Pikachu', 'BS-001', 5), ('Raichu', 'BS-002', 10), ('Mew', 'BS-003', 10.5)])
+    codes = [product['code'] for product in
+             client.get('/api/products', query_string={'min_price': 10, 'max_price': 10}).get_json()['items']]
+    assert codes == ['BS-002']
+    assert result_codes(client, '/search?min_price=5&max_price=10') == ['BS-001', 'BS-002']
+    assert result_codes(client, '/search?min_price=5&price_below=10') == ['BS-001']
+    export = admin.get('/admin/products/export.csv?max_price=10').get_data(as_text=True)
+    assert 'BS-002' in export and 'BS-003' not in export
+
+
+def test_each_facet_ignores_its_own_filter(conn, add_catalog):
+    base = add_catalog([('Pikachu', 'BS-001', 2), ('Raichu', 'BS-002', 30)])
+    jungle = add_catalog([('Pikachu Jungle', 'JU-001', 3)], category='Jungle')
+    match_query, *_ = search_filters({'query': 'pikachu'})
+    result = facets.compute_facets(conn.cursor(), match_query, base, 1.0, 5.0)
+    # Le espansioni ignorano il filtro per espansione, l'istogramma quello per prezzo
+    assert result.category_counts == {base: 1, jungle: 1}
+    assert {bucket.low: bucket.count for bucket in result.buckets if bucket.count} == {1: 1}
+
+
+def test_counts_cover_every_result_of_a_large_catalog(client, conn, add_catalog):
+    # 30 espansioni da 300 carte, inserite un'espansione dopo l'altra: 9000
+    # righe, ben oltre le 5000 che le faccette esaminavano in passato
+    categories = [add_catalog([], category=f'Espansione {n}') for n in range(30)]
+    conn.executemany("INSERT INTO products (name, code, price, category_id) VALUES (?, ?, ?, ?)",
+                     [(f'Carta {n}-{i}', f'E{n}-{i}', (1, 11, 30)[i % 3], category_id)
+                      for n, category_id in enumerate(categories) for i in range(300)])
+    conn.commit()
+
+    result = facets.compute_facets(conn.cursor(), None)
+    assert result.category_counts == dict.fromkeys(categories, 300)
+    assert [bucket.count for bucket in result.buckets if bucket.count] == [3000, 3000, 3000]
+
+    # L'istogramma di un'espansione conta tutte le sue carte, anche le ultime inserite
+    result = facets.compute_facets(conn.cursor(), None, categories[-1], price_below=5.0)
+    assert {bucket.low: bucket.count for bucket in result.buckets if bucket.count} == {1: 100, 10: 100, 25: 100}
+    assert result.category_counts == dict.fromkeys(categories, 100)
+    links = bucket_links(client, f'/search?category_id={categories[-1]}')
+    assert [count for _, count in links] == [100, 100, 100]
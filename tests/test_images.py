@@ -0,0 +1,68 @@
+import io
+import os
+
+from PIL import Image
+
+import images
+
+
+def png_bytes(size=(800, 600), color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def upload(admin, code, data, filename='carta.png'):
+    response = admin.post('/admin/products/add', data={
+        'name': f'Carta {code}', 'code': code, 'price': '1', 'category_id': '',
+        'additional_info': '', 'image': (io.BytesIO(data), filename),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+
+def test_derivative_paths():
+    paths = images.derivative_paths('uploads/x.jpeg')
+    assert paths == {
+        'thumb': 'uploads/x.thumb.jpg', 'thumb_webp': 'uploads/x.thumb.webp',
+        'medium': 'uploads/x.medium.jpg', 'medium_webp': 'uploads/x.medium.webp',
+    }
+    assert images.derivative_paths('uploads/y.gif')['thumb'] == 'uploads/y.thumb.png'
+
+
+def test_generate_derivatives(tmp_path):
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'uploads' / 'x.png').write_bytes(png_bytes())
+    assert images.generate_derivatives(str(tmp_path), 'uploads/x.png')
+    for name, size in images.DERIVATIVES:
+        for key in (name, f'{name}_webp'):
+            with Image.open(tmp_path / images.derivative_paths('uploads/x.png')[key]) as image:
+                assert max(image.size) == size
+                assert image.format == ('WEBP' if key.endswith('webp') else 'PNG')
+
+    images.remove_derivatives(str(tmp_path), 'uploads/x.png')
+    assert os.listdir(tmp_path / 'uploads') == ['x.png']
+
+
+def test_unreadable_image_has_no_derivatives(tmp_path):
+    (tmp_path / 'rotta.jpg').write_bytes(b'non sono un jpeg')
+    assert not images.generate_derivatives(str(tmp_path), 'rotta.jpg')
+
+
+def test_upload_is_processed_in_background(static_app, admin, client, conn, run_jobs):
+    upload(admin, 'BS-001', png_bytes())
+    product = conn.execute("SELECT id, image_path, image_status FROM products").fetchone()
+    assert product['image_status'] == 'pending'
+    assert static_app.extensions['image_variants'](product['image_path']) is None
+
+    run_jobs()
+    assert conn.execute("SELECT image_status FROM products").fetchone()[0] == 'ready'
+    variants = client.get(f'/api/products/{product["id"]}').get_json()['image_variants']
+    assert set(variants) == {'thumb', 'thumb_webp', 'medium', 'medium_webp'}
+    page = client.get('/').data.decode()
+    assert 'image/webp' in page and variants['thumb_webp'] in page
+
+
+def test_unreadable_upload_is_marked_failed(static_app, admin, conn, run_jobs):
+    upload(admin, 'BS-001', b'non sono un png')
+    run_jobs()
+    assert conn.execute("SELECT image_status FROM products").fetchone()[0] == 'failed'
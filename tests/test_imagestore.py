@@ -0,0 +1,130 @@
+import io
+import os
+import sqlite3
+
+import pytest
+from PIL import Image
+
+import db
+import images
+import imagestore
+import shared
+
+
+def png_bytes(color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 300), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def add_product(admin, code, data):
+    response = admin.post('/admin/products/add', data={
+        'name': f'Carta {code}', 'code': code, 'price': '1', 'category_id': '',
+        'additional_info': '', 'image': (io.BytesIO(data), 'carta.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+
+def delete_product(admin, conn, code):
+    product_id = conn.execute("SELECT id FROM products WHERE code = ?", (code,)).fetchone()[0]
+    assert admin.post(f'/admin/products/delete/{product_id}').status_code == 302
+
+
+def image_path(conn, code):
+    return conn.execute("SELECT image_path FROM products WHERE code = ?", (code,)).fetchone()[0]
+
+
+def test_identical_uploads_share_one_file(static_app, admin, conn):
+    add_product(admin, 'BS-001', png_bytes())
+    add_product(admin, 'BS-002', png_bytes())
+    add_product(admin, 'BS-003', png_bytes((0, 0, 255)))
+    path = image_path(conn, 'BS-001')
+    assert path.startswith(imagestore.CAS_DIR + '/')
+    assert image_path(conn, 'BS-002') == path
+    assert image_path(conn, 'BS-003') != path
+    stored = [name for _, _, names in os.walk(os.path.join(static_app.static_folder, imagestore.CAS_DIR))
+              for name in names]
+    assert len(stored) == 2
+
+
+def test_file_is_removed_with_its_last_reference(static_app, admin, conn, run_jobs):
+    add_product(admin, 'BS-001', png_bytes())
+    add_product(admin, 'BS-002', png_bytes())
+    run_jobs()
+    path = image_path(conn, 'BS-001')
+    full_path = os.path.join(static_app.static_folder, path)
+    thumb = os.path.join(static_app.static_folder, images.derivative_paths(path)['thumb_webp'])
+
+    delete_product(admin, conn, 'BS-001')
+    run_jobs()
+    assert os.path.exists(full_path) and os.path.exists(thumb)
+
+    delete_product(admin, conn, 'BS-002')
+    run_jobs()
+    assert not os.path.exists(full_path) and not os.path.exists(thumb)
+
+
+def test_release_waits_for_a_pending_reference(static_app, admin, conn, run_jobs):
+    add_product(admin, 'BS-001', png_bytes())
+    path = image_path(conn, 'BS-001')
+    conn.execute("DELETE FROM products")
+    conn.commit()
+
+    # Un'altra carta sta salvando la stessa immagine: la transazione ha il lock di scrittura
+    writer = db.connect(static_app.config['DATABASE'])
+    writer.execute("INSERT INTO products (name, code, price, image_path) VALUES ('B', 'BS-002', 1, ?)", (path,))
+    conn.execute("PRAGMA busy_timeout = 50")
+    with pytest.raises(sqlite3.OperationalError):
+        imagestore.release(conn, static_app.static_folder, path)
+    writer.commit()
+    writer.close()
+    assert not conn.in_transaction
+    assert not imagestore.release(conn, static_app.static_folder, path)
+    assert os.path.exists(os.path.join(static_app.static_folder, path))
+
+
+def test_upload_recreates_file_released_meanwhile(static_app, admin, conn, run_jobs, monkeypatch):
+    add_product(admin, 'BS-001', png_bytes())
+    run_jobs()
+    path = image_path(conn, 'BS-001')
+    conn.execute("DELETE FROM products")
+    conn.commit()
+
+    # Il rilascio dell'ultima carta termina tra store_upload() e l'INSERT
+    # della nuova carta con la stessa immagine
+    store_upload = imagestore.store_upload
+
+    def store_then_release(static_folder, file):
+        result = store_upload(static_folder, file)
+        assert result == (path, False)
+        assert imagestore.release(conn, static_folder, path)
+        monkeypatch.undo()
+        return result
+    monkeypatch.setattr(imagestore, 'store_upload', store_then_release)
+    add_product(admin, 'BS-002', png_bytes())
+
+    assert os.path.exists(os.path.join(static_app.static_folder, path))
+    run_jobs()
+    assert conn.execute("SELECT image_status FROM products").fetchone()[0] == 'ready'
+    assert static_app.extensions['image_variants'](path) is not None
+
+
+def test_lookup_forgets_variants_released_by_another_process(tmp_path):
+    (tmp_path / 'x.png').write_bytes(png_bytes())
+    images.generate_derivatives(str(tmp_path), 'x.png')
+    counter = shared.SharedState().counter('catalog')
+    worker = images.DerivativeLookup(str(tmp_path), counter)
+    assert worker('x.png') is not None
+
+    # Un altro worker rilascia l'immagine e incrementa la versione
+    images.remove_derivatives(str(tmp_path), 'x.png')
+    assert worker('x.png') is not None
+    counter.increment()
+    assert worker('x.png') is None
+
+
+def test_content_addressed_files_are_immutable(static_app, admin, client, conn):
+    add_product(admin, 'BS-001', png_bytes())
+    response = client.get('/static/' + image_path(conn, 'BS-001'))
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == imagestore.IMMUTABLE_CACHE_CONTROL
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import jobqueue
+
+
+def enqueue(conn, kind, **payload):
+    jobqueue.enqueue(conn, kind, **payload)
+    conn.commit()
+
+
+def job_rows(conn):
+    return [dict(row) for row in conn.execute("SELECT kind, payload, status, attempts, last_error FROM jobs")]
+
+
+def test_job_runs_in_app_context(app, conn, run_jobs):
+    seen = []
+    app.extensions['jobs'].register('prova', lambda value: seen.append(value))
+    enqueue(conn, 'prova', value=3)
+    run_jobs()
+    assert seen == [3]
+    assert job_rows(conn)[0]['status'] == 'done'
+
+
+def test_failed_job_is_retried_then_marked_failed(app, conn, run_jobs):
+    failures = []
+
+    def broken():
+        raise ValueError("rotto")
+    app.extensions['jobs'].register('prova', broken, on_failure=lambda: failures.append(True))
+    enqueue(conn, 'prova')
+
+    for attempt in range(1, jobqueue.MAX_ATTEMPTS + 1):
+        run_jobs()
+        row = job_rows(conn)[0]
+        assert row['attempts'] == attempt
+        if attempt < jobqueue.MAX_ATTEMPTS:
+            assert row['status'] == 'pending'
+            # Il nuovo tentativo è rimandato: si anticipa l'orologio
+            assert conn.execute("SELECT run_after FROM jobs").fetchone()[0] > time.time()
+            conn.execute("UPDATE jobs SET run_after = 0")
+            conn.commit()
+    assert row['status'] == 'failed'
+    assert 'rotto' in row['last_error']
+    assert failures == [True]
+
+
+def test_unknown_kind_fails(app, conn, run_jobs):
+    enqueue(conn, 'sconosciuto')
+    run_jobs()
+    assert 'sconosciuto' in job_rows(conn)[0]['last_error']
+
+
+def test_expired_lease_is_claimed_again(app, conn, run_jobs):
+    seen = []
+    app.extensions['jobs'].register('prova', lambda: seen.append(True))
+    # Lavoro prenotato da un processo terminato a metà
+    conn.execute("INSERT INTO jobs (kind, payload, status, attempts, locked_until)"
+                 " VALUES ('prova', '{}', 'running', 1, ?)", (time.time() - 1,))
+    conn.execute("INSERT INTO jobs (kind, payload, status, attempts, locked_until)"
+                 " VALUES ('prova', '{}', 'running', 1, ?)", (time.time() + 60,))
+    conn.commit()
+    run_jobs()
+    assert seen == [True]
+    assert [row['status'] for row in job_rows(conn)] == ['done', 'running']
+
+
+def test_dispatcher_runs_jobs_in_background(app, conn):
+    done = threading.Event()
+    queue = app.extensions['jobs']
+    queue.register('prova', lambda: done.set())
+    queue.start()
+    enqueue(conn, 'prova')
+    with app.app_context():
+        jobqueue.wake()
+    assert done.wait(5)
+    queue.stop()
+    assert job_rows(conn)[0]['status'] == 'done'
+
+
+def test_dispatcher_exits_when_pool_is_shut_down(app, conn):
+    queue = app.extensions['jobs']
+    queue.register('prova', lambda: None)
+    queue.start()
+    # Come all'uscita dell'interprete: il pool si chiude prima del dispatcher
+    queue._executor.shutdown(wait=True)
+    enqueue(conn, 'prova')
+    queue.wake()
+    queue._dispatcher.join(5)
+    assert not queue._dispatcher.is_alive()
+    # Il posto prenotato è stato restituito
+    assert queue._slots._value == queue.workers
+    queue.stop()
+    # Verrà ripreso alla scadenza della prenotazione
+    assert job_rows(conn)[0]['status'] == 'running'
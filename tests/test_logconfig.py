@@ -0,0 +1,62 @@
+import json
+import logging
+
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / 'app.log'
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'test.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'SECRET_KEY': 'chiave-di-prova',
+        'JOBS_ENABLED': False,
+        'LOG_FILE': str(path),
+    })
+
+    def read():
+        # Il listener scrive in un altro thread: si ferma per svuotare la coda
+        app.extensions['log_listener'].stop()
+        return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    read.app = app
+    return read
+
+
+def test_records_are_json_with_request_id_and_redaction(log_file):
+    client = log_file.app.test_client()
+    client.post('/login', data={'username': 'nessuno', 'password': 'segreta'},
+                headers={'X-Request-ID': 'abc-123'})
+    logging.getLogger('prova').info("valori %s", 42, extra={'token': 'xyz', 'info': {'pin': '0000', 'n': 1}})
+
+    entries = log_file()
+    failed = next(entry for entry in entries if entry['message'] == 'login fallito: credenziali errate')
+    assert failed['request_id'] == 'abc-123'
+    assert failed['level'] == 'WARNING'
+    assert failed['username'] == 'nessuno'
+    assert 'segreta' not in json.dumps(entries)
+
+    entry = next(entry for entry in entries if entry['logger'] == 'prova')
+    assert entry['message'] == 'valori 42'
+    assert entry['token'] == '[redacted]'
+    assert entry['info'] == {'pin': '[redacted]', 'n': 1}
+    assert entry['request_id'] is None
+
+
+def test_response_carries_request_id(client):
+    assert client.get('/', headers={'X-Request-ID': 'abc-123'}).headers['X-Request-ID'] == 'abc-123'
+    # Un id con caratteri non ammessi viene sostituito
+    generated = client.get('/', headers={'X-Request-ID': 'a b;c'}).headers['X-Request-ID']
+    assert generated != 'a b;c' and len(generated) == 16
+
+
+def test_exceptions_are_logged_as_text(log_file):
+    try:
+        raise ValueError("rotto")
+    except ValueError:
+        logging.getLogger('prova').exception("errore")
+    entry = next(entry for entry in log_file() if entry['message'] == 'errore')
+    assert 'ValueError: rotto' in entry['exc']
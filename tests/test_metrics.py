@@ -0,0 +1,57 @@
+import os
+import re
+
+import pytest
+from flask import g
+
+import db
+import metrics
+
+
+@pytest.fixture
+def timed_conn(tmp_path):
+    conn = db.connect(str(tmp_path / 'metriche.db'), metrics.TimedConnection)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(100)])
+    yield conn
+    conn.close()
+
+
+def test_fetches_are_timed_but_not_counted_as_statements(app, timed_conn, monkeypatch):
+    ticks = iter(range(1000))
+    monkeypatch.setattr(metrics, 'perf_counter', lambda: next(ticks))
+    with app.test_request_context():
+        cursor = timed_conn.execute("SELECT x FROM t")
+        assert (g.sql_count, g.sql_time) == (1, 1)
+        cursor.fetchone()
+        cursor.fetchmany(10)
+        cursor.fetchall()
+        assert (g.sql_count, g.sql_time) == (1, 4)
+
+        rows = list(timed_conn.execute("SELECT x FROM t LIMIT 3"))
+        assert len(rows) == 3
+        # execute, tre righe e la fine dell'iterazione
+        assert (g.sql_count, g.sql_time) == (2, 9)
+
+
+def test_requests_are_recorded_per_route(client, add_catalog):
+    add_catalog([('Pikachu', 'BS-001', 2)])
+    client.get('/')
+    response = client.get('/api/products')
+    assert re.match(r'db;dur=[\d.]+, app;dur=[\d.]+$', response.headers['Server-Timing'])
+    text = client.get('/metrics').get_data(as_text=True)
+    pid = os.getpid()
+    assert (f'http_request_duration_seconds_count{{endpoint="main.api_products",method="GET",'
+            f'status="200",pid="{pid}"}} 1') in text
+    statements = re.search(rf'db_statements_total{{endpoint="main.api_products",pid="{pid}"}} (\d+)', text)
+    assert int(statements.group(1)) >= 1
+    assert f'template_render_seconds_count{{template="index.html",pid="{pid}"}} 1' in text
+
+
+def test_metrics_are_restricted(client, admin):
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    assert client.get('/metrics', environ_base=remote).status_code == 403
+    assert admin.get('/metrics', environ_base=remote).status_code == 200
+    assert client.get('/metrics').status_code == 200
+    # Inoltrata dal proxy locale: non è un collector sulla stessa macchina
+    assert client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7'}).status_code == 403
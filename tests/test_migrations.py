@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+import db
+import migrations
+from app import init_db
+
+
+def columns(conn, table):
+    return {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def tables(conn):
+    return {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+# Database con lo schema di base e le sole prime due migrazioni
+@pytest.fixture
+def old_conn(tmp_path, monkeypatch):
+    path = str(tmp_path / 'old.db')
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:2])
+    monkeypatch.setattr(migrations, 'LATEST_VERSION', 2)
+    assert init_db(path) == [1, 2]
+    monkeypatch.undo()
+    conn = db.connect(path)
+    yield conn
+    conn.close()
+
+
+def test_new_database_gets_every_migration(app, conn):
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    assert migrations.schema_is_current(conn)
+    # Una seconda esecuzione non applica nulla
+    assert migrations.run_migrations(conn) == []
+    assert init_db(app.config['DATABASE']) == []
+
+
+def test_failed_migration_is_rolled_back_and_can_rerun(old_conn, monkeypatch):
+    number, description, statements = migrations.MIGRATIONS[2]
+    # Errore dopo CREATE TABLE e ALTER TABLE della migrazione 3
+    broken = (number, description, statements + ("INSERT INTO tabella_inesistente VALUES (1)",))
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [*migrations.MIGRATIONS[:2], broken, *migrations.MIGRATIONS[3:]])
+
+    with pytest.raises(sqlite3.OperationalError):
+        migrations.run_migrations(old_conn)
+    assert migrations.current_version(old_conn) == 2
+    assert 'image_status' not in columns(old_conn, 'products')
+    assert 'jobs' not in tables(old_conn)
+
+    monkeypatch.undo()
+    assert migrations.run_migrations(old_conn) == list(range(3, migrations.LATEST_VERSION + 1))
+    assert 'image_status' in columns(old_conn, 'products')
+    assert migrations.schema_is_current(old_conn)
+
+
+def test_migrations_carry_existing_rows(old_conn):
+    old_conn.execute("INSERT INTO categories (name) VALUES ('Base Set')")
+    old_conn.execute("INSERT INTO products (name, code, price, category_id, image_path)"
+                     " VALUES ('Pikachu', 'BS-001', 2.5, 1, 'uploads/a.png'),"
+                     " ('Raichu', 'BS-002', 4, 1, NULL)")
+    old_conn.commit()
+    migrations.run_migrations(old_conn)
+
+    stats = old_conn.execute("SELECT * FROM category_stats WHERE category_id = 1").fetchone()
+    assert (stats['product_count'], stats['price_sum'], stats['price_max']) == (2, 6.5, 4)
+    statuses = dict(old_conn.execute("SELECT code, image_status FROM products").fetchall())
+    assert statuses == {'BS-001': 'pending', 'BS-002': None}
+    assert old_conn.execute("SELECT kind FROM jobs").fetchall()[0]['kind'] == 'derivatives'
+
+
+def test_query_plans_use_indexes(conn):
+    assert migrations.check_query_plans(conn) == []
@@ -0,0 +1,114 @@
+import io
+import time
+
+import app as app_module
+import catalog_import
+import catalog_versions
+import pagecache
+import shared
+
+
+def rename(conn, code, name):
+    # Modifica fatta fuori dalle rotte, come da un altro processo
+    conn.execute("UPDATE products SET name = ? WHERE code = ?", (name, code))
+    conn.commit()
+
+
+def suggestions(client, query):
+    return [item['label'] for item in client.get('/api/suggest', query_string={'q': query}).get_json()['suggestions']]
+
+
+def test_public_page_is_served_from_cache(app, client, add_catalog, monkeypatch):
+    category_id = add_catalog([('Pikachu', 'BS-001', 2)])
+    rendered = []
+
+    def render_template(name, **context):
+        rendered.append(name)
+        return original(name, **context)
+    original = app_module.render_template
+    monkeypatch.setattr(app_module, 'render_template', render_template)
+    first = client.get(f'/category/{category_id}').data
+    assert b'Pikachu' in first
+    assert client.get(f'/category/{category_id}').data == first
+    assert rendered == ['category.html']
+    assert len(app.extensions['page_cache']) == 1
+
+
+def test_writes_from_another_process_invalidate_caches(app, client, add_catalog, conn):
+    category_id = add_catalog([('Pikachu', 'BS-001', 2)])
+    assert b'Pikachu' in client.get(f'/category/{category_id}').data
+    etag = client.get('/api/products').headers['ETag']
+    assert suggestions(client, 'pik') == ['Pikachu']
+
+    # Come import_catalog.py: un'altra connessione, nessun accesso ai contatori dei worker
+    result = catalog_import.import_catalog(conn, io.BytesIO(b'name,code,price,category\nPichu,BS-001,2,Base Set\n'), 'csv')
+    assert result.imported == 1
+    page = client.get(f'/category/{category_id}').data
+    assert b'Pichu' in page and b'Pikachu' not in page
+    assert client.get('/api/products', headers={'If-None-Match': etag}).status_code == 200
+    # L'indice dei suggerimenti si ricostruisce in background
+    deadline = time.monotonic() + 5
+    while suggestions(client, 'pic') != ['Pichu'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert suggestions(client, 'pic') == ['Pichu']
+
+
+def test_sync_bumps_counters_once_per_change(app, conn):
+    state = shared.SharedState()
+    # La prima lettura allinea lo stato alle versioni già nel database
+    catalog_versions.sync(state, conn)
+    catalog = state.counter('catalog').value
+    assert catalog_versions.sync(state, conn) == []
+    conn.execute("INSERT INTO categories (name) VALUES ('Jungle')")
+    conn.commit()
+    assert catalog_versions.sync(state, conn) == ['catalog']
+    # Un altro worker sulla stessa memoria trova la modifica già notata
+    assert catalog_versions.sync(state, conn) == []
+    assert state.counter('catalog').value == catalog + 1
+    rename(conn, 'inesistente', 'x')
+    conn.execute("INSERT INTO products (name, code, price) VALUES ('Mew', 'PR-001', 1)")
+    conn.commit()
+    assert sorted(catalog_versions.sync(state, conn)) == ['catalog', 'suggest']
+
+
+def test_admin_write_invalidates_cache(app, client, admin, add_catalog, conn):
+    category_id = add_catalog([('Pikachu', 'BS-001', 2)])
+    assert b'Pikachu' in client.get(f'/category/{category_id}').data
+    product_id = conn.execute("SELECT id FROM products WHERE code = 'BS-001'").fetchone()['id']
+    response = admin.post(f'/admin/products/edit/{product_id}', data={
+        'name': 'Raichu', 'code': 'BS-001', 'price': '2',
+        'category_id': str(category_id), 'additional_info': '',
+    })
+    assert response.status_code == 302
+    page = client.get(f'/category/{category_id}').data
+    assert b'Raichu' in page and b'Pikachu' not in page
+
+
+def test_version_bumped_by_another_process_invalidates_cache(app, client, add_catalog, conn):
+    category_id = add_catalog([('Pikachu', 'BS-001', 2)])
+    client.get(f'/category/{category_id}')
+    rename(conn, 'BS-001', 'Raichu')
+    # Un altro worker incrementa il contatore condiviso
+    app.extensions['shared_state'].counter('catalog').increment()
+    assert b'Raichu' in client.get(f'/category/{category_id}').data
+
+
+def test_admin_pages_are_not_cached(app, admin, add_catalog, conn):
+    category_id = add_catalog([('Pikachu', 'BS-001', 2)])
+    admin.get(f'/category/{category_id}')
+    rename(conn, 'BS-001', 'Raichu')
+    assert b'Raichu' in admin.get(f'/category/{category_id}').data
+    assert len(app.extensions['page_cache']) == 0
+
+
+def test_cache_keeps_the_most_recent_entries():
+    cache = pagecache.PageCache(shared.SharedState().counter('catalog'), 'epoca', max_entries=2)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, key)
+    assert cache.get('a') is None
+    assert cache.get('b') == 'b'
+    cache.set('d', 'd')
+    # 'b' è stata letta dopo 'c': esce 'c'
+    assert (cache.get('b'), cache.get('c'), cache.get('d')) == ('b', None, 'd')
+    cache.bump_version()
+    assert len(cache) == 0
@@ -0,0 +1,55 @@
+import pagination
+
+
+def walk(client, url, direction):
+    pages = []
+    while url:
+        body = client.get(url).get_json()
+        pages.append([item['code'] for item in body['items']])
+        url = body[direction]
+    return pages
+
+
+def test_cursor_round_trip():
+    token = pagination.encode_cursor(2.5, 7)
+    assert pagination.decode_cursor(token) == (2.5, 7)
+    assert pagination.decode_cursor('non-valido') is None
+    assert pagination.decode_cursor(pagination.encode_cursor(1, 'x')) is None
+
+
+def test_pages_cover_equal_sort_keys_once(client, add_catalog):
+    # Sette carte con tre soli prezzi: i cursori devono distinguere per id
+    prices = [5, 1, 5, 5, 1, 3, 5]
+    add_catalog([(f'Carta {i}', f'C-{i}', price) for i, price in enumerate(prices)])
+    expected = [f'C-{i}' for i in sorted(range(len(prices)), key=lambda i: (prices[i], i))]
+
+    forward = walk(client, '/api/products?sort_by=price_asc&limit=2', 'next')
+    assert [len(page) for page in forward] == [2, 2, 2, 1]
+    assert sum(forward, []) == expected
+
+    descending = walk(client, '/api/products?sort_by=price_desc&limit=3', 'next')
+    assert sum(descending, []) == list(reversed(expected))
+
+
+def test_prev_links_return_the_same_pages(client, add_catalog):
+    add_catalog([(f'Carta {i}', f'C-{i}', 1) for i in range(5)])
+    body = client.get('/api/products?sort_by=price_asc&limit=2').get_json()
+    assert body['prev'] is None
+    forward = [[item['code'] for item in body['items']]]
+    url = body['next']
+    while True:
+        body = client.get(url).get_json()
+        forward.append([item['code'] for item in body['items']])
+        if not body['next']:
+            break
+        url = body['next']
+
+    backward = walk(client, body['prev'], 'prev')
+    assert backward == list(reversed(forward[:-1]))
+
+
+def test_html_pages_link_with_cursor(client, add_catalog):
+    category_id = add_catalog([(f'Carta {i:02d}', f'C-{i:02d}', 1) for i in range(pagination.PAGE_SIZE + 1)])
+    first = client.get(f'/category/{category_id}')
+    assert b'after=' in first.data
+    assert b'before=' not in first.data
@@ -0,0 +1,53 @@
+import fts
+
+
+def search(client, **args):
+    response = client.get('/api/products', query_string=args)
+    assert response.status_code == 200
+    return [item['code'] for item in response.get_json()['items']]
+
+
+def fts_codes(conn, text):
+    rows = conn.execute(
+        "SELECT p.code FROM products_fts JOIN products p ON p.id = products_fts.rowid"
+        " WHERE products_fts MATCH ? ORDER BY p.code", (fts.build_match_query(text),))
+    return [row['code'] for row in rows]
+
+
+def test_build_match_query():
+    assert fts.build_match_query('pika') == '"pika"*'
+    assert fts.build_match_query('BS-01 holo') == '"BS 01"* "holo"*'
+    # Operatori e virgolette di FTS5 non passano nell'espressione
+    assert fts.build_match_query('a" OR b*') == '"a"* "OR"* "b"*'
+    assert fts.build_match_query('  -- ') is None
+
+
+def test_search_by_prefix_code_and_diacritics(client, add_catalog):
+    add_catalog([('Pikachu', 'BS-010', 2), ('Raichu', 'BS-011', 3),
+                 ('Flabébé', 'FL-001', 1), ('Charizard', 'BS-100', 300)])
+    assert search(client, query='pika') == ['BS-010']
+    assert sorted(search(client, query='BS-01')) == ['BS-010', 'BS-011']
+    assert search(client, query='flabebe') == ['FL-001']
+    assert search(client, query='mewtwo') == []
+
+
+def test_relevance_prefers_name_over_additional_info(client, add_catalog, conn):
+    add_catalog([('Energia', 'EN-001', 1), ('Pikachu', 'BS-010', 2)])
+    conn.execute("UPDATE products SET additional_info = 'pikachu promo' WHERE code = 'EN-001'")
+    conn.commit()
+    assert search(client, query='pikachu') == ['BS-010', 'EN-001']
+
+
+def test_triggers_keep_index_in_sync(add_catalog, conn):
+    add_catalog([('Pikachu', 'BS-010', 2), ('Raichu', 'BS-011', 3)])
+    assert fts_codes(conn, 'pikachu') == ['BS-010']
+
+    conn.execute("UPDATE products SET name = 'Pichu' WHERE code = 'BS-010'")
+    assert fts_codes(conn, 'pikachu') == []
+    assert fts_codes(conn, 'pichu') == ['BS-010']
+
+    conn.execute("DELETE FROM products WHERE code = 'BS-011'")
+    assert fts_codes(conn, 'raichu') == []
+    conn.commit()
+    # L'indice coincide con il contenuto di products
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('integrity-check')")
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import serve
+import shared
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Eseguito in un processo nuovo: importa serve, prepara la memoria condivisa
+# e riporta i moduli caricati dalla cartella del sito (oltre a serve) e flask
+IMPORT_CHECK = """
+import os, sys
+sys.path.insert(0, sys.argv[1])
+import serve
+serve.create_shared_memory()
+loaded = [name for name, module in list(sys.modules.items())
+          if name == 'flask' or os.path.dirname(getattr(module, '__file__', None) or '') == sys.argv[1]]
+print(sorted(name for name in loaded if name != 'serve'))
+"""
+
+
+def test_master_does_not_import_site_modules():
+    output = subprocess.run([sys.executable, '-c', IMPORT_CHECK, ROOT],
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
+
+
+def test_workers_share_the_master_memory():
+    memory = serve.create_shared_memory()
+    # Due generazioni di worker costruiscono lo stato sulla stessa memoria
+    old, new = serve._shared_state(memory), serve._shared_state(memory)
+    old.counter('catalog').increment()
+    assert new.counter('catalog').increment() == 2
+    assert new.counter('suggest').value == 0
+    assert old.epoch == new.epoch
+
+
+def test_shared_state_checks_buffer_size():
+    memory = serve.create_shared_memory()
+    with pytest.raises(ValueError):
+        shared.SharedState(names=[f'c{i}' for i in range(serve.SHARED_MEMORY_SIZE // 8 + 1)], buffer=memory[0])
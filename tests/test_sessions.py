@@ -0,0 +1,79 @@
+import os
+
+import sessions
+from conftest import ADMIN_PASSWORD
+
+
+def session_cookie(client, app):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return cookie.value if cookie else None
+
+
+def stored_ids(conn):
+    return {row['id'] for row in conn.execute("SELECT id FROM sessions")}
+
+
+def test_login_regenerates_session_id(app, client, admin_user, conn):
+    # Sessione anonima aperta prima del login
+    with client.session_transaction() as session:
+        session['carrello'] = [1]
+    before = session_cookie(client, app)
+    old_ids = stored_ids(conn)
+    assert before and len(old_ids) == 1
+
+    client.post('/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+    after = session_cookie(client, app)
+    assert after != before
+    # Il vecchio id è stato eliminato dallo store: riusarlo non dà accesso
+    assert not stored_ids(conn) & old_ids
+    assert len(stored_ids(conn)) == 1
+    attacker = app.test_client()
+    attacker.set_cookie(app.config['SESSION_COOKIE_NAME'], before)
+    assert attacker.get('/admin').status_code == 302
+    assert client.get('/admin').status_code == 200
+
+
+def test_logout_regenerates_session_id(app, client, admin_user, conn):
+    client.post('/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+    logged_in = session_cookie(client, app)
+    logged_in_ids = stored_ids(conn)
+    client.get('/logout')
+    assert session_cookie(client, app) != logged_in
+    assert not stored_ids(conn) & logged_in_ids
+    thief = app.test_client()
+    thief.set_cookie(app.config['SESSION_COOKIE_NAME'], logged_in)
+    assert thief.get('/admin').status_code == 302
+
+
+def test_data_is_stored_server_side(app, admin, conn):
+    admin.get('/admin')
+    cookie = session_cookie(admin, app)
+    # Il cookie contiene solo l'id firmato, i dati sono nella tabella
+    assert 'admin' not in cookie
+    sid = cookie.rsplit('.', 1)[0]
+    data, expires_at = conn.execute("SELECT data, expires_at FROM sessions WHERE id = ?", (sid,)).fetchone()
+    assert '"admin"' in data
+    # Un'altra applicazione sullo stesso database vede la stessa sessione
+    other = app.test_client()
+    other.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie)
+    assert other.get('/admin').status_code == 200
+    # Un id con firma alterata viene ignorato
+    other.set_cookie(app.config['SESSION_COOKIE_NAME'], sid + '.firma')
+    assert other.get('/admin').status_code == 302
+
+
+def test_expired_sessions_are_rejected_and_evicted(app, admin, conn):
+    admin.get('/admin')
+    conn.execute("UPDATE sessions SET expires_at = 0")
+    conn.commit()
+    assert admin.get('/admin').status_code == 302
+    # La sessione scaduta è stata eliminata alla lettura
+    assert all(row['expires_at'] > 0 for row in conn.execute("SELECT expires_at FROM sessions"))
+
+
+def test_secret_key_is_created_once(tmp_path):
+    path = tmp_path / 'secret_key'
+    key = sessions.load_secret_key(path)
+    assert len(key) == 64
+    assert sessions.load_secret_key(path) == key
+    assert os.stat(path).st_mode & 0o777 == 0o600
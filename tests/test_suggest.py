@@ -0,0 +1,70 @@
+import time
+
+import shared
+import suggest
+
+
+def labels(client, query, **args):
+    response = client.get('/api/suggest', query_string={'q': query, **args})
+    assert response.status_code == 200
+    return [item['label'] for item in response.get_json()['suggestions']]
+
+
+def test_ranking_names_codes_and_inner_words(client, add_catalog):
+    add_catalog([('Pikachu', 'PI-001', 1), ('Pikachu', 'PI-002', 1), ('Pichu', 'PC-001', 1),
+                 ('Raichu VMAX', 'VM-001', 1), ('Vmax Energy', 'EN-001', 1)])
+    # Nomi che iniziano con il testo (i più numerosi prima), poi i codici
+    assert labels(client, 'pi') == ['Pikachu', 'Pichu', 'PI-001', 'PI-002']
+    # Un nome che inizia con il testo precede quelli in cui è una parola successiva
+    assert labels(client, 'vmax') == ['Vmax Energy', 'Raichu VMAX']
+    assert labels(client, 'PIKA') == ['Pikachu']
+    assert labels(client, 'pi', limit='2') == ['Pikachu', 'Pichu']
+    assert labels(client, '   ') == []
+
+
+def test_accents_are_ignored(client, add_catalog):
+    add_catalog([('Flabébé', 'FL-001', 1)])
+    assert labels(client, 'flabe') == ['Flabébé']
+
+
+def test_index_follows_admin_changes(client, admin, add_catalog, conn):
+    add_catalog([('Pikachu', 'PI-001', 1)])
+    assert labels(client, 'pik') == ['Pikachu']
+    product_id = conn.execute("SELECT id FROM products").fetchone()[0]
+    admin.post(f'/admin/products/edit/{product_id}', data={
+        'name': 'Pichu', 'code': 'PI-001', 'price': '1', 'category_id': '', 'additional_info': ''})
+    assert labels(client, 'pik') == []
+    assert labels(client, 'pic') == ['Pichu']
+    admin.post(f'/admin/products/delete/{product_id}')
+    assert labels(client, 'pi') == []
+
+
+def test_other_process_changes_trigger_rebuild(app, add_catalog, conn):
+    add_catalog([('Pikachu', 'PI-001', 1)])
+    state = shared.SharedState()
+    index = suggest.SuggestIndex(state.counter('suggest'), app.config['DATABASE'])
+    other = suggest.SuggestIndex(state.counter('suggest'), app.config['DATABASE'])
+    connect = lambda: conn  # noqa: E731
+    index.ensure_loaded(connect)
+    other.ensure_loaded(connect)
+
+    # Un altro worker aggiunge una carta: questo indice se ne accorge dal contatore
+    conn.execute("INSERT INTO products (name, code, price) VALUES ('Pichu', 'PC-001', 1)")
+    conn.commit()
+    other.add(2, 'Pichu', 'PC-001')
+    assert [s['label'] for s in other.suggest('pic')] == ['Pichu']
+    index.ensure_loaded(connect)
+    deadline = time.monotonic() + 5
+    while not index.suggest('pic') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [s['label'] for s in index.suggest('pic')] == ['Pichu']
+
+
+def test_sorted_prefix_list():
+    items = suggest.SortedPrefixList([('pikachu', 1), ('pichu', 2), ('raichu', 3)])
+    assert list(items.scan('pi', 10)) == [('pichu', 2), ('pikachu', 1)]
+    assert list(items.scan('pi', 1)) == [('pichu', 2)]
+    items.add('pidgey', 4)
+    assert items.remove('pichu', 2)
+    assert not items.remove('pichu', 2)
+    assert [key for key, _ in items.scan('pi', 10)] == ['pidgey', 'pikachu']
@@ -0,0 +1,18 @@
+# Utenti dell'amministrazione: password salvate come hash bcrypt
+import bcrypt
+
+
+def hash_password(password):
+    # Salvata come stringa per evitare problemi di compatibilità con SQLite
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode('utf-8')
+
+
+# Crea l'utente o ne sostituisce la password, senza fare commit.
+# Restituisce True se l'utente è stato creato.
+def set_password(conn, username, password):
+    hashed = hash_password(password)
+    cursor = conn.execute("UPDATE users SET password = ? WHERE username = ?", (hashed, username))
+    if cursor.rowcount:
+        return False
+    conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed))
+    return True